@@ -6,13 +6,17 @@ import sys
 import os.path
 import threading
 import signal
-import pygtk
-import gtk
-import gtk.glade
-import gnome
-import piedit.ui
 import piedit.interpreter
-pygtk.require("2.0")
+try:
+    import pygtk
+    pygtk.require("2.0")
+    import gtk
+    import gtk.glade
+    import gnome
+    import piedit.ui
+except ImportError:
+    #Commands like batch still work without the GUI libraries
+    gtk = None
 
 __author__ = "Steven Anderson"
 __copyright__ = "Steven Anderson 2008"
@@ -41,7 +45,28 @@ def key_interrupt(num,frame):
     print "Termieffnated"
     raise SystemExit
 
+def run_command(name,args):
+    """Runs one of the command line tools. Returns the exit status."""
+    import piedit.batch
+    if name == "batch":
+        return piedit.batch.main(args)
+    elif name == "inputs":
+        return piedit.batch.inputs_main(args)
+    elif name == "serve":
+        import piedit.server
+        return piedit.server.main(args)
+    elif name == "export":
+        import piedit.export
+        return piedit.export.main(args)
+
+#Command line tools, run as piedit.py <command> [<args>]
+commands = ("batch","inputs","serve","export")
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        sys.exit(run_command(sys.argv[1],sys.argv[2:]))
+    if gtk == None:
+        raise SystemExit("Piedit needs pygtk and gnome-python to run the editor")
     signal.signal(signal.SIGINT,key_interrupt)
     program = Program()
     gtk.gdk.threads_init()
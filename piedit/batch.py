@@ -0,0 +1,354 @@
+"""Module for running piet programs in bulk. run_batch runs many programs,
+each in its own process so a crash or hang only loses that program.
+run_inputs runs one program against many inputs, loading it only once.
+Programs that never read input give the same result every time, so those
+results are cached and reused."""
+
+import sys
+import os
+import time
+import getopt
+import select
+import hashlib
+import multiprocessing
+import json
+import piedit.interpreter
+import piedit.outputsink
+import piedit.inputsource
+import piedit.cache
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+image_extensions = (".png",".gif",".bmp",".ppm",".jpg",".jpeg")
+
+#Seconds past its time limit that a job's process is killed if the
+#interpreter hasn't stopped it by itself
+kill_grace = 1.0
+
+
+def find_jobs(path,defaults):
+    """Returns the list of jobs for a directory of images, or for a manifest
+    file with one JSON object per line. Manifest entries need a path, which
+    is relative to the manifest, and may set input, max_steps, time_limit,
+    cpu_limit and stack_limit; anything they leave out comes from defaults."""
+    jobs = []
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            if os.path.splitext(filename)[1].lower() in image_extensions:
+                job = dict(defaults)
+                job["path"] = os.path.join(path,filename)
+                jobs.append(job)
+    else:
+        base = os.path.dirname(path)
+        for line in open(path):
+            if line.strip():
+                job = dict(defaults)
+                job.update(json.loads(line))
+                job["path"] = os.path.join(base,job["path"])
+                jobs.append(job)
+    for index,job in enumerate(jobs):
+        job["index"] = index
+    return jobs
+
+def run_job(job):
+    """Runs a single job in this process and returns its result."""
+    result = {"index":job["index"], "path":job["path"]}
+    output = piedit.outputsink.MemoryOutput()
+    interpreter = piedit.interpreter.Interpreter(
+        max_steps=job.get("max_steps",1000000),
+        output=output,
+        input=piedit.inputsource.StringInput(job.get("input","")))
+    interpreter.time_limit = job.get("time_limit")
+    interpreter.cpu_limit = job.get("cpu_limit")
+    interpreter.stack_limit = job.get("stack_limit")
+    start_time = time.time()
+    try:
+        interpreter.load_program(job["path"])
+        load_time = time.time()
+        result["load_time"] = load_time-start_time
+        interpreter.start_execution()
+        result["run_time"] = time.time()-load_time
+        result["exit_reason"] = interpreter.exit_reason
+    except Exception, e:
+        result["exit_reason"] = "ERROR"
+        result["error"] = "%s: %s" % (e.__class__.__name__,e)
+    result["steps"] = interpreter.current_step
+    result["input_read"] = interpreter.input_read
+    #Output characters are all below 256, so this keeps them as they are
+    result["output"] = output.getvalue().decode("latin-1")
+    return result
+
+def run_job_child(job,conn):
+    """Runs a job in a child process and sends the result back."""
+    conn.send(run_job(job))
+    conn.close()
+
+def file_hash(path,block_size=65536):
+    """Returns the hash of an image file's bytes, or None if it can't be
+    read. The image isn't decoded, so only the job's own process does that,
+    and copies of the same file share results."""
+    digest = hashlib.sha1()
+    try:
+        file = open(path,"rb")
+        try:
+            block = file.read(block_size)
+            while block:
+                digest.update(block)
+                block = file.read(block_size)
+        finally:
+            file.close()
+    except (IOError,OSError):
+        return None
+    return digest.hexdigest()
+
+def cacheable(job):
+    """Tells us whether a job's result can come from, and go in, the result
+    cache. Jobs with a time or cpu limit can end differently each run."""
+    return job.get("time_limit") == None and job.get("cpu_limit") == None
+
+def run_batch(jobs,processes=None,callback=None,result_cache=None):
+    """Runs the jobs, at most the given number at a time, and calls the
+    callback with each result as it comes in. Jobs are stopped by the
+    interpreter at their time_limit, and killed if they are still running a
+    little after it. Jobs for programs that read no input are answered
+    from the result cache if one is given. Returns the results in job
+    order."""
+    if processes == None:
+        processes = multiprocessing.cpu_count()
+    pending = list(reversed(jobs))
+    #Indexed by the fileno of the connection to the child
+    running = {}
+    results = [None for job in jobs]
+    #Indexed by job index
+    hashes = {}
+    while pending or running:
+        while pending and len(running) < processes:
+            job = pending.pop()
+            if result_cache != None and cacheable(job):
+                hashes[job["index"]] = file_hash(job["path"])
+                result = result_cache.lookup(hashes[job["index"]],job.get("max_steps",1000000),job.get("stack_limit"))
+                if result != None:
+                    result["index"] = job["index"]
+                    result["path"] = job["path"]
+                    results[job["index"]] = result
+                    if callback != None:
+                        callback(result)
+                    continue
+            parent_conn,child_conn = multiprocessing.Pipe(False)
+            process = multiprocessing.Process(target=run_job_child,args=(job,child_conn))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            if job.get("time_limit") != None:
+                deadline = time.time()+job["time_limit"]+kill_grace
+            else:
+                deadline = None
+            running[parent_conn.fileno()] = (parent_conn,process,job,deadline)
+        if not running:
+            continue
+
+        deadlines = [deadline for conn,process,job,deadline in running.values() if deadline != None]
+        if deadlines:
+            timeout = max(0,min(deadlines)-time.time())
+        else:
+            timeout = None
+        ready,w,x = select.select(running.keys(),[],[],timeout)
+
+        finished = []
+        for fileno in ready:
+            conn,process,job,deadline = running[fileno]
+            try:
+                result = conn.recv()
+            except EOFError:
+                result = {"index":job["index"], "path":job["path"], "exit_reason":"CRASHED"}
+            finished.append((fileno,result))
+        now = time.time()
+        for fileno,(conn,process,job,deadline) in running.items():
+            if fileno not in ready and deadline != None and now >= deadline:
+                process.terminate()
+                finished.append((fileno,{"index":job["index"], "path":job["path"], "exit_reason":"TIME_LIMIT"}))
+
+        for fileno,result in finished:
+            conn,process,job,deadline = running.pop(fileno)
+            conn.close()
+            process.join()
+            results[result["index"]] = result
+            if result_cache != None and hashes.get(job["index"]) != None:
+                result_cache.store(hashes[job["index"]],job.get("max_steps",1000000),result,job.get("stack_limit"))
+            if callback != None:
+                callback(result)
+    return results
+
+#The program run by run_inputs. Forked workers get a copy-on-write copy of
+#it, already loaded and scanned.
+shared_interpreter = None
+
+def run_input(job):
+    """Runs the shared program against one (index, input) pair in this
+    process and returns its result."""
+    index,text = job
+    result = {"index":index}
+    output = piedit.outputsink.MemoryOutput()
+    interpreter = shared_interpreter
+    interpreter.reset(output,piedit.inputsource.StringInput(text))
+    start_time = time.time()
+    try:
+        interpreter.start_execution()
+        result["exit_reason"] = interpreter.exit_reason
+    except Exception, e:
+        result["exit_reason"] = "ERROR"
+        result["error"] = "%s: %s" % (e.__class__.__name__,e)
+    result["run_time"] = time.time()-start_time
+    result["steps"] = interpreter.current_step
+    result["input_read"] = interpreter.input_read
+    result["output"] = output.getvalue().decode("latin-1")
+    return result
+
+def run_inputs(path,inputs,max_steps=1000000,processes=None,use_cache=True):
+    """Generator that loads the program at the path once, runs it against
+    each of the inputs on forked workers that share the loaded program, and
+    yields the results in input order. If use_cache is set the first input
+    is run on its own, and if the program doesn't read it, its result is
+    reused for all the others."""
+    global shared_interpreter
+    shared_interpreter = piedit.interpreter.Interpreter(
+        max_steps=max_steps,
+        output=piedit.outputsink.MemoryOutput(),
+        input=piedit.inputsource.StringInput(""))
+    shared_interpreter.load_program(path)
+    jobs = enumerate(inputs)
+    if use_cache:
+        for job in jobs:
+            first = run_input(job)
+            yield first
+            break
+        else:
+            return
+        if not first["input_read"] and first["exit_reason"] in piedit.cache.deterministic_exits:
+            for index,text in jobs:
+                result = dict(first)
+                result["index"] = index
+                result["cached"] = True
+                del result["run_time"]
+                yield result
+            return
+    if processes == 1:
+        for job in jobs:
+            yield run_input(job)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap(run_input,jobs,16):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+def read_inputs(path):
+    """Generator that yields the inputs in a file with one JSON string, or
+    object with an input, per line."""
+    for line in open(path):
+        if line.strip():
+            value = json.loads(line)
+            if isinstance(value,dict):
+                value = value.get("input","")
+            yield value.encode("latin-1")
+
+def print_usage():
+    """Prints usage string for command line."""
+    print "Usage: piedit.py batch [<options>] <directory or manifest>"
+    print "options:"
+    print "\t-h (--help)\t- Prints this help"
+    print "\t-j (--jobs)\t- Number of programs to run at once. This is the number of cores by default."
+    print "\t-m (--maxsteps)\t- Default maximum steps for each program. This is 10^6 by default. Set to -1 for infinite."
+    print "\t-t (--timelimit)\t- Default wall clock limit in seconds for each program."
+    print "\t-c (--cpulimit)\t- Default cpu time limit in seconds for each program."
+    print "\t-s (--stacklimit)\t- Default limit on the stack size of each program."
+    print "\t-i (--input)\t- Default input for each program."
+    print "\t--nocache\t- Always run programs, even if they read no input."
+
+def write_result(result):
+    """Writes a result to stdout as a line of JSON."""
+    sys.stdout.write(json.dumps(result)+"\n")
+    sys.stdout.flush()
+
+def main(args):
+    """Runs the batch command line. Returns the exit status."""
+    try:
+        opts,args = getopt.getopt(args, "hj:m:t:c:s:i:",
+            ["help","jobs=","maxsteps=","timelimit=","cpulimit=","stacklimit=","input=","nocache"])
+    except getopt.GetoptError, err:
+        print str(err)
+        print_usage()
+        return 2
+    defaults = {}
+    processes = None
+    result_cache = piedit.cache.ResultCache()
+    for o,a in opts:
+        if o in ["-h","--help"]:
+            print_usage()
+            return 1
+        elif o in ["-j","--jobs"]:
+            processes = int(a)
+        elif o in ["-m","--maxsteps"]:
+            defaults["max_steps"] = int(a)
+        elif o in ["-t","--timelimit"]:
+            defaults["time_limit"] = float(a)
+        elif o in ["-c","--cpulimit"]:
+            defaults["cpu_limit"] = float(a)
+        elif o in ["-s","--stacklimit"]:
+            defaults["stack_limit"] = int(a)
+        elif o in ["-i","--input"]:
+            defaults["input"] = a
+        elif o == "--nocache":
+            result_cache = None
+    if len(args) != 1:
+        print_usage()
+        return 2
+    run_batch(find_jobs(args[0],defaults),processes,write_result,result_cache)
+    return 0
+
+def print_inputs_usage():
+    """Prints usage string for the inputs command line."""
+    print "Usage: piedit.py inputs [<options>] <filename> <inputs>"
+    print "Runs a program against every input in a file with one JSON string per line."
+    print "options:"
+    print "\t-h (--help)\t- Prints this help"
+    print "\t-j (--jobs)\t- Number of worker processes. This is the number of cores by default."
+    print "\t-m (--maxsteps)\t- Maximum steps for each run. This is 10^6 by default. Set to -1 for infinite."
+    print "\t--nocache\t- Run every input, even if the program reads no input."
+
+def inputs_main(args):
+    """Runs the inputs command line. Returns the exit status."""
+    try:
+        opts,args = getopt.getopt(args, "hj:m:", ["help","jobs=","maxsteps=","nocache"])
+    except getopt.GetoptError, err:
+        print str(err)
+        print_inputs_usage()
+        return 2
+    processes = None
+    max_steps = 1000000
+    use_cache = True
+    for o,a in opts:
+        if o in ["-h","--help"]:
+            print_inputs_usage()
+            return 1
+        elif o in ["-j","--jobs"]:
+            processes = int(a)
+        elif o in ["-m","--maxsteps"]:
+            max_steps = int(a)
+        elif o == "--nocache":
+            use_cache = False
+    if len(args) != 2:
+        print_inputs_usage()
+        return 2
+    for result in run_inputs(args[0],read_inputs(args[1]),max_steps,processes,use_cache):
+        write_result(result)
+    return 0
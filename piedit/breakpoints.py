@@ -0,0 +1,207 @@
+"""Module for breakpoints on codels, operations, steps and the stack. They are
+only checked where they can be hit: operations and codels with breakpoints
+get their own checks, and nothing else pays for them."""
+
+import operator
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Indexed by the comparison as written
+comparisons = {
+    "<":operator.lt,
+    "<=":operator.le,
+    "==":operator.eq,
+    "!=":operator.ne,
+    ">=":operator.ge,
+    ">":operator.gt,
+}
+
+
+class StackCondition:
+    """Class for a condition on the depth or top item of the stack."""
+    def __init__(self,subject,comparison,value):
+        """Initializes new StackCondition."""
+        if subject not in ("depth","top"):
+            raise ValueError, "UNKNOWN_STACK_SUBJECT"
+        if comparison not in comparisons:
+            raise ValueError, "UNKNOWN_COMPARISON"
+        self.subject = subject
+        self.comparison = comparison
+        self.compare = comparisons[comparison]
+        self.value = value
+
+    def holds(self,stack):
+        """Tells us whether the condition holds for the stack."""
+        if self.subject == "depth":
+            return self.compare(len(stack),self.value)
+        elif stack:
+            return self.compare(stack[-1],self.value)
+        return False
+
+    def __str__(self):
+        """Returns the condition as it is written."""
+        return "stack %s %s %d" % (self.subject,self.comparison,self.value)
+
+
+class Breakpoints:
+    """Class for a set of breakpoints. Once attached to an interpreter a
+    breakpoint being hit finishes execution with the BREAKPOINT exit reason,
+    and resume lets it carry on. Step breakpoints aren't hit by themselves;
+    runs should stop at next_step."""
+    def __init__(self):
+        """Initializes new Breakpoints."""
+        #(x,y) of codels. A colored codel stands for its whole block.
+        self.codels = set()
+        #Operation names
+        self.ops = set()
+        self.steps = set()
+        self.conditions = []
+        self.interpreter = None
+        #What was hit, for showing to the user
+        self.hit_reason = None
+        #Filled in by install
+        self.blocks = set()
+        self.white_codels = set()
+        self.saved_operations = None
+
+    def add(self,text):
+        """Adds a breakpoint written as "codel <x> <y>", "op <name>",
+        "step <n>" or "stack <depth|top> <comparison> <n>"."""
+        words = text.split()
+        try:
+            if words[0] == "codel" and len(words) == 3:
+                self.codels.add((int(words[1]),int(words[2])))
+            elif words[0] == "op" and len(words) == 2:
+                self.ops.add(words[1])
+            elif words[0] == "step" and len(words) == 2:
+                self.steps.add(int(words[1]))
+            elif words[0] == "stack" and len(words) == 4:
+                self.conditions.append(StackCondition(words[1],words[2],int(words[3])))
+            else:
+                raise ValueError, "BAD_BREAKPOINT"
+        except IndexError:
+            raise ValueError, "BAD_BREAKPOINT"
+        self.install()
+
+    def toggle_codel(self,x,y):
+        """Adds a breakpoint on a codel, or removes it if there is one."""
+        if (x,y) in self.codels:
+            self.codels.remove((x,y))
+        else:
+            self.codels.add((x,y))
+        self.install()
+
+    def clear(self):
+        """Removes all the breakpoints."""
+        self.codels.clear()
+        self.ops.clear()
+        self.steps.clear()
+        self.conditions = []
+        self.hit_reason = None
+        self.install()
+
+    def next_step(self,current_step):
+        """Returns the next step with a breakpoint after the given one, or
+        None."""
+        later = [step for step in self.steps if step > current_step]
+        if later:
+            return min(later)
+        return None
+
+    def attach(self,interpreter):
+        """Starts checking the breakpoints on an interpreter with its program
+        loaded. The checks are taken out of any interpreter they were in
+        before."""
+        if self.interpreter != None and self.interpreter is not interpreter:
+            self.uninstall()
+            self.interpreter.breakpoints = None
+        self.interpreter = interpreter
+        interpreter.breakpoints = self
+        self.install()
+
+    def install(self):
+        """Puts checks for the current breakpoints into the interpreter."""
+        interpreter = self.interpreter
+        if interpreter == None:
+            return
+        self.uninstall()
+        self.blocks = set()
+        self.white_codels = set()
+        for x,y in self.codels:
+            if x < interpreter.width and y < interpreter.height:
+                pixel = interpreter.pixels[x][y]
+                if pixel.set_label != -1:
+                    self.blocks.add(pixel.set_label)
+                else:
+                    self.white_codels.add((x,y))
+
+        if self.ops:
+            self.saved_operations = dict(interpreter.operations)
+            for key,(op_name,op) in interpreter.operations.items():
+                if op_name in self.ops:
+                    interpreter.operations[key] = (op_name,self.breaking_op(op_name,op))
+        if self.blocks or self.white_codels:
+            move_out_of_block = interpreter.move_out_of_block
+            def breaking_move_out_of_block():
+                move_out_of_block()
+                pixel = interpreter.current_pixel
+                if pixel.set_label in self.blocks\
+                    or (pixel.x,pixel.y) in self.white_codels:
+                        self.hit("codel (%d,%d)" % (pixel.x,pixel.y))
+            interpreter.move_out_of_block = breaking_move_out_of_block
+        if self.conditions:
+            do_next_step = interpreter.do_next_step
+            def breaking_do_next_step(end_step=None):
+                do_next_step(end_step)
+                for condition in self.conditions:
+                    if condition.holds(interpreter.stack):
+                        self.hit(str(condition))
+                        break
+            interpreter.do_next_step = breaking_do_next_step
+        #Recompile superinstructions without breakpoints inside them
+        interpreter.superinstructions = {}
+
+    def uninstall(self):
+        """Takes the checks out of the interpreter."""
+        interpreter = self.interpreter
+        if interpreter == None:
+            return
+        if self.saved_operations != None:
+            interpreter.operations.update(self.saved_operations)
+            self.saved_operations = None
+        for name in ("move_out_of_block","do_next_step"):
+            if name in interpreter.__dict__:
+                delattr(interpreter,name)
+
+    def breaking_op(self,op_name,op):
+        """Returns an operation that hits a breakpoint once it is done."""
+        def breaking():
+            op()
+            self.hit("op %s" % op_name)
+        return breaking
+
+    def stops_fusion(self,op_name,pixel):
+        """Tells us whether an operation into the given pixel has to be
+        done on its own, so its breakpoint can be hit."""
+        return op_name in self.ops or pixel.set_label in self.blocks\
+            or bool(self.conditions)
+
+    def hit(self,reason):
+        """Stops the interpreter at a breakpoint."""
+        self.interpreter.finished = True
+        self.interpreter.exit_reason = "BREAKPOINT"
+        self.hit_reason = reason
+
+    def resume(self):
+        """Lets the interpreter carry on after hitting a breakpoint."""
+        if self.interpreter != None and self.interpreter.exit_reason == "BREAKPOINT":
+            self.interpreter.finished = False
+            self.interpreter.exit_reason = None
+            self.hit_reason = None
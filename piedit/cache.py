@@ -0,0 +1,88 @@
+"""Module for small least-recently-used caches"""
+
+import threading
+import collections
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Exit reasons that only depend on the program and the step and stack limits
+deterministic_exits = ("FINISHED","MAX_STEPS","NON_TERMINATING","STACK_LIMIT")
+
+
+class LRUCache:
+    """Class that keeps up to max_entries values, dropping the least recently
+    used when it is full. Safe to share between threads."""
+    def __init__(self,max_entries=64):
+        """Initializes new LRUCache."""
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self,key,default=None):
+        """Returns the value for the key, marking it as recently used."""
+        self.lock.acquire()
+        try:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                return default
+            self.entries[key] = value
+            return value
+        finally:
+            self.lock.release()
+
+    def put(self,key,value):
+        """Stores a value, dropping the least recently used if full."""
+        self.lock.acquire()
+        try:
+            self.entries.pop(key,None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        finally:
+            self.lock.release()
+
+    def __contains__(self,key):
+        """Tells us whether the key is in the cache, without using it."""
+        return key in self.entries
+
+    def __len__(self):
+        """Returns the number of entries."""
+        return len(self.entries)
+
+
+class ResultCache(LRUCache):
+    """Class that keeps the results of runs that never read input. These are
+    the same every time the program is run with the same step and stack
+    limits, whatever input it is given. Runs with time limits can end
+    differently each time, so they shouldn't be looked up or stored."""
+    def __init__(self,max_entries=256,max_output=1048576):
+        """Initializes new ResultCache."""
+        LRUCache.__init__(self,max_entries)
+        self.max_output = max_output
+
+    def lookup(self,program_hash,max_steps,stack_limit=None):
+        """Returns a copy of the result for the program and limits, or None
+        if it isn't cached."""
+        result = self.get((program_hash,max_steps,stack_limit))
+        if result != None:
+            result = dict(result)
+            result["cached"] = True
+        return result
+
+    def store(self,program_hash,max_steps,result,stack_limit=None):
+        """Keeps a result if it can be reused, i.e. the run read no input,
+        ended by itself or at the step limit, and its output isn't too big."""
+        if result.get("input_read",True)\
+            or result.get("exit_reason") not in deterministic_exits\
+            or len(result.get("output","")) > self.max_output:
+                return
+        self.put((program_hash,max_steps,stack_limit),
+            dict((k,result[k]) for k in ("exit_reason","steps","output","input_read")))
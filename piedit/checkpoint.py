@@ -0,0 +1,125 @@
+"""Module for saving an interpreter's execution state part way through a run
+and carrying on from it later, e.g. after the step limit or a restart."""
+
+import os
+import threading
+import cPickle
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+version = 1
+
+
+def save_state(interpreter):
+    """Returns the execution state of an interpreter as a dict. The stack is
+    copied, so the interpreter can carry on while the state is written."""
+    return {
+        "version":version,
+        "program":interpreter.program_hash(),
+        "position":(interpreter.current_pixel.x,interpreter.current_pixel.y),
+        "dp":interpreter.dp,
+        "cc":interpreter.cc,
+        "switch_cc":interpreter.switch_cc,
+        "step":interpreter.step,
+        "times_stopped":interpreter.times_stopped,
+        "current_step":interpreter.current_step,
+        "stack":list(interpreter.stack),
+        "input_offset":interpreter.input.offset,
+        "input_read":interpreter.input_read,
+        "output_offset":interpreter.output.tell(),
+    }
+
+def restore_state(interpreter,state):
+    """Puts a saved execution state back into an interpreter that has the
+    same program loaded. Input the program had already read is skipped, so
+    it should be given the same input as the run that was saved. A state
+    already at or past the interpreter's maximum steps finishes it with
+    MAX_STEPS straight away."""
+    if state.get("version") != version:
+        raise ValueError, "UNKNOWN_CHECKPOINT_VERSION"
+    if state["program"] != interpreter.program_hash():
+        raise ValueError, "CHECKPOINT_PROGRAM_MISMATCH"
+    interpreter.reset()
+    x,y = state["position"]
+    interpreter.current_pixel = interpreter.pixels[x][y]
+    interpreter.dp = state["dp"]
+    interpreter.cc = state["cc"]
+    interpreter.switch_cc = state["switch_cc"]
+    interpreter.step = state["step"]
+    interpreter.times_stopped = state["times_stopped"]
+    interpreter.current_step = state["current_step"]
+    interpreter.stack = state["stack"]
+    interpreter.input_read = state["input_read"]
+    interpreter.input.skip(state["input_offset"]-interpreter.input.offset)
+    interpreter.output.written = state["output_offset"]
+    if interpreter.max_steps != -1 and interpreter.current_step >= interpreter.max_steps:
+        interpreter.finished = True
+        interpreter.exit_reason = "MAX_STEPS"
+
+def write_state(state,path):
+    """Writes a saved state to a file. The file is replaced all at once, so
+    a run killed while writing leaves the last checkpoint as it was."""
+    temp_path = path+".tmp"
+    file = open(temp_path,"wb")
+    try:
+        cPickle.dump(state,file,2)
+    finally:
+        file.close()
+    os.rename(temp_path,path)
+
+def load_checkpoint(path):
+    """Reads a saved state from a file."""
+    file = open(path,"rb")
+    try:
+        return cPickle.load(file)
+    finally:
+        file.close()
+
+
+class CheckpointWriter:
+    """Class that writes checkpoints of a running interpreter to a file. The
+    run only pauses to copy the state; it is written in another thread."""
+    def __init__(self,path):
+        """Initializes new CheckpointWriter."""
+        self.path = path
+        self.thread = None
+        #The last error from writing a checkpoint, raised by the next save
+        #or by close
+        self.error = None
+
+    def save(self,interpreter):
+        """Takes a checkpoint of the interpreter and starts writing it. Waits
+        for the last checkpoint to be written first."""
+        state = save_state(interpreter)
+        self.wait()
+        self.thread = threading.Thread(target=self.write,args=(state,))
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def write(self,state):
+        """Writes a checkpoint, keeping any error for the run's thread."""
+        try:
+            write_state(state,self.path)
+        except (IOError,OSError), e:
+            self.error = e
+
+    def wait(self):
+        """Waits for the checkpoint being written, if there is one."""
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+        if self.error != None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def close(self):
+        """Waits for the last checkpoint to be written."""
+        self.wait()
@@ -0,0 +1,27 @@
+"""Module for writing debug output from the piet interpreter"""
+import sys
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+class Debug:
+    """Class that writes debug output when debugging is turned on. Callers
+    on hot paths should test DEBUG themselves before building any args."""
+    def __init__(self,DEBUG=False):
+        """Initializes new Debug."""
+        self.DEBUG = DEBUG
+
+    def writeln(self,message="",*args):
+        """Writes a line of debug output. The message is only formatted with
+        the given args when debugging is on."""
+        if self.DEBUG:
+            if args:
+                message = message % args
+            sys.stdout.write(message+"\n")
@@ -0,0 +1,262 @@
+"""Module for stepping a piet program backwards as well as forwards. Each step
+is logged as the little that is needed to undo it, and the whole state is
+snapshotted every so often, so any recorded step can be gone back to
+quickly. Both are kept in ring buffers so memory stays bounded."""
+
+import collections
+import inputsource
+import outputsink
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+def touched_from(stack,op_name):
+    """Returns the index of the lowest stack item the operation could change.
+    Roll changes as deep as its depth, or the whole stack for a negative
+    roll, and everything else only the top two items."""
+    if op_name == "Roll" and len(stack) >= 2:
+        if stack[-1] < 0:
+            return 0
+        return max(0,len(stack)-2-max(stack[-2],0))
+    return max(0,len(stack)-2)
+
+
+class RecordedInput(inputsource.InputSource):
+    """Source that keeps everything read from another source, so it can be
+    rewound and read again."""
+    def __init__(self,source):
+        """Initializes new RecordedInput."""
+        inputsource.InputSource.__init__(self)
+        self.source = source
+
+    def read_block(self):
+        """Takes whatever the other source has ready."""
+        if self.source.peek_char() == None:
+            return ""
+        data = self.source.buffer[self.source.position:]
+        self.source.offset = self.source.offset + len(data)
+        self.source.position = len(self.source.buffer)
+        return data
+
+    def fill(self):
+        """Reads more input, keeping what has been read already."""
+        if self.eof:
+            return False
+        data = self.read_block()
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer+data
+        return True
+
+    def rewind(self,offset):
+        """Goes back to the given number of characters read."""
+        self.position = offset
+        self.offset = offset
+
+
+class DeltaLog:
+    """Class that steps an interpreter forwards and backwards. Keeps undo
+    records for the last max_deltas steps and a snapshot every
+    snapshot_every steps for the last max_snapshots of them. Steps that
+    have been done before are done again without output."""
+    def __init__(self,interpreter,max_deltas=100000,snapshot_every=10000,max_snapshots=100):
+        """Initializes new DeltaLog and attaches it to the interpreter, which
+        should have its program loaded."""
+        self.interpreter = interpreter
+        self.deltas = collections.deque(maxlen=max_deltas)
+        self.snapshot_every = snapshot_every
+        #(step, state) pairs, oldest first
+        self.snapshots = collections.deque(maxlen=max_snapshots)
+        #Furthest step run so far. Deltas are kept for the steps just before it.
+        self.furthest_step = interpreter.current_step
+        self.null_output = outputsink.NullOutput()
+        #(index, old items) of the stack touched by the last operation
+        self.touched = None
+        #(step, exit reason) once the program has finished
+        self.finish = None
+        #Whether run_on fuses operations, as the interpreter did before.
+        #Stepping runs every operation on its own.
+        self.optimize = interpreter.optimize
+        interpreter.optimize = False
+        interpreter.input = RecordedInput(interpreter.input)
+        for key,(op_name,op) in interpreter.operations.items():
+            interpreter.operations[key] = (op_name,self.logged_op(op_name,op))
+
+    def logged_op(self,op_name,op):
+        """Returns an operation that remembers the part of the stack it
+        changes before doing it."""
+        interpreter = self.interpreter
+        def logged():
+            stack = interpreter.stack
+            index = touched_from(stack,op_name)
+            self.touched = (index,stack[index:])
+            op()
+        return logged
+
+    def first_delta_step(self):
+        """Returns the earliest step that can be undone from the deltas."""
+        return self.furthest_step-len(self.deltas)
+
+    def take_snapshot(self):
+        """Returns the whole execution state."""
+        interpreter = self.interpreter
+        return (interpreter.current_pixel,interpreter.dp,interpreter.cc,
+            interpreter.switch_cc,interpreter.step,interpreter.times_stopped,
+            interpreter.input.offset,interpreter.input_read,list(interpreter.stack))
+
+    def check_snapshot(self):
+        """Takes a snapshot if it has been snapshot_every steps since the
+        last one."""
+        step = self.interpreter.current_step
+        if not self.snapshots or step-self.snapshots[-1][0] >= self.snapshot_every:
+            self.snapshots.append((step,self.take_snapshot()))
+
+    def restore(self,step,snapshot):
+        """Puts the interpreter back to a snapshot taken at the given step."""
+        interpreter = self.interpreter
+        (interpreter.current_pixel,interpreter.dp,interpreter.cc,
+            interpreter.switch_cc,interpreter.step,interpreter.times_stopped,
+            input_offset,interpreter.input_read,stack) = snapshot
+        interpreter.stack = list(stack)
+        interpreter.input.rewind(input_offset)
+        interpreter.current_step = step
+        self.carry_on()
+
+    def carry_on(self):
+        """Marks the interpreter as running again after going back. Loop
+        detection starts again from here, so a program found to never
+        terminate is finished again by step_forward at the same step."""
+        interpreter = self.interpreter
+        interpreter.finished = False
+        interpreter.exit_reason = None
+        interpreter.seen_states.clear()
+        interpreter.made_progress = True
+
+    def step_forward(self):
+        """Does the next step, as the debugger's step does, and returns
+        False if the program has finished."""
+        interpreter = self.interpreter
+        if interpreter.finished:
+            return False
+        if interpreter.current_step < self.furthest_step:
+            output = interpreter.output
+            interpreter.output = self.null_output
+            try:
+                running = interpreter.do_next_debug_step()
+            finally:
+                interpreter.output = output
+            if running and self.finish != None and interpreter.current_step == self.finish[0]:
+                interpreter.finished = True
+                interpreter.exit_reason = self.finish[1]
+                running = False
+            return running
+        self.check_snapshot()
+        delta = (interpreter.current_pixel,interpreter.dp,interpreter.cc,
+            interpreter.switch_cc,interpreter.step,interpreter.times_stopped,
+            interpreter.input.offset,interpreter.input_read)
+        self.touched = None
+        start_step = interpreter.current_step
+        running = interpreter.do_next_debug_step()
+        if interpreter.current_step > start_step:
+            self.deltas.append((delta,self.touched))
+            self.furthest_step = interpreter.current_step
+            if interpreter.exit_reason in ("FINISHED","NON_TERMINATING"):
+                self.finish = (interpreter.current_step,interpreter.exit_reason)
+        return running
+
+    def run_on(self,step=None):
+        """Runs at full speed until the program finishes or is stopped, e.g.
+        by a breakpoint, or reaches the given step. Only snapshots are taken,
+        so going back into the run is done from them. Steps that were run
+        before are run again through step_forward, so their output isn't
+        repeated. Operations are only fused if the interpreter did so before
+        the log was attached."""
+        interpreter = self.interpreter
+        debug = interpreter.debug.DEBUG
+        interpreter.debug.DEBUG = False
+        try:
+            while interpreter.current_step < self.furthest_step:
+                if step != None and interpreter.current_step >= step:
+                    return
+                if not self.step_forward():
+                    return
+            #Deltas have to lead up to the furthest step, so they are dropped
+            self.deltas.clear()
+            optimize = interpreter.optimize
+            interpreter.optimize = self.optimize
+            try:
+                while not interpreter.finished and (step == None or interpreter.current_step < step):
+                    self.check_snapshot()
+                    steps = self.snapshot_every
+                    if step != None:
+                        steps = min(steps,step-interpreter.current_step)
+                    start_step = interpreter.current_step
+                    interpreter.run_steps(steps)
+                    if interpreter.current_step == start_step:
+                        break
+            finally:
+                interpreter.optimize = optimize
+                self.furthest_step = interpreter.current_step
+            if interpreter.exit_reason in ("FINISHED","NON_TERMINATING"):
+                self.finish = (interpreter.current_step,interpreter.exit_reason)
+        finally:
+            interpreter.debug.DEBUG = debug
+
+    def step_back(self):
+        """Undoes the last step. Returns False if there is nothing to undo."""
+        interpreter = self.interpreter
+        if interpreter.current_step == 0:
+            return False
+        if interpreter.current_step <= self.first_delta_step():
+            self.jump_to(interpreter.current_step-1)
+            return True
+        delta,touched = self.deltas[interpreter.current_step-1-self.first_delta_step()]
+        (interpreter.current_pixel,interpreter.dp,interpreter.cc,
+            interpreter.switch_cc,interpreter.step,interpreter.times_stopped,
+            input_offset,interpreter.input_read) = delta
+        if touched != None:
+            index,items = touched
+            interpreter.stack[index:] = items
+        interpreter.input.rewind(input_offset)
+        interpreter.current_step = interpreter.current_step-1
+        self.carry_on()
+        return True
+
+    def jump_to(self,step):
+        """Goes forwards or backwards to the given step, or as near as the
+        program gets to it. Undoes steps one at a time if that is quicker
+        than going forward from a snapshot."""
+        interpreter = self.interpreter
+        if step < 0:
+            step = 0
+        debug = interpreter.debug.DEBUG
+        interpreter.debug.DEBUG = False
+        try:
+            if step < interpreter.current_step:
+                start_step,snapshot = 0,None
+                for snapshot_step,state in self.snapshots:
+                    if snapshot_step <= step:
+                        start_step,snapshot = snapshot_step,state
+                if step >= self.first_delta_step()\
+                    and interpreter.current_step-step <= step-start_step:
+                        while interpreter.current_step > step:
+                            self.step_back()
+                        return
+                if snapshot != None:
+                    self.restore(start_step,snapshot)
+                else:
+                    interpreter.reset()
+                    interpreter.input.rewind(0)
+                    self.carry_on()
+            while interpreter.current_step < step and self.step_forward():
+                pass
+        finally:
+            interpreter.debug.DEBUG = debug
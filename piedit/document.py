@@ -0,0 +1,169 @@
+"""Module for the program being edited. Its codels are kept as color codes in
+a 2D array with room to grow, so resizing rarely copies anything. The editor
+draws from the array, and the interpreter reads its codes from it without
+going through an image, though it still builds its own Pixels to run."""
+
+import array
+import PIL.Image
+import PIL.ImageChops
+import piedit.colors
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Most colors a document can have, as codes are bytes
+max_colors = 256
+
+
+def from_image(image):
+    """Returns a document with the codels of a PIL image."""
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    width,height = image.size
+    document = Document(width,height)
+    image_colors = image.getcolors(width*height)
+    for count,rgb in image_colors:
+        document.code(piedit.colors.rgb_to_hex(rgb))
+
+    #Map the image onto the palette in one go, and check nothing was changed
+    #on the way. Colors past the end of a full palette, and colors that are
+    #too close together, are mapped a codel at a time instead.
+    palette = document.rgb_palette()
+    #The rest of the palette is filled with colors the image doesn't have
+    used = set(rgb for count,rgb in image_colors)
+    red = 0
+    while len(palette) < 3*max_colors:
+        while (red,1,2) in used:
+            red = red + 1
+        palette.extend((red,1,2))
+        red = red + 1
+    palette_image = PIL.Image.new("P",(1,1))
+    palette_image.putpalette(palette)
+    codes = image.quantize(palette=palette_image)
+    if PIL.ImageChops.difference(codes.convert("RGB"),image).getbbox() == None:
+        document.data = array.array("B",codes.tobytes())
+    else:
+        lookup = {}
+        for i,rgb in enumerate(image.getdata()):
+            try:
+                document.data[i] = lookup[rgb]
+            except KeyError:
+                lookup[rgb] = document.code(piedit.colors.rgb_to_hex(rgb))
+                document.data[i] = lookup[rgb]
+    return document
+
+
+class Document:
+    """Class for a program being edited. Codels are kept row by row in an
+    array of codes into the palette, stride codes to a row, with rows to
+    spare below. The palette starts with the piet colors, in the order of
+    piedit.colors, and other colors are added to it as they are used."""
+    def __init__(self,width,height):
+        """Initializes new Document filled with white."""
+        self.palette = list(piedit.colors.colors)
+        #Indexed by hex color
+        self.codes = dict((color,code) for code,color in enumerate(self.palette))
+        self.white = self.codes[piedit.colors.white]
+        self.width = width
+        self.height = height
+        #Width and height there is room for
+        self.stride = width
+        self.rows = height
+        self.data = array.array("B",[self.white])*(width*height)
+        #Set once a color has been given the code of another, after which
+        #the document no longer has all the colors it was given
+        self.lossy = False
+
+    def code(self,color):
+        """Returns the code of a hex color, adding it to the palette if it
+        is new. Once the palette is full a new color gets the code of the
+        nearest color added before it. Colors that aren't piet colors are all
+        treated as white, so programs still run the same."""
+        try:
+            return self.codes[color]
+        except KeyError:
+            pass
+        if len(self.palette) < max_colors:
+            code = len(self.palette)
+            self.palette.append(color)
+        else:
+            red,green,blue = piedit.colors.hex_to_rgb(color)
+            distances = []
+            for code in xrange(len(piedit.colors.colors),len(self.palette)):
+                r,g,b = piedit.colors.hex_to_rgb(self.palette[code])
+                distances.append(((r-red)**2+(g-green)**2+(b-blue)**2,code))
+            code = min(distances)[1]
+            self.lossy = True
+        self.codes[color] = code
+        return code
+
+    def index(self,x,y):
+        """Returns the index of a codel in the array."""
+        return y*self.stride+x
+
+    def get(self,x,y):
+        """Returns the hex color of a codel."""
+        return self.palette[self.data[y*self.stride+x]]
+
+    def set(self,x,y,color):
+        """Sets the hex color of a codel and returns its code."""
+        code = self.code(color)
+        self.data[y*self.stride+x] = code
+        return code
+
+    def fill(self,start,end):
+        """Sets the codels from one index in the array to another to white."""
+        if end > start:
+            self.data[start:end] = array.array("B",[self.white])*(end-start)
+
+    def resize(self,width,height):
+        """Changes the size of the document, keeping the codels in the top
+        left. Shrinking only changes the size. Growing past the room there is
+        makes the room half as big again, copying the rows across a row at a
+        time; otherwise only the new codels are whitened."""
+        if width > self.stride or height > self.rows:
+            stride = self.stride
+            while stride < width:
+                stride = stride+stride//2+1
+            rows = self.rows
+            while rows < height:
+                rows = rows+rows//2+1
+            #A new array, so images made from the old one stay valid
+            data = array.array("B",[self.white])*(stride*rows)
+            copy_width = min(self.width,width)
+            for y in xrange(min(self.height,height)):
+                data[y*stride:y*stride+copy_width] = self.data[y*self.stride:y*self.stride+copy_width]
+            self.data = data
+            self.stride = stride
+            self.rows = rows
+        else:
+            #Codels left over from shrinking come back as white
+            if width > self.width:
+                for y in xrange(min(self.height,height)):
+                    self.fill(y*self.stride+self.width,y*self.stride+width)
+            for y in xrange(self.height,height):
+                self.fill(y*self.stride,y*self.stride+width)
+        self.width = width
+        self.height = height
+
+    def rgb_palette(self):
+        """Returns the palette as a flat list of red, green and blue values,
+        as PIL's putpalette takes it."""
+        palette = []
+        for color in self.palette:
+            palette.extend(piedit.colors.hex_to_rgb(color))
+        return palette
+
+    def image(self):
+        """Returns a P mode PIL image of the document that shares its array,
+        so edits show up in it straight away. Its palette has to be put again
+        when colors are added, and it has to be made again after resizing."""
+        image = PIL.Image.frombuffer("P",(self.width,self.height),self.data,"raw","P",self.stride,1)
+        image.putpalette(self.rgb_palette())
+        return image
@@ -0,0 +1,156 @@
+"""Module for writing programs out as images, scaled up to several pixels a
+codel for sharing. The document's codes are used as a palette image
+directly and scaled up in one go, so nothing is done a codel at a time.
+PNGs and GIFs are written with the palette, which keeps them small.
+Documents can't keep more colors than their palette holds, so images with
+more are only written if the changed colors are allowed."""
+
+import os
+import sys
+import getopt
+import PIL.Image
+import piedit.document
+import piedit.batch
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Formats that are written as palette images
+palette_formats = ("PNG","GIF")
+
+#Formats of extensions that aren't just the name of the format
+extension_formats = {"JPG":"JPEG"}
+
+lossy_message = "has more colors than fit in a palette of %d" % piedit.document.max_colors
+
+
+def image_format(path):
+    """Returns the PIL format for the extension of a path, or PNG if it has
+    no extension."""
+    extension = os.path.splitext(path)[1][1:].upper()
+    if not extension:
+        return "PNG"
+    return extension_formats.get(extension,extension)
+
+def export_image(document,codel_size=1,palette=True):
+    """Returns a PIL image of a document with squares of codel_size pixels
+    for codels. It is a palette image unless palette is False, when it is
+    RGB."""
+    if codel_size < 1:
+        raise ValueError, "BAD_CODEL_SIZE"
+    image = document.image()
+    if codel_size > 1:
+        image = image.resize((document.width*codel_size,document.height*codel_size),PIL.Image.NEAREST)
+    else:
+        #Don't keep the document's array in the image
+        image = image.copy()
+    if not palette:
+        image = image.convert("RGB")
+    return image
+
+def export_document(document,path,codel_size=1,palette=True,format=None,lossy=False):
+    """Writes a document to an image file, in the format of its extension
+    unless one is given. Only PNGs and GIFs are written with a palette.
+    Raises IOError for formats PIL can't write, and for documents whose
+    colors were changed to fit the palette unless lossy is set."""
+    if document.lossy and not lossy:
+        raise IOError, "LOSSY_EXPORT"
+    if format == None:
+        format = image_format(path)
+    palette = palette and format in palette_formats
+    try:
+        export_image(document,codel_size,palette).save(path,format,optimize=True)
+    except (KeyError,ValueError):
+        raise IOError, "UNKNOWN_FORMAT"
+
+def export_file(in_path,out_path,codel_size=1,palette=True,format=None,lossy=False):
+    """Writes the program in one image file to another. Tells us whether
+    any of its colors were changed on the way, which only happens if lossy
+    is set."""
+    try:
+        image = PIL.Image.open(in_path)
+        image.load()
+    except IOError:
+        raise IOError, "IMAGE_NOT_LOADED"
+    document = piedit.document.from_image(image)
+    export_document(document,out_path,codel_size,palette,format,lossy)
+    return document.lossy
+
+def export_directory(in_path,out_path,codel_size=1,palette=True,format="PNG",lossy=False):
+    """Writes every program in a directory of images to another directory,
+    as files of the same name in the given format. Files whose names only
+    differ in their extensions keep them, e.g. hello.bmp.png, so none are
+    written over. Returns (path, colors changed) pairs for the files
+    written. Raises IOError at the first file whose colors would be
+    changed unless lossy is set, before writing it."""
+    if not os.path.isdir(out_path):
+        os.makedirs(out_path)
+    paths = []
+    for filename in sorted(os.listdir(in_path)):
+        if os.path.splitext(filename)[1].lower() in piedit.batch.image_extensions:
+            path = os.path.join(out_path,os.path.splitext(filename)[0]+"."+format.lower())
+            if path in [written for written,changed in paths]:
+                path = os.path.join(out_path,filename+"."+format.lower())
+            changed = export_file(os.path.join(in_path,filename),path,codel_size,palette,format,lossy)
+            paths.append((path,changed))
+    return paths
+
+def print_usage():
+    """Prints usage string for command line."""
+    print "Usage: piedit.py export [<options>] <image or directory> <image or directory>"
+    print "Writes a program to an image, or every program in a directory to another directory."
+    print "options:"
+    print "\t-h (--help)\t- Prints this help"
+    print "\t-s (--size)\t- Pixels across each codel in the images written. This is 1 by default."
+    print "\t-f (--format)\t- Format of the images written. This is png for a directory, and the output's extension otherwise."
+    print "\t--rgb\t- Write PNGs and GIFs as RGB rather than with a palette."
+    print "\t--lossy\t- Write images with more colors than fit in a palette of %d, changing the rest to the nearest color." % piedit.document.max_colors
+
+def main(args):
+    """Runs the export command line. Returns the exit status."""
+    try:
+        opts,args = getopt.getopt(args, "hs:f:", ["help","size=","format=","rgb","lossy"])
+    except getopt.GetoptError, err:
+        print str(err)
+        print_usage()
+        return 2
+    codel_size = 1
+    format = None
+    palette = True
+    lossy = False
+    for o,a in opts:
+        if o in ["-h","--help"]:
+            print_usage()
+            return 1
+        elif o in ["-s","--size"]:
+            codel_size = int(a)
+        elif o in ["-f","--format"]:
+            format = extension_formats.get(a.upper(),a.upper())
+        elif o == "--rgb":
+            palette = False
+        elif o == "--lossy":
+            lossy = True
+    if len(args) != 2 or codel_size < 1:
+        print_usage()
+        return 2
+    try:
+        if os.path.isdir(args[0]):
+            for path,changed in export_directory(args[0],args[1],codel_size,palette,format or "PNG",lossy):
+                print path
+                if changed:
+                    sys.stderr.write("Warning: %s %s, so the rest were written as the nearest of them\n" % (path,lossy_message))
+        else:
+            if export_file(args[0],args[1],codel_size,palette,format,lossy):
+                sys.stderr.write("Warning: %s %s, so the rest were written as the nearest of them\n" % (args[1],lossy_message))
+    except IOError, e:
+        print str(e)
+        if str(e) == "LOSSY_EXPORT":
+            print "An image %s. Use --lossy to write the rest as the nearest of them." % lossy_message
+        return 1
+    return 0
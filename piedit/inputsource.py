@@ -0,0 +1,196 @@
+"""Module for the places a piet program's input can come from. Sources read
+ahead in blocks and hand out characters and whole numbers from a buffer."""
+
+import sys
+import os
+import getchr
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+class InputPending(Exception):
+    """Raised by sources that don't block when input is needed but hasn't
+    arrived yet. Nothing is read when it is raised."""
+
+
+class InputSource:
+    """Base class for input sources. Subclasses provide read_block, which
+    returns the next piece of input or "" at the end of the input."""
+    def __init__(self,text=""):
+        """Initializes new InputSource."""
+        self.buffer = text
+        self.position = 0
+        self.eof = False
+        #Number of characters read so far
+        self.offset = 0
+
+    def read_block(self):
+        """Returns more input, or "" at the end of the input."""
+        return ""
+
+    def fill(self):
+        """Reads more input into the buffer. Returns False at the end of the
+        input."""
+        if self.eof:
+            return False
+        data = self.read_block()
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:]+data
+        self.position = 0
+        return True
+
+    def peek_char(self,ahead=0):
+        """Returns the character the given number of places past the next
+        one without reading anything, or None at the end of the input."""
+        while self.position+ahead >= len(self.buffer):
+            if not self.fill():
+                return None
+        return self.buffer[self.position+ahead]
+
+    def read_char(self):
+        """Reads a character. Returns None at the end of the input."""
+        char = self.peek_char()
+        if char != None:
+            self.position = self.position + 1
+            self.offset = self.offset + 1
+        return char
+
+    def skip(self,count):
+        """Reads and throws away up to count characters."""
+        while count > 0 and self.peek_char() != None:
+            taken = min(count,len(self.buffer)-self.position)
+            self.position = self.position + taken
+            self.offset = self.offset + taken
+            count = count - taken
+
+    def read_number(self):
+        """Reads a whole integer, skipping any whitespace before it. If the
+        input isn't a number the offending character is read and thrown
+        away, and None is returned, as it is at the end of the input. The
+        number is looked ahead at before anything is read, so it is read all
+        at once or not at all."""
+        ahead = 0
+        char = self.peek_char(ahead)
+        while char != None and char.isspace():
+            ahead = ahead + 1
+            char = self.peek_char(ahead)
+        start = ahead
+        if char in ("-","+"):
+            ahead = ahead + 1
+            char = self.peek_char(ahead)
+        while char != None and char.isdigit():
+            ahead = ahead + 1
+            char = self.peek_char(ahead)
+        digits = self.buffer[self.position+start:self.position+ahead]
+        if digits in ("","-","+"):
+            if not digits and char != None:
+                ahead = ahead + 1
+            number = None
+        else:
+            number = int(digits)
+        self.position = self.position + ahead
+        self.offset = self.offset + ahead
+        return number
+
+
+class StringInput(InputSource):
+    """Source that reads from a string."""
+    def __init__(self,text):
+        """Initializes new StringInput."""
+        InputSource.__init__(self,text)
+
+
+class StreamInput(InputSource):
+    """Source that reads from a file object or pipe, a block at a time."""
+    def __init__(self,file,block_size=4096):
+        """Initializes new StreamInput."""
+        InputSource.__init__(self)
+        self.file = file
+        self.block_size = block_size
+        try:
+            self.fd = file.fileno()
+        except (AttributeError,IOError):
+            self.fd = None
+
+    def read_block(self):
+        """Reads whatever input is ready, up to a block."""
+        if self.fd != None:
+            #Unlike file.read, doesn't wait for a whole block from a pipe
+            return os.read(self.fd,self.block_size)
+        else:
+            return self.file.read(self.block_size)
+
+    def close(self):
+        """Closes the file."""
+        self.file.close()
+
+
+class FileInput(StreamInput):
+    """Source that reads from the file at a path."""
+    def __init__(self,path,block_size=65536):
+        """Initializes new FileInput."""
+        StreamInput.__init__(self,open(path,"rb"),block_size)
+
+
+class QueueInput(InputSource):
+    """Source that is fed input as it arrives, and raises InputPending
+    instead of waiting when it runs out."""
+    def __init__(self):
+        """Initializes new QueueInput."""
+        InputSource.__init__(self)
+        self.queue = []
+        self.closed = False
+
+    def feed(self,text):
+        """Adds some input."""
+        self.queue.append(text)
+
+    def close(self):
+        """Marks the end of the input."""
+        self.closed = True
+
+    def waiting(self):
+        """Tells us whether everything fed so far has been read."""
+        return not self.queue and not self.closed\
+            and self.position >= len(self.buffer)
+
+    def read_block(self):
+        """Returns everything fed since the last block."""
+        if self.queue:
+            data = "".join(self.queue)
+            self.queue = []
+            return data
+        elif self.closed:
+            return ""
+        else:
+            raise InputPending
+
+
+class TerminalInput(InputSource):
+    """Source that reads keypresses from a terminal without waiting for
+    enter."""
+    def read_block(self):
+        """Reads a single keypress."""
+        return getchr.get_chr()
+
+
+def stdin_input():
+    """Returns a source for stdin. Terminals are read a keypress at a time,
+    anything else in blocks."""
+    try:
+        interactive = sys.stdin.isatty()
+    except AttributeError:
+        interactive = False
+    if interactive:
+        return TerminalInput()
+    else:
+        return StreamInput(sys.stdin)
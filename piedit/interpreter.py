@@ -4,13 +4,19 @@
 imported and used by the GUI."""
 
 import sys
+import time
 import getopt
-import gtk
+import hashlib
 import PIL.Image
 import colors
 import unionfind
-import getchr
 import debug
+import peephole
+import tracefile
+import outputsink
+import inputsource
+import checkpoint
+import profiler
 
 __author__ = "Steven Anderson"
 __copyright__ = "Steven Anderson 2008"
@@ -22,23 +28,73 @@ __email__ = "steven.james.anderson@googlemail.com"
 __status__ = "Production"
 
 
+#(x,y) offsets of the next pixel, indexed by dp
+dp_offsets = ((1,0),(0,1),(-1,0),(0,-1))
+
+#Operations that count as progress even when they leave the stack the same
+#size. Not always changes the top item of a non-empty stack, and counting it
+#on an empty one only makes loop detection more cautious.
+progress_ops = ("IN(char)","IN(Number)","Not")
+
+#Messages for the command line when a limit stops a program, indexed by
+#exit reason
+limit_messages = {
+    "TIME_LIMIT":"it went over the time limit",
+    "CPU_LIMIT":"it went over the cpu time limit",
+    "STACK_LIMIT":"its stack went over the size limit",
+}
+
+
+def open_image(path):
+    """Opens an image, from a path or a file object, as RGB. Raises IOError
+    if it can't be read as an image."""
+    try:
+        image = PIL.Image.open(path)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+    except IOError:
+        raise IOError, "IMAGE_NOT_LOADED"
+    return image
+
+def image_hash(image):
+    """Returns a SHA-1 hex digest of an RGB image's size and pixels. This is
+    what identifies a program, so the same program saved as a different
+    file, or in a different format, has the same hash."""
+    return hashlib.sha1("%dx%d:" % image.size + image.tobytes()).hexdigest()
+
+
 class Interpreter:
     """The Piet interpreter class"""
-    def __init__(self, max_steps=1000000, thread=None):
-        """Initalizes new Interpreter."""
-        self.current_pixel = None
-        self.dp = 0
-        self.cc = 0
-        self.switch_cc = True
-        self.step = 0 #0 for just moved into color block, 1 for moved to edge
-        self.times_stopped = 0
+    def __init__(self, max_steps=1000000, thread=None, output=None, input=None):
+        """Initalizes new Interpreter. Output goes to stdout and input comes
+        from stdin unless an OutputSink or InputSource is given."""
         self.max_steps = max_steps
-        self.current_step = 0
-        self.stack = []
+        #Limits on wall clock seconds, cpu seconds and stack items, if set
+        self.time_limit = None
+        self.cpu_limit = None
+        self.stack_limit = None
+        #Steps between checks of the limits and whether to stop
+        self.check_every = 1000
+        self.pixels = None
         self.color_blocks = {}
-        self.finished = False
+        self.tracer = None
+        self.profiler = None
+        self.breakpoints = None
+        #Writes checkpoints every checkpoint_every steps if set
+        self.checkpointer = None
+        self.checkpoint_every = 1000000
+        #Checkpoint to carry on from when a program is run
+        self.resume_path = None
         self.thread = thread
+        if output == None:
+            output = outputsink.stdout_output()
+        if input == None:
+            input = inputsource.stdin_input()
+        self.reset(output,input)
         self.debug = debug.Debug(False)
+        self.optimize = True
+        #Indexed by (color block label, dp, cc)
+        self.superinstructions = {}
         #Indexed by hue and light change
         self.operations = {
             (1,0):("Add",self.op_add),
@@ -59,24 +115,121 @@ class Interpreter:
             (4,2):("IN(Number)",self.op_in_number),
             (5,2):("OUT(Char)",self.op_out_char),
         }
+        #Indexed by operation name
+        self.op_methods = dict(self.operations.values())
     
     def init(self):
         self.__init__()
+    
+    def reset(self,output=None,input=None):
+        """Resets the execution state so the loaded program can be run again
+        from the start, keeping its color blocks and superinstructions.
+        Output and input carry on from where they were unless new ones are
+        given."""
+        if self.pixels != None:
+            self.current_pixel = self.pixels[0][0]
+        else:
+            self.current_pixel = None
+        self.dp = 0
+        self.cc = 0
+        self.switch_cc = True
+        self.step = 0 #0 for just moved into color block, 1 for moved to edge
+        self.times_stopped = 0
+        self.current_step = 0
+        self.stack = []
+        self.finished = False
+        #One of FINISHED, MAX_STEPS, STOPPED, NON_TERMINATING, TIME_LIMIT,
+        #CPU_LIMIT, STACK_LIMIT or BREAKPOINT once finished
+        self.exit_reason = None
+        #When the run started, for the time limits
+        self.start_time = None
+        self.start_cpu = None
+        #States seen since the stack last changed or io was done
+        self.seen_states = set()
+        self.made_progress = False
+        #Opcode of the operation done in the last step, for tracing
+        self.last_opcode = 0
+        #Whether the program has tried to read input, so whether its output
+        #could depend on it
+        self.input_read = False
+        if output != None:
+            self.output = output
+        if input != None:
+            self.input = input
         
     def set_opt(self,o,a):
         """Sets an option from the command line."""
         if o in ["-d", "--debug"]:
             self.debug.DEBUG = True
+            #Keep program output in step with the debug output
+            self.output.flush_policy = outputsink.IMMEDIATE
         elif o in ["-m","--maxsteps"]:
             self.max_steps = int(a)
+        elif o in ["-f","--flush"]:
+            if a not in outputsink.flush_policies:
+                raise ValueError, "UNKNOWN_FLUSH_POLICY"
+            self.output.flush_policy = a
+        elif o in ["-i","--input"]:
+            self.input = inputsource.FileInput(a)
+        elif o in ["-n","--nooptimize"]:
+            self.optimize = False
+        elif o in ["-t","--trace"]:
+            self.tracer = tracefile.TraceWriter(a)
+        elif o in ["--tracedeltas"]:
+            self.tracer = tracefile.TraceWriter(a,stack_deltas=True)
+        elif o in ["--profile","--heatmap"]:
+            if self.profiler == None:
+                profiler.Profiler().attach(self)
+            if o == "--profile":
+                self.profiler.json_path = a
+            else:
+                self.profiler.heatmap_path = a
+        elif o in ["--timelimit"]:
+            self.time_limit = float(a)
+        elif o in ["--cpulimit"]:
+            self.cpu_limit = float(a)
+        elif o in ["--stacklimit"]:
+            self.stack_limit = int(a)
+        elif o in ["--checkpoint"]:
+            self.checkpointer = checkpoint.CheckpointWriter(a)
+        elif o in ["--checkpointevery"]:
+            self.checkpoint_every = int(a)
+            if self.checkpoint_every <= 0:
+                raise ValueError, "BAD_CHECKPOINT_INTERVAL"
+        elif o in ["--resume"]:
+            self.resume_path = a
+    
+    def run_program(self,path=None,document=None,start=True):
+        """Runs a program at the given path, or an editor document."""
+        self.load_program(path,document)
+        if self.resume_path != None:
+            checkpoint.restore_state(self,checkpoint.load_checkpoint(self.resume_path))
+            self.debug.writeln("---RESUMING AT STEP %d---",self.current_step)
+        self.debug.writeln("---STARTING EXECUTION---")
+        self.write_position()
+        if start:
+            self.start_execution()
+        else:
+            pass
     
-    def run_program(self,path=None,pixels=None,width=None,height=None,start=True):
-        """Runs a program at the given path."""
-        self.debug.writeln("---LOADING IMAGE %s...---" % (path))
-        if pixels != None:
-            self.width = width
-            self.height = height
-            self.pixels = [[Pixel(x,y,pixels[y*(self.width)+x]) for y in xrange(self.height)] for x in xrange(self.width)]
+    def load_program(self,path=None,document=None):
+        """Loads a program from the given path, or from an editor document,
+        and scans its color blocks ready for execution. A document's codes
+        are read from its array without going through an image, but a Pixel
+        is still made for each codel, as for a file."""
+        self.debug.writeln("---LOADING IMAGE %s...---",path)
+        self.color_blocks = {}
+        self.superinstructions = {}
+        self.hash = None
+        if document != None:
+            #Read the codes out of the document's array. The color blocks
+            #are scanned over Pixels, so one is made for every codel.
+            self.width = document.width
+            self.height = document.height
+            palette = document.palette
+            data = document.data
+            stride = document.stride
+            self.pixels = [[Pixel(x,y,palette[data[y*stride+x]]) for y in xrange(self.height)] for x in xrange(self.width)]
             self.current_pixel = self.pixels[0][0]
         else:
             self.load_image(path)   
@@ -84,24 +237,19 @@ class Interpreter:
         self.debug.writeln("---SCANNING COLOR BLOCKS---")
         self.find_color_blocks()
         self.debug.writeln("---COLOR BLOCKS SCANNED---\n")
-        self.debug.writeln("---STARTING EXECUTION---")
-        self.debug.writeln("AT (%s,%s), COLOR=%s, DP=%d, CC=%s"\
-            % (self.current_pixel.x,self.current_pixel.y,self.current_pixel.color,\
-            self.dp, self.cc))
-        if start:
-            self.start_execution()
-        else:
-            pass
+        
+    def program_hash(self):
+        """Returns the image_hash of the loaded program's codels."""
+        if self.hash == None:
+            image = PIL.Image.new("RGB",(self.width,self.height))
+            image.putdata([colors.hex_to_rgb(self.pixels[x][y].color)
+                for y in xrange(self.height) for x in xrange(self.width)])
+            self.hash = image_hash(image)
+        return self.hash
         
     def load_image(self,path):
         """Loads an image and puts pixel data into self.pixels."""
-        try:
-            self.image = PIL.Image.open(path)
-            if self.image.mode != "RGB":
-                self.image = self.image.convert("RGB")
-        except IOError:
-            raise IOError, "IMAGE_NOT_LOADED"
-        
+        self.image = open_image(path)
         (self.width, self.height) = self.image.size
         rawpixels = self.image.getdata()
         self.pixels = [[Pixel(x,y,colors.rgb_to_hex(rawpixels[y*(self.width)+x])) for y in xrange(self.height)] for x in xrange(self.width)]
@@ -139,14 +287,15 @@ class Interpreter:
                     self.color_blocks[pixel.set_label].update_boundaries(pixel)
     
         #Debug
-        for i,color_block in self.color_blocks.items():
-            bounds = color_block.boundary_pixels
-            self.debug.writeln("Color Block %s: Size=%s, \n\tmaxRL=(%s,%s), maxRR=(%s,%s), \n\tmaxDL=(%s,%s), maxDR=(%s,%s), \n\tmaxLL=(%s,%s), maxLR=(%s,%s), \n\tmaxUL=(%s,%s), maxUR=(%s,%s)" \
-                % (i, color_block.size, 
+        if self.debug.DEBUG:
+            for i,color_block in self.color_blocks.items():
+                bounds = color_block.boundary_pixels
+                self.debug.writeln("Color Block %s: Size=%s, \n\tmaxRL=(%s,%s), maxRR=(%s,%s), \n\tmaxDL=(%s,%s), maxDR=(%s,%s), \n\tmaxLL=(%s,%s), maxLR=(%s,%s), \n\tmaxUL=(%s,%s), maxUR=(%s,%s)",
+                   i, color_block.size, 
                    bounds[0][0].x,bounds[0][0].y, bounds[0][1].x, bounds[0][1].y,
                    bounds[1][0].x,bounds[1][0].y, bounds[1][1].x, bounds[1][1].y,
                    bounds[2][0].x,bounds[2][0].y, bounds[2][1].x, bounds[2][1].y,
-                   bounds[3][0].x,bounds[3][0].y, bounds[3][1].x, bounds[3][1].y))
+                   bounds[3][0].x,bounds[3][0].y, bounds[3][1].x, bounds[3][1].y)
                     
     def is_background(self,color):
         """Tells us if the given color is black or white."""
@@ -176,15 +325,74 @@ class Interpreter:
     
     def start_execution(self):
         """Starts the execution of the program."""
-        if self.max_steps == -1:
-            while not self.finished:
-                self.do_next_step()
+        if self.checkpointer != None:
+            self.run_with_checkpoints()
         else:
-            for i in xrange(self.max_steps):
-                self.do_next_step()
-                if self.finished:
-                    return
-            self.debug.writeln("---EXECUTION FINISHED (Max Steps Reached)---")
+            self.run_steps()
+            
+    def run_with_checkpoints(self):
+        """Runs the program, taking a checkpoint every checkpoint_every steps
+        and when it is stopped by a limit, so it can be carried on."""
+        while not self.finished:
+            self.run_steps(self.checkpoint_every)
+            if self.exit_reason not in ("FINISHED","NON_TERMINATING"):
+                self.checkpointer.save(self)
+            
+    def run_steps(self,steps=None):
+        """Runs up to the given number of steps, or until execution finishes
+        if no number is given, stopping early if the maximum steps or another
+        limit is reached. A non-blocking input source that runs dry raises
+        InputPending, and the step that needed the input is done again by the
+        next call."""
+        if steps != None:
+            end_step = self.current_step + steps
+        else:
+            end_step = None
+        if self.max_steps != -1:
+            if end_step == None:
+                end_step = self.max_steps
+            else:
+                end_step = min(end_step,self.max_steps)
+        if self.start_time == None:
+            self.start_time = time.time()
+            self.start_cpu = time.clock()
+        do_next_step = self.do_next_step
+        try:
+            while not self.finished and not self.check_limits():
+                #Only check the limits every so often
+                chunk_end = self.current_step + self.check_every
+                if end_step != None:
+                    if self.current_step >= end_step:
+                        break
+                    chunk_end = min(chunk_end,end_step)
+                while self.current_step < chunk_end and not self.finished:
+                    do_next_step(chunk_end)
+            if not self.finished and self.max_steps != -1\
+                and self.current_step >= self.max_steps:
+                self.finished = True
+                self.exit_reason = "MAX_STEPS"
+                self.debug.writeln("---EXECUTION FINISHED (Max Steps Reached)---")
+        finally:
+            self.output.flush()
+            
+    def check_limits(self):
+        """Finishes execution if the thread has been asked to stop or a limit
+        has been passed. Returns True if it was finished."""
+        if self.thread != None and self.thread.should_stop:
+            reason,message = "STOPPED","Thread was stopped"
+        elif self.stack_limit != None and len(self.stack) > self.stack_limit:
+            reason,message = "STACK_LIMIT","Stack Limit Reached"
+        elif self.time_limit != None and time.time()-self.start_time >= self.time_limit:
+            reason,message = "TIME_LIMIT","Time Limit Reached"
+        elif self.cpu_limit != None and time.clock()-self.start_cpu >= self.cpu_limit:
+            reason,message = "CPU_LIMIT","CPU Limit Reached"
+        else:
+            return False
+        self.debug.writeln()
+        self.debug.writeln("---EXECUTION FINISHED (%s)---",message)
+        self.finished = True
+        self.exit_reason = reason
+        return True
             
     def do_next_debug_step(self):
         if self.max_steps == -1:
@@ -196,34 +404,144 @@ class Interpreter:
                 return False
                 self.debug.writeln("---EXECUTION FINISHED (Max Steps Reached)---")
         if self.finished:
+            self.output.flush()
             return False
         else:
             return True
             
-    def do_next_step(self,step=None):     
-        """Executes a step in the program."""
-        if self.thread != None:
-            if self.thread.should_stop:
-                self.debug.writeln()
-                self.debug.writeln("---EXECUTION FINISHED (Thread was stopped)---")
-                self.finished = True
+    def do_next_step(self,end_step=None):     
+        """Executes a step in the program. Fused operations are only run
+        in its place if they finish by end_step, when it is given."""
+        debug = self.debug.DEBUG
+        if self.step == 0 and self.optimize and not debug\
+            and self.tracer == None and self.profiler == None:
+            if self.do_superinstruction(end_step):
                 return
         self.current_step = self.current_step + 1
         if self.step == 0:
-            self.debug.writeln("  -> Moving within color block...")
+            if debug:
+                self.debug.writeln("  -> Moving within color block...")
             self.step = 1
             self.move_within_block()         
         elif self.step == 1:
-            self.debug.writeln("  -> Moving out of color block...")
+            if debug:
+                self.debug.writeln("  -> Moving out of color block...")
             self.step = 0           
-            self.move_out_of_block()               
+            try:
+                self.move_out_of_block()
+            except inputsource.InputPending:
+                #Leave the step to be done again once the input arrives
+                self.step = 1
+                self.current_step = self.current_step - 1
+                raise
         else:
             error_handler.handle_error("The step wasn't 0 or 1. That should never happen. This must be a bug in my code. Sorry")
         if not self.finished:
-            self.debug.writeln()
-            self.debug.writeln("AT (%s,%s), COLOR=%s, DP=%d, CC=%s"\
-                % (self.current_pixel.x,self.current_pixel.y,self.current_pixel.color,\
-                self.dp, self.cc))
+            if self.step == 0:
+                self.check_progress()
+            if debug:
+                self.debug.writeln()
+                self.write_position()
+        if self.tracer != None or self.profiler != None:
+            self.record_step()
+    
+    def record_step(self):
+        """Passes the step just done to the tracer and profiler."""
+        if self.tracer != None:
+            self.tracer.record(self.current_step,self.current_pixel.set_label,
+                self.dp,self.cc,self.last_opcode,self.stack)
+        if self.profiler != None:
+            self.profiler.record(self)
+        self.last_opcode = 0
+    
+    def write_position(self):
+        """Writes the current position, dp and cc to the debug output."""
+        self.debug.writeln("AT (%s,%s), COLOR=%s, DP=%d, CC=%s",
+            self.current_pixel.x,self.current_pixel.y,self.current_pixel.color,
+            self.dp,self.cc)
+            
+    def do_superinstruction(self,end_step=None):
+        """Runs the fused stack operations leading out of the current color
+        block, if there are any and they fit in the steps left before
+        end_step and the maximum steps. Returns True if they were run."""
+        key = (self.current_pixel.set_label,self.dp,self.cc)
+        try:
+            superinstruction = self.superinstructions[key]
+        except KeyError:
+            superinstruction = self.compile_superinstruction(*key)
+            self.superinstructions[key] = superinstruction
+        if superinstruction == None:
+            return False
+        if self.max_steps != -1\
+            and self.current_step + superinstruction.steps > self.max_steps:
+                return False
+        if end_step != None and self.current_step + superinstruction.steps > end_step:
+            return False
+        if superinstruction.progress:
+            for values,op_name in superinstruction.actions:
+                self.stack.extend(values)
+                if op_name != None:
+                    self.op_methods[op_name]()
+            self.made_progress = True
+        else:
+            #Operations on too short a stack do nothing, which isn't progress
+            for values,op_name in superinstruction.actions:
+                depth = len(self.stack)
+                self.op_methods[op_name]()
+                if len(self.stack) != depth:
+                    self.made_progress = True
+        self.current_step = self.current_step + superinstruction.steps
+        self.current_pixel = superinstruction.pixel
+        self.times_stopped = 0
+        self.switch_cc = True
+        return True
+    
+    def compile_superinstruction(self,label,dp,cc):
+        """Follows the stack operations out of the given color block for as
+        long as the dp and cc can't change, and folds them into a
+        Superinstruction. Returns None if there are fewer than two."""
+        ops = []
+        pixel = None
+        d_x,d_y = dp_offsets[dp]
+        while self.color_blocks.has_key(label) and len(ops) < peephole.max_length:
+            exit_pixel = self.color_blocks[label].boundary_pixels[dp][cc]
+            n_x,n_y = exit_pixel.x+d_x, exit_pixel.y+d_y
+            if n_x<0 or n_y<0 or n_x>=self.width or n_y>=self.height:
+                break
+            next_pixel = self.pixels[n_x][n_y]
+            if self.is_background(next_pixel.color):
+                break
+            op_name = self.operations[colors.hue_light_diff(exit_pixel.color,next_pixel.color)][0]
+            if op_name not in peephole.stack_ops:
+                break
+            if self.breakpoints != None and self.breakpoints.stops_fusion(op_name,next_pixel):
+                break
+            ops.append((op_name,exit_pixel.set_size))
+            pixel = next_pixel
+            label = next_pixel.set_label
+        if len(ops) < 2:
+            return None
+        progress = bool([op_name for op_name,size in ops if op_name == "Push" or op_name in progress_ops])
+        return peephole.Superinstruction(len(ops)*2,peephole.fold(ops),pixel,progress)
+            
+    def check_progress(self):
+        """Remembers the state on entering a color block while the stack is
+        untouched and no io is done. Coming back to one of these states means
+        the program would go round the same loop forever, so it is stopped."""
+        if self.current_pixel.set_label != -1:
+            position = self.current_pixel.set_label
+        else:
+            position = self.current_pixel
+        state = (position,self.dp,self.cc,self.switch_cc,self.times_stopped)
+        if self.made_progress:
+            self.made_progress = False
+            self.seen_states.clear()
+        elif state in self.seen_states:
+            self.debug.writeln("---EXECUTION FINISHED (Program will never terminate)---")
+            self.finished = True
+            self.exit_reason = "NON_TERMINATING"
+            return
+        self.seen_states.add(state)
             
     def move_within_block(self):
         """Moves to the border pixel within the current color block."""
@@ -266,9 +584,11 @@ class Interpreter:
         the operation if necessary."""
         x,y = self.current_pixel.x, self.current_pixel.y
         n_x,n_y = self.next_pixel_coords()
+        debug = self.debug.DEBUG
         
-        self.debug.writeln("  -> Trying to cross from (%s,%s) to (%s,%s)"\
-            %(x,y,n_x,n_y))
+        if debug:
+            self.debug.writeln("  -> Trying to cross from (%s,%s) to (%s,%s)",
+                x,y,n_x,n_y)
         
         #If we're at a wall
         if (self.dp == 0 and x >= self.width-1)\
@@ -292,13 +612,19 @@ class Interpreter:
             #Get the operation to do
             hue_light_diff = colors.hue_light_diff(current_pixel.color,next_pixel.color)
             op_name, op = self.operations[hue_light_diff]
-            self.debug.writeln("  -> Crossing from (%s,%s), color=%s to (%s,%s), color=%s"\
-                % (current_pixel.x, current_pixel.y, current_pixel.color,\
-                next_pixel.x, next_pixel.y, next_pixel.color))
-            self.debug.writeln("  -> Stack before %s = %s" % (op_name.upper(),self.stack))
-            self.debug.writeln("  -> Performing %s" % (op_name.upper()))
+            self.last_opcode = hue_light_diff[0]*colors.num_lights+hue_light_diff[1]
+            if debug:
+                self.debug.writeln("  -> Crossing from (%s,%s), color=%s to (%s,%s), color=%s",
+                    current_pixel.x, current_pixel.y, current_pixel.color,
+                    next_pixel.x, next_pixel.y, next_pixel.color)
+                self.debug.writeln("  -> Stack before %s = %s",op_name.upper(),self.stack)
+                self.debug.writeln("  -> Performing %s",op_name.upper())
+            depth = len(self.stack)
             op()
-            self.debug.writeln("  -> Stack after %s = %s" % (op_name.upper(),self.stack))
+            if len(self.stack) != depth or op_name in progress_ops:
+                self.made_progress = True
+            if debug:
+                self.debug.writeln("  -> Stack after %s = %s",op_name.upper(),self.stack)
         self.current_pixel = next_pixel
         self.times_stopped = 0
         self.switch_cc = True
@@ -319,9 +645,10 @@ class Interpreter:
     
     def hit_obstruction(self):
         """Handles the case when an obstruction is the next pixel."""
-        self.debug.writeln("  -> Hit an obstruction")
         self.times_stopped = self.times_stopped + 1
-        self.debug.writeln("  -> Obstructions Hit = %i" % (self.times_stopped))
+        if self.debug.DEBUG:
+            self.debug.writeln("  -> Hit an obstruction")
+            self.debug.writeln("  -> Obstructions Hit = %i",self.times_stopped)
         self.step = 0
         if (self.times_stopped >= 8):
             self.stop_execution()
@@ -337,16 +664,19 @@ class Interpreter:
         """Cancels execution of the program."""
         self.debug.writeln("---EXECUTION FINISHED---")
         self.finished = True
+        self.exit_reason = "FINISHED"
         
     def toggle_cc(self):
         """Toggles the cc."""
-        self.debug.writeln("  -> Toggling CC")
+        if self.debug.DEBUG:
+            self.debug.writeln("  -> Toggling CC")
         div,mod = divmod(1-self.cc,1)
         self.cc = div
     
     def rotate_dp(self,times=1):
         """Rotates the dp by the given number of times."""
-        self.debug.writeln("  -> Rotating DP by %s" % times)
+        if self.debug.DEBUG:
+            self.debug.writeln("  -> Rotating DP by %s",times)
         div,mod = divmod(self.dp+times,4)
         self.dp = mod
         
@@ -380,8 +710,10 @@ class Interpreter:
     
     def op_in_char(self):
         """Piet IN(CHAR) operation."""
-        chr = getchr.get_chr()
-        self.stack.append(ord(chr))
+        self.input_read = True
+        char = self.input.read_char()
+        if char != None:
+            self.stack.append(ord(char))
     
     def op_push(self):
         """Piet Push operation."""
@@ -412,34 +744,28 @@ class Interpreter:
         if len(self.stack) >= 2:
             num_rolls = self.stack.pop()
             depth = self.stack.pop()    
-            if depth >0:
-                for i in xrange(abs(num_rolls)):
-                    self.roll(depth,num_rolls<0)    
+            if depth > 0 and num_rolls != 0 and self.stack:
+                self.roll(depth,num_rolls)
     
-    def roll(self,depth,reverse):
-        """Does a single roll."""
-        if depth > len(self.stack):
-            depth = len(self.stack)
-
-        if reverse:
-            bottom_item = self.stack[0]
-            index = depth
-            for i in xrange(index):
-                self.stack[i] = self.stack[i+1]
-            self.stack[index] = bottom_item
+    def roll(self,depth,num_rolls):
+        """Rolls the stack to the given depth the given number of times in
+        one go. A negative number of rolls turns the bottom depth+1 items the
+        other way."""
+        if num_rolls < 0:
+            depth = min(depth+1,len(self.stack))
+            num_rolls = -num_rolls % depth
+            self.stack[:depth] = self.stack[num_rolls:depth] + self.stack[:num_rolls]
         else:
-            top_item = self.stack[-1]
-            index = len(self.stack)-depth
-            for i in xrange(len(self.stack)-1,index,-1):
-                self.stack[i] = self.stack[i-1]    
-            self.stack[index] = top_item
+            depth = min(depth,len(self.stack))
+            num_rolls = num_rolls % depth
+            if num_rolls:
+                self.stack[-depth:] = self.stack[-num_rolls:] + self.stack[-depth:-num_rolls]
     
     def op_out_number(self):
         """Piet OUT(NUM) operation."""
         if len(self.stack) >=1:
             item = self.stack.pop()
-            sys.stdout.write(str(item))
-            sys.stdout.flush()
+            self.output.write(str(item))
     
     def op_pop(self):
         """Piet Pop operation."""
@@ -463,23 +789,22 @@ class Interpreter:
         """Piet Switch operation."""
         if len(self.stack) >=1:
             item = self.stack.pop()
-            for i in xrange(item):
+            #Toggling twice gets back where we started
+            if item > 0 and item % 2:
                 self.toggle_cc()
     
     def op_in_number(self):
         """Piet IN(NUM) operation."""
-        char = getchr.get_chr()
-        try:
-            self.stack.append(int(char))
-        except ValueError:
-            pass      
+        self.input_read = True
+        number = self.input.read_number()
+        if number != None:
+            self.stack.append(number)
     
     def op_out_char(self):
         """Piet OUT(CHAR) operation."""
         if len(self.stack) >=1:
             item = self.stack.pop()
-            sys.stdout.write(chr(item))
-            sys.stdout.flush()
+            self.output.write(chr(item))
     
     
 class ColorBlock:
@@ -563,11 +888,24 @@ def print_usage():
     print "\t-h (--help)\t- Prints this help"
     print "\t-d (--debug)\t- Prints debug information"
     print "\t-m (--maxsteps)\t- Sets maximum steps to execute. This is 10^6 by default. Set to -1 for infinite."
+    print "\t-f (--flush) <policy>\t- When to flush output: immediate, newline, size or exit. Immediate on a terminal, size otherwise"
+    print "\t-i (--input) <file>\t- Reads program input from the file instead of stdin"
+    print "\t-n (--nooptimize)\t- Runs every operation on its own instead of fusing runs of stack operations"
+    print "\t-t (--trace) <file>\t- Writes a binary trace of every step to the file"
+    print "\t--tracedeltas <file>\t- As --trace, also recording stack depth changes and the top of the stack"
+    print "\t--profile <file>\t- Writes counts of the operations, blocks and exits the program goes through to a JSON file"
+    print "\t--heatmap <file>\t- Writes an image of how often each codel is gone through"
+    print "\t--timelimit <seconds>\t- Stops the program after this many seconds"
+    print "\t--cpulimit <seconds>\t- Stops the program after it has used this much cpu time"
+    print "\t--stacklimit <items>\t- Stops the program if its stack grows past this many items"
+    print "\t--checkpoint <file>\t- Saves the execution state to the file every so often and at the step limit"
+    print "\t--checkpointevery <steps>\t- Steps between checkpoints. This is 10^6 by default."
+    print "\t--resume <file>\t- Carries on from a checkpoint. Give it the same input; -m still counts from the start"
 
 def getopts():
     """Parses the command line options."""
     try:
-       return getopt.getopt(sys.argv[1:], "hdm:", ["help","debug","maxsteps="])
+       return getopt.getopt(sys.argv[1:], "hdm:f:i:nt:", ["help","debug","maxsteps=","flush=","input=","nooptimize","trace=","tracedeltas=","profile=","heatmap=","timelimit=","cpulimit=","stacklimit=","checkpoint=","checkpointevery=","resume="])
     except getopt.GetoptError, err:
         print str(err)
         print_usage()
@@ -586,11 +924,29 @@ if __name__ == "__main__":
                     print_usage()
                     sys.exit(1)
                 else:
-                    interpreter.set_opt(o,a)
+                    try:
+                        interpreter.set_opt(o,a)
+                    except ValueError:
+                        print_usage()
+                        sys.exit(2)
             if len(args) != 1:
                 print_usage()
                 sys.exit(2)
-            interpreter.run_program(args[0])
+            try:
+                interpreter.run_program(args[0])
+            finally:
+                if interpreter.tracer != None:
+                    interpreter.tracer.close()
+                if interpreter.checkpointer != None:
+                    interpreter.checkpointer.close()
+                if interpreter.profiler != None:
+                    interpreter.profiler.close()
+            if interpreter.exit_reason == "NON_TERMINATING":
+                sys.stderr.write("\nProgram stopped, it would never terminate\n")
+                sys.exit(3)
+            elif interpreter.exit_reason in limit_messages:
+                sys.stderr.write("\nProgram stopped, %s\n" % limit_messages[interpreter.exit_reason])
+                sys.exit(4)
         else:
             print_usage()
     except KeyboardInterrupt:
@@ -0,0 +1,173 @@
+"""Module for the places a piet program's output can be sent. Sinks buffer
+what is written and pass it on according to their flush policy."""
+
+import sys
+import os
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Flush policies
+IMMEDIATE = "immediate"
+NEWLINE = "newline"
+SIZE = "size"
+EXIT = "exit"
+flush_policies = (IMMEDIATE,NEWLINE,SIZE,EXIT)
+
+
+class OutputSink:
+    """Base class for output sinks. Subclasses provide write_out, which gets
+    the buffered text whenever the sink is flushed."""
+    def __init__(self,flush=SIZE,buffer_size=8192):
+        """Initializes new OutputSink."""
+        if flush not in flush_policies:
+            raise ValueError, "UNKNOWN_FLUSH_POLICY"
+        self.flush_policy = flush
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+        #Number of characters flushed so far
+        self.written = 0
+
+    def write(self,text):
+        """Writes some output, flushing if the flush policy says to."""
+        self.buffer.append(text)
+        self.buffered = self.buffered + len(text)
+        if self.flush_policy == IMMEDIATE\
+            or (self.flush_policy == NEWLINE and "\n" in text)\
+            or (self.flush_policy != EXIT and self.buffered >= self.buffer_size):
+                self.flush()
+
+    def flush(self):
+        """Passes on everything buffered so far."""
+        if self.buffer:
+            text = "".join(self.buffer)
+            self.buffer = []
+            self.buffered = 0
+            self.written = self.written + len(text)
+            self.write_out(text)
+
+    def tell(self):
+        """Returns the number of characters written so far."""
+        return self.written + self.buffered
+
+    def close(self):
+        """Flushes the sink. Sinks that own a file close it too."""
+        self.flush()
+
+    def write_out(self,text):
+        """Passes on flushed text."""
+        raise NotImplementedError
+
+
+class MemoryOutput(OutputSink):
+    """Sink that collects output in memory."""
+    def __init__(self,flush=EXIT,buffer_size=8192):
+        """Initializes new MemoryOutput."""
+        OutputSink.__init__(self,flush,buffer_size)
+        self.chunks = []
+
+    def write_out(self,text):
+        """Keeps flushed text."""
+        self.chunks.append(text)
+
+    def getvalue(self):
+        """Returns all the output written so far."""
+        self.flush()
+        return "".join(self.chunks)
+
+
+class FileOutput(OutputSink):
+    """Sink that writes to a file object, or to a file at a path."""
+    def __init__(self,file,flush=SIZE,buffer_size=8192):
+        """Initializes new FileOutput. A path is opened, and closed with the
+        sink."""
+        OutputSink.__init__(self,flush,buffer_size)
+        if isinstance(file,basestring):
+            self.file = open(file,"wb")
+            self.owns_file = True
+        else:
+            self.file = file
+            self.owns_file = False
+
+    def write_out(self,text):
+        """Writes flushed text to the file."""
+        self.file.write(text)
+        self.file.flush()
+
+    def close(self):
+        """Flushes the sink, closing the file if it was opened here."""
+        self.flush()
+        if self.owns_file:
+            self.file.close()
+
+
+class PipeOutput(OutputSink):
+    """Sink that writes to a pipe or other file descriptor."""
+    def __init__(self,fd,flush=SIZE,buffer_size=8192,close_fd=True):
+        """Initializes new PipeOutput."""
+        OutputSink.__init__(self,flush,buffer_size)
+        self.fd = fd
+        self.close_fd = close_fd
+
+    def write_out(self,text):
+        """Writes flushed text to the descriptor."""
+        while text:
+            written = os.write(self.fd,text)
+            text = text[written:]
+
+    def close(self):
+        """Flushes the sink, closing the descriptor if asked to."""
+        self.flush()
+        if self.close_fd:
+            os.close(self.fd)
+
+
+class CallbackOutput(OutputSink):
+    """Sink that passes flushed output to a function, e.g. to push it to a
+    client as it arrives."""
+    def __init__(self,callback,flush=SIZE,buffer_size=8192):
+        """Initializes new CallbackOutput."""
+        OutputSink.__init__(self,flush,buffer_size)
+        self.callback = callback
+
+    def write_out(self,text):
+        """Calls the callback with flushed text."""
+        self.callback(text)
+
+
+class NullOutput(OutputSink):
+    """Sink that throws output away, e.g. when steps are run again."""
+    def __init__(self):
+        """Initializes new NullOutput."""
+        OutputSink.__init__(self,EXIT)
+
+    def write(self,text):
+        """Throws away some output."""
+        pass
+
+    def write_out(self,text):
+        """Throws away flushed text."""
+        pass
+
+
+def stdout_output(flush=None):
+    """Returns a sink for stdout. Unless a policy is given it flushes every
+    write when stdout is a terminal, so interactive programs still work, and
+    buffers by size otherwise."""
+    if flush == None:
+        try:
+            interactive = sys.stdout.isatty()
+        except AttributeError:
+            interactive = False
+        if interactive:
+            flush = IMMEDIATE
+        else:
+            flush = SIZE
+    return FileOutput(sys.stdout,flush)
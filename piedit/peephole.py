@@ -0,0 +1,102 @@
+"""Module for the peephole optimizer for the piet interpreter. Fuses runs of
+stack operations between color blocks into superinstructions and folds the
+values it can work out from the block sizes alone."""
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Longest run of operations fused into one superinstruction
+max_length = 64
+
+#Operations that only touch the stack, so never change the dp, cc or do io
+stack_ops = ("Push","Pop","Add","Subtract","Multiply","Divide","Mod",
+             "Greater","Not","Duplicate","Roll")
+
+#Indexed by operation name, called with (second_item, top_item)
+binary_ops = {
+    "Add":lambda a,b: a+b,
+    "Subtract":lambda a,b: a-b,
+    "Multiply":lambda a,b: a*b,
+    "Divide":lambda a,b: a/b,
+    "Mod":lambda a,b: a%b,
+    "Greater":lambda a,b: int(a>b),
+}
+
+
+class Superinstruction:
+    """Class that represents a fused run of stack operations between color
+    blocks."""
+    def __init__(self,steps,actions,pixel,progress=True):
+        """Initializes new Superinstruction."""
+        #Number of interpreter steps the run stands for
+        self.steps = steps
+        #List of (values to push, operation name or None)
+        self.actions = actions
+        #The pixel the run finishes on
+        self.pixel = pixel
+        #Whether the run always changes the stack, as runs with a push do.
+        #Otherwise its actions are its operations, one for one.
+        self.progress = progress
+
+
+def fold(ops):
+    """Folds a list of (operation name, block size) pairs into a list of
+    (values to push, operation name or None) actions. Values that can be
+    worked out without looking at the stack are pushed as literals, and the
+    remaining operations are left to run against the real stack."""
+    actions = []
+    known = []
+    for name,size in ops:
+        if name == "Push":
+            known.append(size)
+        elif name == "Pop" and len(known) >= 1:
+            known.pop()
+        elif name == "Duplicate" and len(known) >= 1:
+            known.append(known[-1])
+        elif name == "Not" and len(known) >= 1:
+            known.append(int(not known.pop()))
+        elif name in binary_ops and len(known) >= 2 and fold_binary(name,known):
+            pass
+        elif name == "Roll" and len(known) >= 2 and fold_roll(known):
+            pass
+        else:
+            actions.append((known,name))
+            known = []
+    if known:
+        actions.append((known,None))
+    return actions
+
+def fold_binary(name,known):
+    """Folds a binary operation over the top two known values. Returns False
+    if the operation can't be folded."""
+    top_item = known[-1]
+    second_item = known[-2]
+    if name in ("Divide","Mod") and top_item == 0:
+        #Leave it to fail at run time like it would have done
+        return False
+    known[-2:] = [binary_ops[name](second_item,top_item)]
+    return True
+
+def fold_roll(known):
+    """Folds a roll whose depth and count are known and which only reaches
+    known values. Returns False if the roll can't be folded."""
+    num_rolls = known[-1]
+    depth = known[-2]
+    if depth > 0 and num_rolls != 0:
+        #Negative rolls work from the bottom of the stack and deep rolls
+        #depend on its size, so neither can be worked out here
+        if num_rolls < 0 or depth > len(known)-2:
+            return False
+        del known[-2:]
+        num_rolls = num_rolls % depth
+        if num_rolls:
+            known[-depth:] = known[-num_rolls:] + known[-depth:-num_rolls]
+    else:
+        del known[-2:]
+    return True
@@ -0,0 +1,182 @@
+"""Module for profiling piet programs. Counts the operations, color blocks
+and exits a program goes through and times its rolls and white slides, and
+writes them out as JSON or as a heatmap of the program."""
+
+import time
+import math
+import json
+import PIL.Image
+import colors
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+def heat_color(count,maximum):
+    """Returns the (r,g,b) heatmap color for a count, going from black
+    through red and yellow to white on a log scale."""
+    if count <= 0 or maximum <= 0:
+        return (0,0,0)
+    heat = 3*math.log(1+count)/math.log(1+maximum)
+    red = int(255*min(heat,1))
+    green = int(255*min(max(heat-1,0),1))
+    blue = int(255*min(max(heat-2,0),1))
+    return (red,green,blue)
+
+
+class Profiler:
+    """Class that counts what a program does as it runs. Superinstructions
+    are turned off while it is attached to an interpreter, so that every
+    operation is counted."""
+    def __init__(self,json_path=None,heatmap_path=None):
+        """Initializes new Profiler. The profile is written to the paths
+        given when it is closed."""
+        self.json_path = json_path
+        self.heatmap_path = heatmap_path
+        self.interpreter = None
+        #Indexed by opcode
+        self.op_counts = {}
+        #Indexed by color block label
+        self.block_counts = {}
+        #Indexed by (x,y) of white codels, counting every codel a slide
+        #goes through as well as the one it stops on
+        self.white_counts = {}
+        #Indexed by (color block label, dp, cc) the block was left with
+        self.edge_counts = {}
+        self.rolls = 0
+        self.roll_time = 0.0
+        self.white_slides = 0
+        self.white_time = 0.0
+
+    def attach(self,interpreter):
+        """Starts profiling an interpreter, timing its rolls and white
+        slides."""
+        self.interpreter = interpreter
+        interpreter.profiler = self
+        roll = interpreter.roll
+        move_within_white = interpreter.move_within_white
+        def timed_roll(depth,num_rolls):
+            start = time.time()
+            try:
+                roll(depth,num_rolls)
+            finally:
+                self.rolls = self.rolls + 1
+                self.roll_time = self.roll_time + time.time()-start
+        def timed_move_within_white():
+            pixel = interpreter.current_pixel
+            dp = interpreter.dp
+            start = time.time()
+            try:
+                move_within_white()
+            finally:
+                self.white_slides = self.white_slides + 1
+                self.white_time = self.white_time + time.time()-start
+            self.count_slide(pixel,interpreter.current_pixel,dp)
+        interpreter.roll = timed_roll
+        interpreter.move_within_white = timed_move_within_white
+
+    def detach(self):
+        """Stops profiling the interpreter."""
+        del self.interpreter.roll
+        del self.interpreter.move_within_white
+        self.interpreter.profiler = None
+
+    def count_slide(self,start,end,dp):
+        """Counts the white codels slid through along the dp, from start to
+        end. End is counted here however the slide stopped, as a slide
+        stopped by the edge of the program leaves the step at 0."""
+        x_step,y_step = [(1,0),(0,1),(-1,0),(0,-1)][dp]
+        x,y = start.x,start.y
+        while True:
+            self.white_counts[(x,y)] = self.white_counts.get((x,y),0) + 1
+            if (x,y) == (end.x,end.y):
+                break
+            x = x + x_step
+            y = y + y_step
+
+    def record(self,interpreter):
+        """Counts the step the interpreter has just done."""
+        pixel = interpreter.current_pixel
+        if interpreter.step == 1:
+            #Moved to the edge of a block, ready to leave it. White codels
+            #are counted by count_slide.
+            if pixel.set_label != -1:
+                self.block_counts[pixel.set_label] = self.block_counts.get(pixel.set_label,0) + 1
+                key = (pixel.set_label,interpreter.dp,interpreter.cc)
+                self.edge_counts[key] = self.edge_counts.get(key,0) + 1
+        elif interpreter.last_opcode:
+            opcode = interpreter.last_opcode
+            self.op_counts[opcode] = self.op_counts.get(opcode,0) + 1
+
+    def to_dict(self):
+        """Returns the profile as a dict ready to be written as JSON."""
+        op_names = {}
+        for (hue_diff,light_diff),(name,method) in self.interpreter.operations.items():
+            op_names[hue_diff*colors.num_lights+light_diff] = name
+        return {
+            "steps":self.interpreter.current_step,
+            "operations":dict((op_names[opcode],count) for opcode,count in self.op_counts.items()),
+            "blocks":dict((str(label),count) for label,count in self.block_counts.items()),
+            "white_codels":[{"x":x, "y":y, "count":count}
+                for (x,y),count in sorted(self.white_counts.items())],
+            "edges":[{"block":label, "dp":dp, "cc":cc, "count":count}
+                for (label,dp,cc),count in sorted(self.edge_counts.items())],
+            "roll":{"count":self.rolls, "time":self.roll_time},
+            "white_slides":{"count":self.white_slides, "time":self.white_time},
+        }
+
+    def codel_counts(self):
+        """Returns how many times each codel was gone through, row by row.
+        Colored codels get the count of their color block."""
+        interpreter = self.interpreter
+        counts = []
+        for y in xrange(interpreter.height):
+            for x in xrange(interpreter.width):
+                pixel = interpreter.pixels[x][y]
+                if pixel.set_label != -1:
+                    counts.append(self.block_counts.get(pixel.set_label,0))
+                else:
+                    counts.append(self.white_counts.get((x,y),0))
+        return counts
+
+    def heatmap_colors(self):
+        """Returns the hex heatmap color of each codel, row by row, or None
+        for codels that were never gone through."""
+        counts = self.codel_counts()
+        maximum = max(counts)
+        return [count and colors.rgb_to_hex(heat_color(count,maximum)) or None
+            for count in counts]
+
+    def write_json(self,path):
+        """Writes the profile to a JSON file."""
+        file = open(path,"w")
+        try:
+            json.dump(self.to_dict(),file,indent=1,sort_keys=True)
+        finally:
+            file.close()
+
+    def write_heatmap(self,path,scale=1):
+        """Writes a heatmap image with a pixel per codel, or a square of
+        scale pixels per codel."""
+        counts = self.codel_counts()
+        maximum = max(counts)
+        image = PIL.Image.new("RGB",(self.interpreter.width,self.interpreter.height))
+        image.putdata([heat_color(count,maximum) for count in counts])
+        if scale > 1:
+            image = image.resize((image.size[0]*scale,image.size[1]*scale),PIL.Image.NEAREST)
+        image.save(path)
+
+    def close(self):
+        """Writes the profile to the paths it was given."""
+        if self.interpreter == None or self.interpreter.pixels == None:
+            return
+        if self.json_path != None:
+            self.write_json(self.json_path)
+        if self.heatmap_path != None:
+            self.write_heatmap(self.heatmap_path)
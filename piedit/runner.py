@@ -0,0 +1,207 @@
+"""Module for running programs from the editor in child processes, so a run
+doesn't hold up the editor, or other runs, on the interpreter lock. The
+codels are handed to the child in shared memory, and its output, progress
+and result come back down a pipe that is read from the GTK main loop."""
+
+import os
+import sys
+import time
+import ctypes
+import multiprocessing
+import gobject
+import piedit.interpreter
+import piedit.outputsink
+import piedit.inputsource
+import piedit.profiler
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+#Seconds a run is given to stop by itself once asked to before it is killed
+kill_grace = 1.0
+
+#Times a second a run sends how far it has got, if it is asked to
+progress_rate = 30
+
+
+class SharedProgram:
+    """Class for a copy of a document's codels in shared memory, with the
+    fields the interpreter loads a document from."""
+    def __init__(self,document):
+        """Initializes new SharedProgram, copying the codels in one go."""
+        self.width = document.width
+        self.height = document.height
+        self.stride = document.stride
+        self.palette = list(document.palette)
+        self.data = multiprocessing.RawArray("B",document.stride*document.height)
+        ctypes.memmove(self.data,document.data.buffer_info()[0],len(self.data))
+
+
+class ChildRun:
+    """Class for a run in the child process. The interpreter looks at it to
+    see whether it should stop, as it would at its thread, and progress is
+    sent when the interpreter checks its limits."""
+    def __init__(self,conn,stop,progress):
+        """Initializes new ChildRun."""
+        self.conn = conn
+        self.stop = stop
+        self.progress = progress
+        self.should_stop = False
+        self.next_progress = 0
+        self.interpreter = None
+
+    def attach(self,interpreter):
+        """Starts checking for the stop event and sending progress whenever
+        the interpreter checks its limits."""
+        self.interpreter = interpreter
+        interpreter.thread = self
+        check_limits = interpreter.check_limits
+        def reporting_check_limits():
+            self.should_stop = self.stop.is_set()
+            if self.progress and time.time() >= self.next_progress:
+                self.send_progress()
+            return check_limits()
+        interpreter.check_limits = reporting_check_limits
+
+    def send_progress(self):
+        """Sends the step, position, dp, cc and stack depth."""
+        interpreter = self.interpreter
+        pixel = interpreter.current_pixel
+        self.conn.send(("progress",{
+            "step":interpreter.current_step,
+            "x":pixel.x,
+            "y":pixel.y,
+            "dp":interpreter.dp,
+            "cc":interpreter.cc,
+            "stack_depth":len(interpreter.stack),
+        }))
+        self.next_progress = time.time()+1.0/progress_rate
+
+
+def run_child(program,conn,stop,flush,input_fd,progress,profile):
+    """Runs a shared program in a child process, sending output, progress and
+    then the result back down the connection. Input is read from input_fd,
+    or there is none if it is None."""
+    output = piedit.outputsink.CallbackOutput(lambda text: conn.send(("output",text)),
+        flush=flush,buffer_size=4096)
+    if input_fd != None:
+        sys.stdin = os.fdopen(input_fd,"r")
+        input = piedit.inputsource.stdin_input()
+    else:
+        input = piedit.inputsource.StringInput("")
+    interpreter = piedit.interpreter.Interpreter(output=output,input=input)
+    ChildRun(conn,stop,progress).attach(interpreter)
+    if profile:
+        profiler = piedit.profiler.Profiler()
+        profiler.attach(interpreter)
+    result = {}
+    try:
+        interpreter.run_program(document=program)
+        result["exit_reason"] = interpreter.exit_reason
+        if profile:
+            result["heatmap"] = profiler.heatmap_colors()
+    except Exception, e:
+        result["exit_reason"] = "ERROR"
+        result["error"] = "%s: %s" % (e.__class__.__name__,e)
+    result["steps"] = interpreter.current_step
+    conn.send(("result",result))
+    conn.close()
+
+
+class ProcessRunner:
+    """Class that runs a document in a child process. Output is written to
+    stdout, or passed to output if given. Progress dicts are passed to
+    progress if given, and the result dict, with its exit reason, steps and
+    the heatmap if profiling, to callback, each along with the runner. All
+    of them are called from the GTK main loop."""
+    def __init__(self,document,callback,output=None,progress=None,profile=False):
+        """Initializes new ProcessRunner."""
+        self.program = SharedProgram(document)
+        self.callback = callback
+        self.output = output or self.write_output
+        self.progress = progress
+        self.profile = profile
+        self.stop_event = multiprocessing.Event()
+        self.process = None
+        self.conn = None
+        self.finished = False
+
+    def start(self):
+        """Starts the child process and watches its pipe."""
+        try:
+            interactive = sys.stdout.isatty()
+        except AttributeError:
+            interactive = False
+        if interactive:
+            flush = piedit.outputsink.IMMEDIATE
+        else:
+            flush = piedit.outputsink.NEWLINE
+        #The child's stdin is closed when it starts, so it gets a copy
+        try:
+            input_fd = os.dup(sys.stdin.fileno())
+        except (AttributeError,ValueError,OSError):
+            input_fd = None
+        self.conn,child_conn = multiprocessing.Pipe(False)
+        self.process = multiprocessing.Process(target=run_child,
+            args=(self.program,child_conn,self.stop_event,flush,input_fd,
+                self.progress != None,self.profile))
+        self.process.daemon = True
+        try:
+            self.process.start()
+        finally:
+            child_conn.close()
+            if input_fd != None:
+                os.close(input_fd)
+        gobject.io_add_watch(self.conn.fileno(),gobject.IO_IN|gobject.IO_HUP,self.receive)
+
+    def receive(self,fd,condition):
+        """Passes on whatever the child has sent. Returns False once the run
+        is over, to stop being called."""
+        try:
+            while self.conn.poll():
+                kind,value = self.conn.recv()
+                if kind == "output":
+                    self.output(value)
+                elif kind == "progress":
+                    self.progress(self,value)
+                else:
+                    self.finish(value)
+                    return False
+        except (EOFError,IOError):
+            if self.stop_event.is_set():
+                self.finish({"exit_reason":"STOPPED"})
+            else:
+                self.finish({"exit_reason":"CRASHED"})
+            return False
+        return True
+
+    def write_output(self,text):
+        """Writes output to stdout straight away."""
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def stop(self):
+        """Asks the run to stop, and kills it if it hasn't within
+        kill_grace seconds."""
+        self.stop_event.set()
+        gobject.timeout_add(int(kill_grace*1000),self.kill)
+
+    def kill(self):
+        """Kills the child process if it is still going."""
+        if not self.finished and self.process.is_alive():
+            self.process.terminate()
+        return False
+
+    def finish(self,result):
+        """Cleans up after the child and passes on the result."""
+        self.finished = True
+        self.process.join()
+        self.conn.close()
+        self.callback(self,result)
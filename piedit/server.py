@@ -0,0 +1,294 @@
+"""Module for a long-lived local execution service. Programs are decoded and
+scanned once and kept in memory by content hash, and each run is done in a
+forked worker that shares the loaded program.
+
+POST /run?input=...&max_steps=...&time_limit=... with an image as the body
+runs it, and POST /run/<hash>?max_steps=... with the input as the body runs
+a program sent before. The response is a stream of JSON lines: output as it
+is produced, then a final line with the exit reason and steps."""
+
+import os
+import time
+import getopt
+import json
+import hashlib
+import threading
+import multiprocessing
+import urlparse
+import StringIO
+import BaseHTTPServer
+import SocketServer
+import piedit.interpreter
+import piedit.outputsink
+import piedit.inputsource
+import piedit.cache
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+#Seconds past its time limit that a run is killed if the interpreter hasn't
+#stopped it by itself
+kill_grace = 1.0
+
+
+def run_child(interpreter,text,max_steps,time_limit,conn):
+    """Runs a loaded program against some input in a forked worker, sending
+    output and then the result back down the connection."""
+    output = piedit.outputsink.CallbackOutput(lambda text: conn.send(("output",text)),
+        flush=piedit.outputsink.NEWLINE,buffer_size=4096)
+    interpreter.max_steps = max_steps
+    interpreter.time_limit = time_limit
+    interpreter.reset(output,piedit.inputsource.StringInput(text))
+    result = {}
+    try:
+        interpreter.start_execution()
+        result["exit_reason"] = interpreter.exit_reason
+    except Exception, e:
+        result["exit_reason"] = "ERROR"
+        result["error"] = "%s: %s" % (e.__class__.__name__,e)
+    result["steps"] = interpreter.current_step
+    result["input_read"] = interpreter.input_read
+    conn.send(("result",result))
+    conn.close()
+
+
+class ExecutionService:
+    """Mixin for the servers that keeps the loaded programs and runs them."""
+    def init_service(self,workers,cache_size,max_steps,time_limit,result_cache_size=256):
+        """Sets up the program and result caches and worker limits. Results
+        aren't cached if result_cache_size is 0."""
+        self.programs = piedit.cache.LRUCache(cache_size)
+        #Content hashes by the hash of the request body they came in
+        self.bodies = piedit.cache.LRUCache(cache_size)
+        if result_cache_size:
+            self.results = piedit.cache.ResultCache(result_cache_size)
+        else:
+            self.results = None
+        self.workers = threading.Semaphore(workers)
+        self.max_steps = max_steps
+        self.time_limit = time_limit
+        self.daemon_threads = True
+
+    def load(self,data):
+        """Returns the hash and loaded interpreter for an image, loading it
+        if it isn't cached already. Bodies seen before are found by a hash of
+        their bytes, so only new ones are decoded to find their content
+        hash."""
+        body_key = hashlib.sha1(data).hexdigest()
+        key = self.bodies.get(body_key)
+        if key != None:
+            interpreter = self.programs.get(key)
+            if interpreter != None:
+                return key,interpreter
+        key = piedit.interpreter.image_hash(piedit.interpreter.open_image(StringIO.StringIO(data)))
+        self.bodies.put(body_key,key)
+        interpreter = self.programs.get(key)
+        if interpreter == None:
+            interpreter = piedit.interpreter.Interpreter(
+                output=piedit.outputsink.MemoryOutput(),
+                input=piedit.inputsource.StringInput(""))
+            interpreter.load_program(StringIO.StringIO(data))
+            self.programs.put(key,interpreter)
+        return key,interpreter
+
+    def run(self,key,interpreter,text,max_steps,time_limit):
+        """Generator that runs a loaded program in a forked worker and yields
+        messages for the client: output as it comes, then the result. Runs
+        that read no input are answered from the result cache next time,
+        unless they have a time limit."""
+        if self.results != None and not time_limit:
+            result = self.results.lookup(key,max_steps)
+            if result != None:
+                if result["output"]:
+                    yield {"output":result.pop("output")}
+                else:
+                    del result["output"]
+                yield result
+                return
+        self.workers.acquire()
+        parent_conn,child_conn = multiprocessing.Pipe(False)
+        process = multiprocessing.Process(target=run_child,
+            args=(interpreter,text,max_steps,time_limit or None,child_conn))
+        process.daemon = True
+        try:
+            process.start()
+            child_conn.close()
+            output = []
+            if time_limit:
+                deadline = time.time()+time_limit+kill_grace
+            else:
+                deadline = None
+            while True:
+                if deadline == None:
+                    timeout = None
+                else:
+                    timeout = max(0,deadline-time.time())
+                if not parent_conn.poll(timeout):
+                    yield {"exit_reason":"TIME_LIMIT"}
+                    return
+                try:
+                    kind,value = parent_conn.recv()
+                except EOFError:
+                    yield {"exit_reason":"CRASHED"}
+                    return
+                if kind == "output":
+                    chunk = value.decode("latin-1")
+                    output.append(chunk)
+                    yield {"output":chunk}
+                else:
+                    if self.results != None and not time_limit:
+                        value["output"] = "".join(output)
+                        self.results.store(key,max_steps,value)
+                        del value["output"]
+                    yield value
+                    return
+        finally:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            parent_conn.close()
+            self.workers.release()
+
+
+class ExecutionServer(SocketServer.ThreadingMixIn,BaseHTTPServer.HTTPServer,ExecutionService):
+    """Class for the service on a TCP port."""
+
+
+class UnixExecutionServer(SocketServer.ThreadingMixIn,SocketServer.UnixStreamServer,ExecutionService):
+    """Class for the service on a Unix socket."""
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Class that handles requests to run programs."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        """Handles a run request."""
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        parts = url.path.strip("/").split("/")
+        body = self.rfile.read(int(self.headers.get("Content-Length",0)))
+        if parts[0] != "run" or len(parts) > 2:
+            return self.send_json(404,{"error":"NOT_FOUND"})
+        try:
+            max_steps = int(query.get("max_steps",self.server.max_steps))
+            time_limit = float(query.get("time_limit",self.server.time_limit or 0))
+        except ValueError:
+            return self.send_json(400,{"error":"BAD_LIMIT"})
+
+        if len(parts) == 2:
+            key = parts[1]
+            interpreter = self.server.programs.get(key)
+            if interpreter == None:
+                return self.send_json(404,{"error":"PROGRAM_NOT_FOUND"})
+            text = body
+        else:
+            try:
+                key,interpreter = self.server.load(body)
+            except IOError:
+                return self.send_json(400,{"error":"IMAGE_NOT_LOADED"})
+            text = query.get("input","")
+
+        self.send_response(200)
+        self.send_header("Content-Type","application/x-ndjson")
+        self.send_header("Transfer-Encoding","chunked")
+        self.send_header("X-Program-Hash",key)
+        self.end_headers()
+        for message in self.server.run(key,interpreter,text,max_steps,time_limit):
+            self.write_chunk(json.dumps(message)+"\n")
+        self.write_chunk("")
+
+    def send_json(self,code,message):
+        """Sends a whole JSON response."""
+        data = json.dumps(message)+"\n"
+        self.send_response(code)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_chunk(self,data):
+        """Writes a chunk of a chunked response. An empty chunk ends it."""
+        self.wfile.write("%x\r\n%s\r\n" % (len(data),data))
+        self.wfile.flush()
+
+    def address_string(self):
+        """Returns the client address for logging."""
+        if isinstance(self.client_address,tuple):
+            return BaseHTTPServer.BaseHTTPRequestHandler.address_string(self)
+        return "unix"
+
+
+def print_usage():
+    """Prints usage string for command line."""
+    print "Usage: piedit.py serve [<options>]"
+    print "options:"
+    print "\t-h (--help)\t- Prints this help"
+    print "\t-p (--port)\t- Port to listen on at localhost. This is 8314 by default."
+    print "\t-s (--socket)\t- Unix socket to listen on instead of a port"
+    print "\t-j (--jobs)\t- Number of programs to run at once. This is the number of cores by default."
+    print "\t-c (--cachesize)\t- Number of loaded programs to keep. This is 64 by default."
+    print "\t-m (--maxsteps)\t- Default maximum steps for each run. This is 10^6 by default. Set to -1 for infinite."
+    print "\t-t (--timelimit)\t- Default wall clock limit in seconds for each run."
+    print "\t-r (--resultcache)\t- Number of results to keep for programs that read no input. This is 256 by default."
+    print "\t--nocache\t- Always run programs, even if they read no input."
+
+def main(args):
+    """Runs the serve command line. Returns the exit status."""
+    try:
+        opts,args = getopt.getopt(args, "hp:s:j:c:m:t:r:",
+            ["help","port=","socket=","jobs=","cachesize=","maxsteps=","timelimit=",
+             "resultcache=","nocache"])
+    except getopt.GetoptError, err:
+        print str(err)
+        print_usage()
+        return 2
+    port = 8314
+    socket_path = None
+    workers = multiprocessing.cpu_count()
+    cache_size = 64
+    max_steps = 1000000
+    time_limit = None
+    result_cache_size = 256
+    for o,a in opts:
+        if o in ["-h","--help"]:
+            print_usage()
+            return 1
+        elif o in ["-p","--port"]:
+            port = int(a)
+        elif o in ["-s","--socket"]:
+            socket_path = a
+        elif o in ["-j","--jobs"]:
+            workers = int(a)
+        elif o in ["-c","--cachesize"]:
+            cache_size = int(a)
+        elif o in ["-m","--maxsteps"]:
+            max_steps = int(a)
+        elif o in ["-t","--timelimit"]:
+            time_limit = float(a)
+        elif o in ["-r","--resultcache"]:
+            result_cache_size = int(a)
+        elif o == "--nocache":
+            result_cache_size = 0
+    if args:
+        print_usage()
+        return 2
+    if socket_path != None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixExecutionServer(socket_path,RequestHandler)
+    else:
+        server = ExecutionServer(("127.0.0.1",port),RequestHandler)
+    server.init_service(workers,cache_size,max_steps,time_limit,result_cache_size)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
@@ -0,0 +1,98 @@
+"""Module for running many piet programs cooperatively in one thread. Each
+session runs a slice of steps at a time and gives control back, and a
+session that needs input waits for it to be fed in instead of blocking."""
+
+import piedit.interpreter
+import piedit.inputsource
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Session states
+RUNNING = "RUNNING"
+WAITING_INPUT = "WAITING_INPUT"
+FINISHED = "FINISHED"
+
+
+class Session:
+    """Class that runs a loaded program a slice of steps at a time. Input is
+    fed in with feed as it arrives."""
+    def __init__(self,interpreter,slice_steps=10000):
+        """Initializes new Session, giving the interpreter a QueueInput."""
+        self.interpreter = interpreter
+        self.input = piedit.inputsource.QueueInput()
+        self.interpreter.input = self.input
+        self.slice_steps = slice_steps
+        self.state = RUNNING
+
+    def feed(self,text):
+        """Feeds some input to the program."""
+        self.input.feed(text)
+        if self.state == WAITING_INPUT:
+            self.state = RUNNING
+
+    def close_input(self):
+        """Marks the end of the program's input."""
+        self.input.close()
+        if self.state == WAITING_INPUT:
+            self.state = RUNNING
+
+    def run_slice(self):
+        """Runs a slice of steps and returns the new state."""
+        if self.state != RUNNING:
+            return self.state
+        try:
+            self.interpreter.run_steps(self.slice_steps)
+        except piedit.inputsource.InputPending:
+            self.state = WAITING_INPUT
+            return self.state
+        if self.interpreter.finished:
+            self.state = FINISHED
+        return self.state
+
+
+class Scheduler:
+    """Class that shares one thread between many sessions, running a slice
+    of each session that isn't waiting for input in turn. Hosts call
+    run_once from their own event loop, e.g. from an idle callback."""
+    def __init__(self):
+        """Initializes new Scheduler."""
+        self.sessions = []
+        #Called with each session as it finishes
+        self.finished_callbacks = []
+
+    def add(self,session):
+        """Adds a session to be run."""
+        self.sessions.append(session)
+
+    def remove(self,session):
+        """Stops running a session."""
+        self.sessions.remove(session)
+
+    def run_once(self):
+        """Runs a slice of every running session. Finished sessions are
+        removed. Returns True if any session is still running, so there is
+        more to do straight away."""
+        running = False
+        for session in list(self.sessions):
+            state = session.run_slice()
+            if state == FINISHED:
+                self.sessions.remove(session)
+                for callback in self.finished_callbacks:
+                    callback(session)
+            elif state == RUNNING:
+                running = True
+        return running
+
+
+def load_session(path,max_steps=1000000,output=None,slice_steps=10000):
+    """Loads the program at the path and returns a Session for it."""
+    interpreter = piedit.interpreter.Interpreter(max_steps=max_steps,output=output)
+    interpreter.load_program(path)
+    return Session(interpreter,slice_steps)
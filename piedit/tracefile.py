@@ -0,0 +1,95 @@
+"""Module for streaming a binary trace of a piet program's execution to a
+file, and reading it back for analysis. A trace is a short header followed
+by one fixed-size record per step."""
+
+import struct
+import collections
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+magic = "PIET"
+version = 1
+
+#Header flags
+STACK_DELTAS = 1
+
+#magic, version, flags
+header = struct.Struct("<4sBB")
+#step, block label, dp, cc, opcode, stack depth
+record = struct.Struct("<qiBBBI")
+#As above plus the change in stack depth and the item on top of the stack
+delta_record = struct.Struct("<qiBBBIiq")
+
+#Top of stack values outside this range are written as the nearest limit
+max_top = 2**63-1
+min_top = -2**63
+
+TraceRecord = collections.namedtuple("TraceRecord",
+    "step block dp cc opcode depth depth_change top")
+
+
+class TraceWriter:
+    """Class that streams trace records to a file. Opcodes are
+    hue_change*3+light_change, so 0 means no operation was done."""
+    def __init__(self,path,stack_deltas=False,buffer_size=65536):
+        """Initializes new TraceWriter and writes the header."""
+        self.file = open(path,"wb",buffer_size)
+        self.stack_deltas = stack_deltas
+        self.last_depth = 0
+        flags = 0
+        if stack_deltas:
+            flags = flags | STACK_DELTAS
+        self.file.write(header.pack(magic,version,flags))
+
+    def record(self,step,block,dp,cc,opcode,stack):
+        """Writes a record for a step."""
+        depth = len(stack)
+        if self.stack_deltas:
+            if stack:
+                top = max(min_top,min(max_top,stack[-1]))
+            else:
+                top = 0
+            self.file.write(delta_record.pack(step,block,dp,cc,opcode,depth,
+                depth-self.last_depth,top))
+            self.last_depth = depth
+        else:
+            self.file.write(record.pack(step,block,dp,cc,opcode,depth))
+
+    def close(self):
+        """Flushes and closes the trace file."""
+        self.file.close()
+
+
+def read_trace(path,chunk_records=4096):
+    """Generator that yields a TraceRecord for each step in a trace file.
+    Traces without stack deltas give 0 for depth_change and top."""
+    trace_file = open(path,"rb")
+    try:
+        data = trace_file.read(header.size)
+        if len(data) < header.size:
+            raise IOError, "TRACE_TRUNCATED"
+        file_magic,file_version,flags = header.unpack(data)
+        if file_magic != magic or file_version != version:
+            raise IOError, "TRACE_NOT_RECOGNISED"
+        if flags & STACK_DELTAS:
+            fmt = delta_record
+        else:
+            fmt = record
+        while True:
+            data = trace_file.read(fmt.size*chunk_records)
+            if not data:
+                return
+            for offset in xrange(0,len(data)-fmt.size+1,fmt.size):
+                values = fmt.unpack_from(data,offset)
+                if fmt is record:
+                    values = values + (0,0)
+                yield TraceRecord(*values)
+    finally:
+        trace_file.close()
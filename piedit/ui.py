@@ -2,16 +2,24 @@
 
 import sys
 import os
-import threading
 import time
+import collections
 import pygtk
 import gtk
+import gobject
 import gnome.ui
 import string
 import PIL.Image
 import piedit.colors
 import piedit.interpreter
 import piedit.debug
+import piedit.profiler
+import piedit.deltalog
+import piedit.breakpoints
+import piedit.document
+import piedit.undo
+import piedit.runner
+import piedit.export
 pygtk.require("2.0")
 
 __author__ = "Steven Anderson"
@@ -23,25 +31,11 @@ __maintainer__ = "Steven Anderson"
 __email__ = "steven.james.anderson@googlemail.com"
 __status__ = "Production"
 
+#Names of the dp and cc values, for the status bar
+dp_names = ("right","down","left","up")
+cc_names = ("left","right")
+
 
-class InterpreterThread(threading.Thread):
-    def __init__(self,pixels,width,height,callback=None,debug=False):
-        self.should_stop = False
-        self.interpreter = piedit.interpreter.Interpreter(thread=self)
-        self.interpreter.debug.DEBUG = debug
-        self.pixels = pixels
-        self.width = width
-        self.height = height
-        self.callback = callback
-        threading.Thread.__init__(self)
-        
-    def run(self):
-        self.interpreter.run_program(pixels=self.pixels,width=self.width,height=self.height)
-        self.callback(self.should_stop)
-        
-    def stop(self):
-        self.should_stop = True
-        
 class Handlers:
     """Defines the signal handlers for the ui"""
     
@@ -51,14 +45,17 @@ class Handlers:
         self.file_filter = gtk.FileFilter()
         self.file_filter.add_pattern("*.png")
         self.file_filter.set_name("PNG Files")
+        self.gif_filter = gtk.FileFilter()
+        self.gif_filter.add_pattern("*.gif")
+        self.gif_filter.set_name("GIF Files")
+        #Runs going on in child processes
+        self.runners = []
 
     def on_mainApp_delete_event(self, *args):
         """Handler for application close"""
         if self._ui.save_changes():
-            try:
-                self.interpreter_thread.stop()
-            except:
-                pass
+            for runner in self.runners:
+                runner.kill()
             gtk.main_quit()
 
     #File Menu
@@ -110,48 +107,177 @@ class Handlers:
             fileChooser.destroy()
             return False
         
+    def on_fileExportMenuItem_activate(self, *args):
+        """Handler for File|Export menu item. Writes the program as a PNG or
+        GIF with a given number of pixels across each codel."""
+        fileChooser = gtk.FileChooserDialog(
+            title="Export", 
+            action=gtk.FILE_CHOOSER_ACTION_SAVE,
+            buttons=(gtk.STOCK_CANCEL,gtk.RESPONSE_CANCEL,gtk.STOCK_SAVE,gtk.RESPONSE_OK))
+        fileChooser.add_filter(self.file_filter)
+        fileChooser.add_filter(self.gif_filter)
+        fileChooser.set_do_overwrite_confirmation(True)
+        response = fileChooser.run()
+        filename = fileChooser.get_filename()
+        if fileChooser.get_filter() is self.gif_filter:
+            extension = ".gif"
+        else:
+            extension = ".png"
+        fileChooser.destroy()
+        if response != gtk.RESPONSE_OK or filename == None:
+            return
+        if not filename.lower().endswith((".png",".gif")):
+            filename = filename + extension
+        codel_size = self._ui.message_handler.ask_codel_size()
+        if codel_size != None:
+            self._ui.export_image(filename,codel_size)
+
     def on_fileQuitMenuItem_activate(self, *args):
         """Handler for File|Quit menu item"""
         if self._ui.save_changes():
             gtk.main_quit()
     
+    #Edit Menu
+    def on_editUndoMenuItem_activate(self,*args):
+        """Handler for Edit|Undo menu item"""
+        self._ui.undo()
+
+    def on_editRedoMenuItem_activate(self,*args):
+        """Handler for Edit|Redo menu item"""
+        self._ui.redo()
+
     #Run Menu                  
     def on_runRunMenuItem_activate(self,*args):
         """Handler for Run|Run menu item"""
+        self.start_run()
+    
+    def on_runLiveMenuItem_activate(self,*args):
+        """Handler for Run|Live Run menu item. Runs at full speed and shows
+        where the program has got to a few times a second."""
+        self.start_run(live=True)
+    
+    def on_runProfileMenuItem_activate(self,*args):
+        """Handler for Run|Profile menu item. Shows a heatmap of the run over
+        the program when it finishes."""
+        self.start_run(profile=True)
+
+    def start_run(self,live=False,profile=False):
+        """Runs the program in a child process, alongside any other runs. A
+        live run shows where it has got to, and only the latest live run is
+        shown."""
         self.run_mode = "Run"
-        self.set_run_menu(running=True,status="Running...")
-        self.interpreter_thread = InterpreterThread(pixels=self._ui.pixels,width=self._ui.width,height=self._ui.height,callback=self.thread_end_callback,debug=False)
-        self.interpreter_thread.start()
+        self._ui.set_heatmap(None)
+        if live:
+            runner = piedit.runner.ProcessRunner(self._ui.document,self.run_end_callback,
+                progress=self._ui.update_live_view)
+            self._ui.start_live_view(runner)
+        else:
+            runner = piedit.runner.ProcessRunner(self._ui.document,self.run_end_callback,
+                profile=profile)
+        runner.start()
+        self.runners.append(runner)
+        self.set_run_menu(running=True,status=self.run_status())
+
+    def run_status(self):
+        """Returns the status bar text for the runs going on."""
+        if len(self.runners) == 1:
+            return "Running..."
+        return "Running %d programs..." % len(self.runners)
     
     def on_runDebugMenuItem_activate(self,*args):
         """Handler for Run|Debug menu item"""
         self.run_mode = "Debug"
         self.set_run_menu(running=True,status="Debugging...",debug=True)
+        self._ui.set_heatmap(None)
         self._ui.interpreter = piedit.interpreter.Interpreter()
         self._ui.interpreter.debug.DEBUG = True
-        self._ui.interpreter.run_program(pixels=self._ui.pixels,width=self._ui.width,height=self._ui.height,start=False)
+        self._ui.interpreter.run_program(document=self._ui.document,start=False)
+        self._ui.history = piedit.deltalog.DeltaLog(self._ui.interpreter)
+        self._ui.breakpoints.attach(self._ui.interpreter)
         self._ui.highlight_pixel(0,0)
     
     def on_runStepMenuItem_activate(self,*args):
-        if self._ui.interpreter.do_next_debug_step():
-            self._ui.highlight_pixel(self._ui.interpreter.current_pixel.x,self._ui.interpreter.current_pixel.y)
+        self._ui.breakpoints.resume()
+        self.show_debug_state(self._ui.history.step_forward())
+
+    def on_runStepBackMenuItem_activate(self,*args):
+        """Handler for Run|Previous Step menu item"""
+        if self._ui.history.step_back():
+            self.show_debug_state(True)
+
+    def on_runJumpMenuItem_activate(self,*args):
+        """Handler for Run|Jump to Step menu item"""
+        step = self._ui.message_handler.ask_step(self._ui.interpreter.current_step)
+        if step == None:
+            return
+        self._ui.breakpoints.resume()
+        self._ui.history.jump_to(step)
+        self.show_debug_state(not self._ui.interpreter.finished)
+
+    def on_runContinueMenuItem_activate(self,*args):
+        """Handler for Run|Continue menu item. Runs at full speed until a
+        breakpoint is hit or the program finishes."""
+        self._ui.breakpoints.resume()
+        self._ui.history.run_on(self._ui.breakpoints.next_step(self._ui.interpreter.current_step))
+        self.show_debug_state(not self._ui.interpreter.finished)
+
+    def on_runAddBreakpointMenuItem_activate(self,*args):
+        """Handler for Run|Add Breakpoint menu item"""
+        text = self._ui.message_handler.ask_breakpoint()
+        if text != None:
+            try:
+                self._ui.breakpoints.add(text)
+            except ValueError:
+                self._ui.message_handler.handle_error("BAD_BREAKPOINT")
+            self._ui.draw_program_table()
+
+    def on_runClearBreakpointsMenuItem_activate(self,*args):
+        """Handler for Run|Clear Breakpoints menu item"""
+        self._ui.breakpoints.clear()
+        self._ui.draw_program_table()
+
+    def show_debug_state(self,running):
+        """Updates the run menu and highlighted codel after the debugger has
+        moved. A breakpoint being hit leaves the program running."""
+        interpreter = self._ui.interpreter
+        if running or interpreter.exit_reason == "BREAKPOINT":
+            self.set_run_menu(running=True,status="Debugging...",debug=True)
+            self.show_debug_position()
         else:
-            self.set_run_menu(running=False,status="Complete")
+            self.set_run_menu(running=False,status="Complete",history=True)
+            self._ui.highlight_pixel(interpreter.current_pixel.x,interpreter.current_pixel.y)
+
+    def show_debug_position(self):
+        """Highlights the current codel and shows the step, and any breakpoint
+        hit, in the status bar."""
+        interpreter = self._ui.interpreter
+        self._ui.highlight_pixel(interpreter.current_pixel.x,interpreter.current_pixel.y)
+        status = "Debugging... step %d" % interpreter.current_step
+        if interpreter.exit_reason == "BREAKPOINT":
+            status = "%s, stopped at %s" % (status,self._ui.breakpoints.hit_reason)
+        self._ui.gladeui.get_widget("statusBar").set_status(status)
 
     def on_runStopMenuItem_activate(self,*args):
         if self.run_mode == "Run":
-            self.interpreter_thread.stop()
+            for runner in self.runners:
+                runner.stop()
         elif self.run_mode == "Debug":
-            self.thread_end_callback(self._ui.interpreter.debug.DEBUG)
+            self.set_run_menu(running=False,status="Cancelled")
         
-    def set_run_menu(self,running,status,debug=False):
+    def set_run_menu(self,running,status,debug=False,history=False):
+        self._ui.gladeui.get_widget("runStepBackMenuItem").set_sensitive((running and debug) or history)
+        self._ui.gladeui.get_widget("runJumpMenuItem").set_sensitive((running and debug) or history)
+        self._ui.gladeui.get_widget("runContinueMenuItem").set_sensitive(running and debug)
         if running:
-            self._ui.gladeui.get_widget("runRunMenuItem").set_sensitive(False)
+            #Runs are in their own processes, so more can be started
+            self._ui.gladeui.get_widget("runRunMenuItem").set_sensitive(not debug)
             self._ui.gladeui.get_widget("runDebugMenuItem").set_sensitive(False)
+            self._ui.gladeui.get_widget("runProfileMenuItem").set_sensitive(not debug)
+            self._ui.gladeui.get_widget("runLiveMenuItem").set_sensitive(not debug)
             self._ui.gladeui.get_widget("runStopMenuItem").set_sensitive(True)
             self._ui.gladeui.get_widget("runStepMenuItem").set_sensitive(debug)
             
-            self._ui.gladeui.get_widget("toolbarRun").set_sensitive(False)
+            self._ui.gladeui.get_widget("toolbarRun").set_sensitive(not debug)
             self._ui.gladeui.get_widget("toolbarDebug").set_sensitive(False)
             self._ui.gladeui.get_widget("toolbarStop").set_sensitive(True)
             self._ui.gladeui.get_widget("toolbarStep").set_sensitive(debug)
@@ -160,6 +286,8 @@ class Handlers:
             self._ui.gladeui.get_widget("runStepMenuItem").set_sensitive(False)
             self._ui.gladeui.get_widget("runRunMenuItem").set_sensitive(True)
             self._ui.gladeui.get_widget("runDebugMenuItem").set_sensitive(True)
+            self._ui.gladeui.get_widget("runProfileMenuItem").set_sensitive(True)
+            self._ui.gladeui.get_widget("runLiveMenuItem").set_sensitive(True)
        
             self._ui.gladeui.get_widget("toolbarStop").set_sensitive(False)
             self._ui.gladeui.get_widget("toolbarStep").set_sensitive(False)
@@ -168,12 +296,35 @@ class Handlers:
             
         self._ui.gladeui.get_widget("statusBar").set_status(status)
     
-    def thread_end_callback(self,was_cancelled):
-        """Function to be called when the thread stops executing."""
-        if was_cancelled:
-            self.set_run_menu(running=False,status="Cancelled")
+    def run_end_callback(self,runner,result):
+        """Function to be called when a run in a child process is over."""
+        self.runners.remove(runner)
+        if runner is self._ui.live_runner:
+            self._ui.stop_live_view()
+        if "heatmap" in result:
+            self._ui.set_heatmap(result["heatmap"])
+        if self.runners:
+            status = self.run_status()
+        elif result["exit_reason"] == "STOPPED":
+            status = "Cancelled"
+        elif result["exit_reason"] in ("ERROR","CRASHED"):
+            status = "Failed"
         else:
-            self.set_run_menu(running=False,status="Complete")
+            status = "Complete"
+        self.set_run_menu(running=bool(self.runners),status=status)
+    #View Menu
+    def on_viewZoomInMenuItem_activate(self,*args):
+        """Handler for View|Zoom In menu item"""
+        self._ui.set_zoom(self._ui.zoom+1)
+
+    def on_viewZoomOutMenuItem_activate(self,*args):
+        """Handler for View|Zoom Out menu item"""
+        self._ui.set_zoom(self._ui.zoom-1)
+
+    def on_viewZoomFitMenuItem_activate(self,*args):
+        """Handler for View|Best Fit menu item"""
+        self._ui.zoom_to_fit()
+
     #Help Menu
     def on_helpHelpMenuItem_activate(self,*args):
         print "Help | Help"
@@ -201,23 +352,59 @@ class Handlers:
     def on_toolbarStep_clicked(self,*args):
         return self.on_runStepMenuItem_activate(*args)
     
-    def on_toolbarStop_clicked(self,*args):
+    def on_toolbarStop_clicked(self,*args):
         return self.on_runStopMenuItem_activate(*args)
     
     def on_toolbarHelp_clicked(self,*args):
         return self.on_helpHelpMenuItem_activate(*args)
 
+    def on_toolbarFill_toggled(self,widget,*args):
+        """Handler for the fill toggle button. Clicks fill color blocks while
+        it is down."""
+        self._ui.fill_mode = widget.get_active()
+
     #Other handlers
     def on_programTable_button_press_event(self, widget, event):
-        self._ui.set_pixel_color(int(event.x),int(event.y))
+        if event.button == 3:
+            #Right click toggles a breakpoint
+            self._ui.toggle_breakpoint(int(event.x),int(event.y))
+        elif self._ui.fill_mode:
+            self._ui.fill_region(int(event.x),int(event.y))
+        else:
+            self._ui.set_pixel_color(int(event.x),int(event.y))
 
     def on_codelColorEventBox_clicked(self, widget, event):
         """Handler for clicking a codel color event box"""
         self._ui.set_selected_color(widget)
 
+    def on_programTable_scroll_event(self, widget, event):
+        """Handler for the mouse wheel over the program table. Scrolls, or
+        scrolls sideways with shift held, or zooms around the pointer with
+        control held."""
+        if event.state & gtk.gdk.CONTROL_MASK:
+            if event.direction == gtk.gdk.SCROLL_UP:
+                self._ui.set_zoom(self._ui.zoom+1,(int(event.x),int(event.y)))
+            elif event.direction == gtk.gdk.SCROLL_DOWN:
+                self._ui.set_zoom(self._ui.zoom-1,(int(event.x),int(event.y)))
+            return True
+        sideways = event.state & gtk.gdk.SHIFT_MASK
+        if event.direction == gtk.gdk.SCROLL_UP:
+            self._ui.scroll_view(0,-1,sideways)
+        elif event.direction == gtk.gdk.SCROLL_DOWN:
+            self._ui.scroll_view(0,1,sideways)
+        elif event.direction == gtk.gdk.SCROLL_LEFT:
+            self._ui.scroll_view(-1,0)
+        elif event.direction == gtk.gdk.SCROLL_RIGHT:
+            self._ui.scroll_view(1,0)
+        return True
+
+    def on_programScroll_value_changed(self,*args):
+        """Handler for the program table's scrollbars being moved"""
+        self._ui.view_scrolled()
+
     def on_programTable_expose_event(self, widget, event):
-        #Add event boxes to program table
-        self._ui.draw_program_table()           
+        #Copy the exposed part of the program table from its backing store
+        self._ui.expose_program_table(event.area)
         
     def on_increaseWidthButton_clicked(self,*args):
         self._ui.increase_width()
@@ -239,6 +426,8 @@ class UI:
         """Sets up the object properties"""
         self.changes_made = False
         self.selected_color = None
+        #Whether clicking fills the whole block of a codel rather than one codel
+        self.fill_mode = False
         self.current_file = None
         self.gladeui = gladeui
         self.selected_color_widget = None
@@ -247,9 +436,41 @@ class UI:
         self.default_width = 10
         self.width = self.default_width
         self.height = self.default_height
-        self.max_width = 1000
-        self.max_height = 1000
         self.current_pixel = None
+        #Codels are drawn 2**zoom screen pixels across. Below 0 they are drawn
+        #from overviews of the program, one overview pixel per screen pixel.
+        self.zoom = 0
+        self.min_zoom = -8
+        self.max_zoom = 6
+        #Whether the zoom follows the size of the program table
+        self.fit_zoom = True
+        #Codels smaller than this in screen pixels aren't drawn with grid
+        #lines or heat, and their markers are drawn bigger than them
+        self.grid_size = 4
+        self.marker_size = 8
+        #Set while the scrollbars are being changed by the program
+        self.updating_view = False
+        #The program being edited, a PIL image sharing its codes, and overviews
+        #of it indexed by how many times it has been halved
+        self.document = None
+        self.image = None
+        self.palette_size = 0
+        self.overviews = {}
+        #Run being shown as it goes, and the codels it was last seen at
+        #before the current one
+        self.live_runner = None
+        self.trail = collections.deque()
+        self.trail_length = 32
+        #Edits to the document that can be undone
+        self.edits = piedit.undo.EditHistory()
+        #Hex color drawn over each codel after profiling, or None
+        self.heatmap = None
+        self.breakpoints = piedit.breakpoints.Breakpoints()
+        #Off-screen pixmap the program table is drawn on, and its GC
+        self.backing = None
+        self.backing_gc = None
+        #Allocated gdk colors indexed by hex color
+        self.gdk_colors = {}
         
         self.handlers = Handlers(self)
         self.gladeui.signal_autoconnect(self.handlers)
@@ -257,15 +478,20 @@ class UI:
         self.initialise_ui()
 
     def save_image(self,path):
-        """Saves the current program table to an image"""
-        image = PIL.Image.new("RGB",(self.width,self.height))
-        image.putdata([piedit.colors.hex_to_rgb(p) for p in self.pixels])
-        image.save(path, "PNG")
+        """Saves the current program table to an image. Colors changed when
+        it was loaded are saved as they are shown."""
+        piedit.export.export_document(self.document,path,format="PNG",lossy=True)
         self.message_handler.handle_message("FILE_SAVED")
         self.set_current_file(path)
         self.set_changes_made(False)
         self.set_window_title(os.path.basename(path))
     
+    def export_image(self,path,codel_size):
+        """Writes the current program to an image with squares of codel_size
+        pixels for codels. It stays the current file."""
+        piedit.export.export_document(self.document,path,codel_size,lossy=True)
+        self.message_handler.handle_message("FILE_EXPORTED")
+
     def load_image(self,path):
         """Loads an image from file and displays it in the program table"""
         try:
@@ -275,68 +501,193 @@ class UI:
         except IOError:
             self.message_handler.handle_error("FILE_NOT_LOADED")
         (self.width, self.height) = image.size
-        if self.width>self.max_width or self.height>self.max_height:
-            self.message_handler.handle_error("IMAGE_TOO_BIG")
-        else:
-            self.clear_image(self.width,self.height)
-            self.pixels = [piedit.colors.rgb_to_hex(rgb) for rgb in image.getdata()]
-            self.draw_program_table()
+        self.clear_image(self.width,self.height)
+        self.document = piedit.document.from_image(image)
+        self.update_image()
+        self.draw_program_table()
         self.set_current_file(path)
         self.set_changes_made(False)
         self.set_window_title(os.path.basename(path))
+        if self.document.lossy:
+            self.message_handler.handle_message("LOSSY_LOAD")
 
     def clear_image(self,width,height):
         """Clears the program table, i.e. fills with all whites"""      
         self.height=height
         self.width=width
         self.gladeui.get_widget("programTable").window.clear()
-        self.pixels = [piedit.colors.white for y in xrange(self.height) for x in xrange(self.width)]
+        self.backing = None
+        self.fit_zoom = True
+        self.document = piedit.document.Document(self.width,self.height)
+        self.update_image()
+        self.edits.clear()
+        self.update_edit_menu()
         self.current_pixel=None
+        self.heatmap = None
         self.set_current_file(None)
         self.set_window_title("Untitled.png")
         self.set_changes_made(False)
         
+    def update_image(self):
+        """Makes the image of the document that codels are drawn from again,
+        after the document has been replaced or resized"""
+        self.image = self.document.image()
+        self.palette_size = len(self.document.palette)
+        self.overviews = {}
+
+    def update_palette(self):
+        """Puts the document's palette in its image and the overviews again
+        if colors have been added to it"""
+        if len(self.document.palette) != self.palette_size:
+            palette = self.document.rgb_palette()
+            self.image.putpalette(palette)
+            for overview in self.overviews.values():
+                overview.putpalette(palette)
+            self.palette_size = len(self.document.palette)
+
+    def patched(self,patch):
+        """Brings the overviews and program table up to date after the codels
+        in a patch have been changed. An overview pixel shows the last codel
+        set in it. Overviews are made again for big patches."""
+        self.update_palette()
+        if patch.codels > 4096:
+            self.overviews = {}
+        elif self.overviews:
+            for x,y in patch.codel_positions():
+                code = self.document.data[self.document.index(x,y)]
+                for level,overview in self.overviews.items():
+                    overview.putpixel((x>>level,y>>level),code)
+        bounds = patch.bounds()
+        if bounds != None:
+            left,top,right,bottom = bounds
+            self.draw_program_table(xrange(left,right),xrange(top,bottom))
+
+    def resized(self):
+        """Brings the program table up to date after the document has been
+        resized"""
+        self.width = self.document.width
+        self.height = self.document.height
+        self.heatmap = None
+        self.update_image()
+        self.update_view()
+        self.draw_program_table()
+
+    def edited(self,edit):
+        """Brings the program table up to date after an edit has been done,
+        undone or redone"""
+        if isinstance(edit,piedit.undo.Resize):
+            self.resized()
+        else:
+            self.patched(edit)
+        self.update_edit_menu()
+
+    def undo(self):
+        """Undoes the last edit"""
+        edit = self.edits.undo(self.document)
+        if edit != None:
+            self.heatmap = None
+            self.edited(edit)
+            self.set_changes_made(True)
+
+    def redo(self):
+        """Redoes the last edit undone"""
+        edit = self.edits.redo(self.document)
+        if edit != None:
+            self.heatmap = None
+            self.edited(edit)
+            self.set_changes_made(True)
+
+    def update_edit_menu(self):
+        """Sets whether undo and redo can be chosen"""
+        self.gladeui.get_widget("editUndoMenuItem").set_sensitive(self.edits.can_undo())
+        self.gladeui.get_widget("editRedoMenuItem").set_sensitive(self.edits.can_redo())
+
+    def overview(self,level):
+        """Returns the image of the program halved level times, making it the
+        first time it is needed"""
+        if level == 0:
+            return self.image
+        try:
+            return self.overviews[level]
+        except KeyError:
+            size = ((self.width+(1<<level)-1)>>level,(self.height+(1<<level)-1)>>level)
+            overview = self.image.resize(size,PIL.Image.NEAREST)
+            self.overviews[level] = overview
+            return overview
+
+    def view_scale(self):
+        """Returns the overview level drawn at the current zoom, and how many
+        screen pixels across each of its pixels is drawn"""
+        if self.zoom < 0:
+            return -self.zoom,1
+        return 0,1<<self.zoom
+
+    def view_offset(self):
+        """Returns the screen pixel of the program at the top left of the
+        program table"""
+        return (int(self.gladeui.get_widget("programHScrollbar").get_adjustment().value),
+                int(self.gladeui.get_widget("programVScrollbar").get_adjustment().value))
+
+    def codel_at(self,x,y):
+        """Returns the (x,y) of the codel at a point in the program table, or
+        None if the point is off the program"""
+        level,scale = self.view_scale()
+        offset_x,offset_y = self.view_offset()
+        x = ((x+offset_x)//scale)<<level
+        y = ((y+offset_y)//scale)<<level
+        if x<0 or y<0 or x>=self.width or y>=self.height:
+            return None
+        return x,y
+
+    def codel_rect(self,x,y):
+        """Returns the screen rectangle of a codel in the program table, grown
+        to marker_size if it is smaller so markers on it can be seen, and
+        whether it was grown"""
+        level,scale = self.view_scale()
+        offset_x,offset_y = self.view_offset()
+        l = (x>>level)*scale-offset_x
+        t = (y>>level)*scale-offset_y
+        if scale < self.grid_size:
+            l = l-(self.marker_size-scale)//2
+            t = t-(self.marker_size-scale)//2
+            return gtk.gdk.Rectangle(l,t,self.marker_size,self.marker_size),True
+        return gtk.gdk.Rectangle(l,t,scale,scale),False
+        
     def set_pixel_color(self,x,y):
         """Sets the color of a program table pixel to the currently selected color"""
-        program_table = self.gladeui.get_widget("programTable").window
-        pt_width, pt_height = program_table.get_size()
-        width_per_pixel = pt_width/self.width
-        height_per_pixel = pt_height/self.height
-        extra_width_cutoff = self.width-(pt_width%(width_per_pixel*self.width))
-        extra_height_cutoff = self.height-(pt_height%(height_per_pixel*self.height))
-        
-        x_sum = 0
-        x_counter = 0
-        while x_sum<x:
-            if x_counter<extra_width_cutoff:
-                new_x_sum = x_sum + width_per_pixel
-            else:
-                new_x_sum = x_sum + width_per_pixel + 1
-            if new_x_sum<x:
-                x_sum = new_x_sum
-                x_counter = x_counter +1
-            else:
-                x_sum = x
-        x = x_counter
-                
-        y_sum = 0
-        y_counter = 0
-        while y_sum<y:
-            if y_counter<extra_height_cutoff:
-                new_y_sum = y_sum + height_per_pixel
-            else:
-                new_y_sum = y_sum + height_per_pixel + 1
-            if new_y_sum<y:
-                y_sum = new_y_sum
-                y_counter = y_counter +1
-            else:
-                y_sum = y
-        y = y_counter        
-        
+        codel = self.codel_at(x,y)
+        if codel == None:
+            return
+        x,y = codel
         if self.selected_color:
-            self.pixels[y*self.width+x] = self.selected_color
-            self.set_changes_made(True)
-            self.draw_program_table([x],[y])
+            patch = piedit.undo.Patch()
+            patch.add_run(self.document,x,y,1,self.document.code(self.selected_color))
+            self.add_patch(patch)
+
+    def fill_region(self,x,y):
+        """Sets the color of the codel at a point in the program table, and of
+        every codel joined to it through codels of its color, to the
+        currently selected color, as one edit"""
+        codel = self.codel_at(x,y)
+        if codel == None:
+            return
+        x,y = codel
+        if self.selected_color:
+            patch = piedit.undo.Patch()
+            patch.add_region(self.document,x,y,self.document.code(self.selected_color))
+            if patch.codels:
+                self.add_patch(patch)
+
+    def add_patch(self,patch):
+        """Adds a patch that has just been done to the edits, takes any heat
+        off its codels and redraws them"""
+        self.edits.add(patch)
+        self.set_changes_made(True)
+        if self.heatmap != None:
+            for x,y,old,code in patch.runs:
+                start = y*self.width+x
+                self.heatmap[start:start+len(old)] = [None]*len(old)
+        self.edited(patch)
 
     def set_selected_color(self,color_widget):
         """Sets the currently selected color. Called when the codel color chooser is clicked"""
@@ -421,57 +772,260 @@ class UI:
         
         #Initialise image     
         program_table = self.gladeui.get_widget("programTable")
-        program_table.add_events(gtk.gdk.BUTTON_PRESS_MASK)
+        program_table.add_events(gtk.gdk.BUTTON_PRESS_MASK|gtk.gdk.SCROLL_MASK)
         program_table.connect("button_press_event", self.handlers.on_programTable_button_press_event)
+        for name in ("programHScrollbar","programVScrollbar"):
+            self.gladeui.get_widget(name).get_adjustment().connect("value_changed",self.handlers.on_programScroll_value_changed)
         self.clear_image(self.width,self.height)
         
+    def gdk_color(self,color):
+        """Returns the allocated gdk color for a hex color, allocating it the
+        first time it is used"""
+        try:
+            return self.gdk_colors[color]
+        except KeyError:
+            gdk_color = gtk.gdk.colormap_get_system().alloc_color(color)
+            self.gdk_colors[color] = gdk_color
+            return gdk_color
+
+    def expose_program_table(self,area):
+        """Copies an exposed area of the program table from the backing
+        store, drawing the whole table first if the store is out of date"""
+        program_table = self.gladeui.get_widget("programTable").window
+        if self.backing == None or self.backing.get_size() != program_table.get_size():
+            self.draw_program_table()
+        else:
+            gc = self.gladeui.get_widget("programTable").style.fg_gc[gtk.STATE_NORMAL]
+            program_table.draw_drawable(gc,self.backing,
+                area.x,area.y,area.x,area.y,area.width,area.height)
+
+    def update_view(self):
+        """Fits the zoom to the program table if it follows it, and sets the
+        scrollbars to the size of the program at the current zoom"""
+        if self.fit_zoom:
+            self.zoom_to_fit()
+        else:
+            self.update_scrollbars()
+
+    def update_scrollbars(self,x=None,y=None):
+        """Sets the scrollbars to the size of the program at the current zoom,
+        and scrolls to the given screen pixel of the program"""
+        level,scale = self.view_scale()
+        view_width,view_height = self.gladeui.get_widget("programTable").window.get_size()
+        sizes = (("programHScrollbar",((self.width+(1<<level)-1)>>level)*scale,view_width,x),
+                 ("programVScrollbar",((self.height+(1<<level)-1)>>level)*scale,view_height,y))
+        self.updating_view = True
+        try:
+            for name,size,page,value in sizes:
+                adjustment = self.gladeui.get_widget(name).get_adjustment()
+                if value == None:
+                    value = adjustment.value
+                adjustment.lower = 0
+                adjustment.upper = size
+                adjustment.page_size = page
+                adjustment.step_increment = max(scale,page//10,1)
+                adjustment.page_increment = max(page*9//10,1)
+                adjustment.changed()
+                adjustment.set_value(max(0,min(value,size-page)))
+        finally:
+            self.updating_view = False
+
+    def view_scrolled(self):
+        """Redraws the program table after it has been scrolled"""
+        if not self.updating_view and self.backing != None:
+            self.draw_program_table()
+
+    def scroll_view(self,x,y,sideways=False):
+        """Scrolls the program table by steps across and down, or takes the
+        steps down across instead if sideways is set"""
+        if sideways:
+            x,y = y,x
+        for name,steps in (("programHScrollbar",x),("programVScrollbar",y)):
+            if steps:
+                adjustment = self.gladeui.get_widget(name).get_adjustment()
+                value = adjustment.value+steps*adjustment.step_increment
+                adjustment.set_value(max(adjustment.lower,min(value,adjustment.upper-adjustment.page_size)))
+
+    def set_zoom(self,zoom,anchor=None):
+        """Draws codels 2**zoom screen pixels across, keeping the point under
+        the anchor, or the middle of the program table, where it is"""
+        zoom = max(self.min_zoom,min(zoom,self.max_zoom))
+        self.fit_zoom = False
+        if zoom == self.zoom:
+            return
+        if anchor == None:
+            view_width,view_height = self.gladeui.get_widget("programTable").window.get_size()
+            anchor = (view_width//2,view_height//2)
+        offset_x,offset_y = self.view_offset()
+        factor = 2.0**(zoom-self.zoom)
+        self.zoom = zoom
+        self.update_scrollbars(int((anchor[0]+offset_x)*factor)-anchor[0],
+                               int((anchor[1]+offset_y)*factor)-anchor[1])
+        self.draw_program_table()
+
+    def zoom_to_fit(self):
+        """Sets the zoom to the biggest that fits the whole program in the
+        program table, and keeps it fitting when the table changes size"""
+        view_width,view_height = self.gladeui.get_widget("programTable").window.get_size()
+        zoom = self.max_zoom
+        while zoom > self.min_zoom and (self.width*2.0**zoom > view_width or self.height*2.0**zoom > view_height):
+            zoom = zoom-1
+        redraw = self.backing != None and zoom != self.zoom
+        self.zoom = zoom
+        self.fit_zoom = True
+        self.update_scrollbars(0,0)
+        if redraw:
+            self.draw_program_table()
+
     def draw_program_table(self,x_iter=None,y_iter=None):
-        """Draws the program table"""
-        if x_iter == None:
-            x_iter = xrange(self.width)
-        if y_iter == None:
-            y_iter = xrange(self.height)
+        """Draws codels of the program table, or all that can be seen, on the
+        backing store and marks the area they cover to be exposed. The store
+        is remade, and everything drawn, when the table changes size."""
         program_table = self.gladeui.get_widget("programTable").window
-        pt_width, pt_height = program_table.get_size()
-        pt_width, pt_height = pt_width-1, pt_height-1
-        width_per_pixel = pt_width//self.width
-        height_per_pixel = pt_height//self.height
-        extra_width_cutoff = self.width-(pt_width%(width_per_pixel*self.width))
-        extra_height_cutoff = self.height-(pt_height%(height_per_pixel*self.height))
-        
-        colormap = gtk.gdk.colormap_get_system()
-        black = colormap.alloc_color('black')
-        white = colormap.alloc_color('white')
-
-        gc = gtk.gdk.GC(drawable=program_table,\
-                        foreground=black,\
-                        background=black,
-                        line_width=1)
-
-        for x in x_iter:
-            for y in y_iter:
-                gc.set_foreground(black)
-                l = x*width_per_pixel + int(x>extra_width_cutoff)*(x-extra_width_cutoff)
-                w = width_per_pixel + int(x>=extra_width_cutoff)
-                t = y*height_per_pixel + int(y>extra_height_cutoff)*(y-extra_height_cutoff)
-                h = height_per_pixel + int(y>=extra_height_cutoff)
-
-                if (x,y) == self.current_pixel:
-                    gc.set_line_attributes(2,gtk.gdk.LINE_SOLID,gtk.gdk.CAP_BUTT,gtk.gdk.JOIN_MITER)
-                    l=l+1
-                    w=w-2
-                    t=t+1
-                    h=h-2
-                else:
-                    gc.set_line_attributes(1,gtk.gdk.LINE_SOLID,gtk.gdk.CAP_BUTT,gtk.gdk.JOIN_MITER)
-                program_table.draw_rectangle(gc,False,l,t,w,h)    
-                try:
-                    pixel = self.pixels[y*self.width+x]
-                    fg = colormap.alloc_color(pixel)
-                    gc.set_foreground(fg)
-                except AttributeError:
-                    gc.set_foreground(white)
-                program_table.draw_rectangle(gc,True,l+1,t+1,w-1,h-1)          
+        size = program_table.get_size()
+        if self.backing == None or self.backing.get_size() != size:
+            self.backing = gtk.gdk.Pixmap(program_table,size[0],size[1])
+            self.backing_gc = gtk.gdk.GC(drawable=self.backing,\
+                                         foreground=self.gdk_color("black"),\
+                                         background=self.gdk_color("black"),
+                                         line_width=1)
+            self.update_view()
+            x_iter = None
+            y_iter = None
+        area = gtk.gdk.Rectangle(0,0,size[0],size[1])
+        if x_iter != None and y_iter != None:
+            xs = list(x_iter)
+            ys = list(y_iter)
+            if not xs or not ys:
+                return
+            #Codels are drawn in order, so the corners bound the rest
+            dirty = self.codel_rect(min(xs),min(ys))[0].union(self.codel_rect(max(xs),max(ys))[0])
+            #Take in the grid line on the right and bottom
+            dirty.width = dirty.width+1
+            dirty.height = dirty.height+1
+            area = area.intersect(dirty)
+            if area.width <= 0 or area.height <= 0:
+                return
+        self.render(area)
+        program_table.invalidate_rect(area,False)
+
+    def render(self,area):
+        """Draws the part of the program in a screen area of the program table
+        on the backing store. Only codels that can be seen are drawn."""
+        level,scale = self.view_scale()
+        offset_x,offset_y = self.view_offset()
+        backing = self.backing
+        gc = self.backing_gc
+        gc.set_clip_rectangle(area)
+        style = self.gladeui.get_widget("programTable").style
+        backing.draw_rectangle(style.bg_gc[gtk.STATE_NORMAL],True,area.x,area.y,area.width,area.height)
+
+        #Pixels of the overview in the area
+        image = self.overview(level)
+        left = max((area.x+offset_x)//scale,0)
+        top = max((area.y+offset_y)//scale,0)
+        right = min((area.x+area.width+offset_x+scale-1)//scale,image.size[0])
+        bottom = min((area.y+area.height+offset_y+scale-1)//scale,image.size[1])
+        if left < right and top < bottom:
+            part = image.crop((left,top,right,bottom)).convert("RGB")
+            if scale > 1:
+                part = part.resize((part.size[0]*scale,part.size[1]*scale),PIL.Image.NEAREST)
+            backing.draw_rgb_image(gc,left*scale-offset_x,top*scale-offset_y,part.size[0],part.size[1],
+                gtk.gdk.RGB_DITHER_NONE,part.tobytes(),part.size[0]*3)
+
+        if scale >= self.grid_size and left < right and top < bottom:
+            gc.set_foreground(self.gdk_color("black"))
+            gc.set_line_attributes(1,gtk.gdk.LINE_SOLID,gtk.gdk.CAP_BUTT,gtk.gdk.JOIN_MITER)
+            segments = [(x*scale-offset_x,top*scale-offset_y,x*scale-offset_x,bottom*scale-offset_y)
+                for x in xrange(left,right+1)]
+            segments.extend([(left*scale-offset_x,y*scale-offset_y,right*scale-offset_x,y*scale-offset_y)
+                for y in xrange(top,bottom+1)])
+            backing.draw_segments(gc,segments)
+            if self.heatmap != None:
+                for y in xrange(top,bottom):
+                    for x in xrange(left,right):
+                        heat = self.heatmap[y*self.width+x]
+                        if heat != None:
+                            #Draw the heat in the middle so the codel color still shows
+                            gc.set_foreground(self.gdk_color(heat))
+                            l = x*scale-offset_x
+                            t = y*scale-offset_y
+                            backing.draw_rectangle(gc,True,l+scale//4,t+scale//4,max(scale//2,1),max(scale//2,1))
+
+        gc.set_foreground(self.gdk_color("red"))
+        for x,y in self.breakpoints.codels:
+            if x < self.width and y < self.height:
+                rect,grown = self.codel_rect(x,y)
+                if rect.intersect(area).width > 0:
+                    l,t,w,h = rect.x,rect.y,rect.width,rect.height
+                    if grown:
+                        backing.draw_arc(gc,True,l,t,w,h,0,360*64)
+                    else:
+                        backing.draw_arc(gc,True,l+w//3,t+h//3,max(w//3,2),max(h//3,2),0,360*64)
+        gc.set_foreground(self.gdk_color("#606060"))
+        for x,y in self.trail:
+            if x < self.width and y < self.height:
+                rect,grown = self.codel_rect(x,y)
+                if rect.intersect(area).width > 0:
+                    size = max(rect.width//3,2)
+                    backing.draw_rectangle(gc,True,rect.x+(rect.width-size)//2,rect.y+(rect.height-size)//2,size,size)
+        if self.current_pixel != None and self.current_pixel[0] < self.width and self.current_pixel[1] < self.height:
+            rect = self.codel_rect(*self.current_pixel)[0]
+            gc.set_foreground(self.gdk_color("black"))
+            gc.set_line_attributes(2,gtk.gdk.LINE_SOLID,gtk.gdk.CAP_BUTT,gtk.gdk.JOIN_MITER)
+            backing.draw_rectangle(gc,False,rect.x+1,rect.y+1,rect.width-2,rect.height-2)
+
+    def toggle_breakpoint(self,x,y):
+        """Adds or removes a breakpoint on the codel at a point in the program
+        table"""
+        codel = self.codel_at(x,y)
+        if codel == None:
+            return
+        x,y = codel
+        self.breakpoints.toggle_codel(x,y)
+        self.draw_program_table([x],[y])
+
+    def set_heatmap(self,heatmap):
+        """Sets the heatmap colors drawn over the codels, or clears them if
+        None is given."""
+        if heatmap != self.heatmap:
+            self.heatmap = heatmap
+            self.draw_program_table()
+
+    def start_live_view(self,runner):
+        """Starts showing where a run has got to. Its child process sends its
+        progress a few times a second, so it runs at full speed."""
+        self.stop_live_view()
+        self.live_runner = runner
+        self.trail.clear()
+
+    def update_live_view(self,runner,progress):
+        """Highlights the codel a run has got to, with a trail behind it, and
+        shows its step, dp, cc and stack depth."""
+        if runner is not self.live_runner:
+            return
+        position = (progress["x"],progress["y"])
+        if position != self.current_pixel:
+            if self.current_pixel != None:
+                self.trail.append(self.current_pixel)
+                if len(self.trail) > self.trail_length:
+                    x,y = self.trail.popleft()
+                    self.draw_program_table([x],[y])
+            self.highlight_pixel(*position)
+        self.gladeui.get_widget("statusBar").set_status("Running... step %d, dp %s, cc %s, stack depth %d" % (
+            progress["step"],dp_names[progress["dp"]],cc_names[progress["cc"]],progress["stack_depth"]))
+
+    def stop_live_view(self):
+        """Stops showing the running interpreter and takes its trail and
+        highlight off the program table"""
+        self.live_runner = None
+        trail = list(self.trail)
+        self.trail.clear()
+        if self.current_pixel != None:
+            trail.append(self.current_pixel)
+            self.current_pixel = None
+        for x,y in trail:
+            self.draw_program_table([x],[y])
 
     def highlight_pixel(self,x,y):
         if self.current_pixel == None:
@@ -479,32 +1033,27 @@ class UI:
         else:
             old_x,old_y = self.current_pixel
         self.current_pixel = (x,y)
-        self.draw_program_table([old_x,x],[old_y,y])
+        self.draw_program_table([old_x],[old_y])
         self.draw_program_table([x],[y])
     
+    def resize_document(self,width,height):
+        """Resizes the document as an edit that can be undone"""
+        self.edits.add(piedit.undo.Resize(self.document,width,height))
+        self.edited(self.edits.undo_edits[-1])
+
     def increase_width(self):
-        for i,y in enumerate(xrange(self.height)):
-            self.pixels.insert((y*self.width+i)+self.width,piedit.colors.white)
-        self.width = self.width+1
-        self.draw_program_table()
+        self.resize_document(self.width+1,self.height)
     
     def decrease_width(self):
         if self.width > 1:
-            for i,y in enumerate(xrange(self.height)):
-                del self.pixels[(y*self.width)+self.width-1-i]
-            self.width = self.width-1
-            self.draw_program_table()
+            self.resize_document(self.width-1,self.height)
 
     def increase_height(self):
-        self.pixels.extend([piedit.colors.white for x in xrange(self.width)])
-        self.height = self.height+1
-        self.draw_program_table()
+        self.resize_document(self.width,self.height+1)
     
     def decrease_height(self):
         if self.height > 1:
-            self.pixels[self.width*self.height-self.width:] = []
-            self.height = self.height-1
-            self.draw_program_table()
+            self.resize_document(self.width,self.height-1)
 
     
 class MessageHandler:
@@ -513,14 +1062,18 @@ class MessageHandler:
         """Sets up error messages"""
         self._ui = ui
         self.error_messages = {
-            "IMAGE_TOO_BIG":"The image couldn't be loaded because it's too big.\n"
-                            +"At present we only support images up to 10x10 pixels.\n"
-                            +"Sorry :(",
             "FILE_NOT_LOADED":"The image could not be loaded.\n"
                             +"Either the file doesn't exist, or it wasn't\n"
-                            +"recognised as an image"}
+                            +"recognised as an image",
+            "BAD_BREAKPOINT":"The breakpoint wasn't understood. Breakpoints look like\n"
+                            +"codel <x> <y>, op <name>, step <n> or\n"
+                            +"stack <depth|top> <comparison> <n>"}
         self.messages = {
             "FILE_SAVED":"File saved successfully",
+            "FILE_EXPORTED":"File exported successfully",
+            "LOSSY_LOAD":"The image has more colors than fit in a palette\n"
+                            +"of %d, so the rest are shown as the nearest of\n" % piedit.document.max_colors
+                            +"them, and will be saved that way",
             "SAVE_CHANGES":"Would you like to save changes to the current file?"}
         
     def handle_error(self,error_type):
@@ -545,6 +1098,71 @@ class MessageHandler:
         msgbox.run()
         msgbox.destroy()
     
+    def ask_step(self,current_step):
+        """Asks the user for a step to jump to. Returns None if they
+        cancelled."""
+        dialog = gtk.Dialog(
+            title="Jump to Step",
+            parent=self._ui.gladeui.get_widget("mainWindow"),
+            flags=gtk.DIALOG_MODAL,
+            buttons=(gtk.STOCK_CANCEL,gtk.RESPONSE_CANCEL,gtk.STOCK_JUMP_TO,gtk.RESPONSE_OK))
+        spin_button = gtk.SpinButton(gtk.Adjustment(current_step,0,2**31-1,1,100))
+        spin_button.set_activates_default(True)
+        dialog.set_default_response(gtk.RESPONSE_OK)
+        dialog.vbox.pack_start(spin_button)
+        spin_button.show()
+        response = dialog.run()
+        step = spin_button.get_value_as_int()
+        dialog.destroy()
+        if response == gtk.RESPONSE_OK:
+            return step
+        else:
+            return None
+    
+    def ask_codel_size(self):
+        """Asks the user for the pixels across each codel in an exported
+        image. Returns None if they cancelled."""
+        dialog = gtk.Dialog(
+            title="Codel Size",
+            parent=self._ui.gladeui.get_widget("mainWindow"),
+            flags=gtk.DIALOG_MODAL,
+            buttons=(gtk.STOCK_CANCEL,gtk.RESPONSE_CANCEL,gtk.STOCK_SAVE,gtk.RESPONSE_OK))
+        spin_button = gtk.SpinButton(gtk.Adjustment(1,1,64,1,4))
+        spin_button.set_activates_default(True)
+        dialog.set_default_response(gtk.RESPONSE_OK)
+        dialog.vbox.pack_start(spin_button)
+        spin_button.show()
+        response = dialog.run()
+        codel_size = spin_button.get_value_as_int()
+        dialog.destroy()
+        if response == gtk.RESPONSE_OK:
+            return codel_size
+        else:
+            return None
+    
+    def ask_breakpoint(self):
+        """Asks the user for a breakpoint. Returns None if they cancelled."""
+        dialog = gtk.Dialog(
+            title="Add Breakpoint",
+            parent=self._ui.gladeui.get_widget("mainWindow"),
+            flags=gtk.DIALOG_MODAL,
+            buttons=(gtk.STOCK_CANCEL,gtk.RESPONSE_CANCEL,gtk.STOCK_ADD,gtk.RESPONSE_OK))
+        label = gtk.Label("e.g. op Roll, step 500000, stack depth > 100")
+        entry = gtk.Entry()
+        entry.set_activates_default(True)
+        dialog.set_default_response(gtk.RESPONSE_OK)
+        dialog.vbox.pack_start(label)
+        dialog.vbox.pack_start(entry)
+        label.show()
+        entry.show()
+        response = dialog.run()
+        text = entry.get_text()
+        dialog.destroy()
+        if response == gtk.RESPONSE_OK:
+            return text
+        else:
+            return None
+    
     def handle_save_msgbox(self):
         """Presents the save changes prompt to the user"""
         msgbox = gtk.MessageDialog(
@@ -0,0 +1,246 @@
+"""Module for undoing and redoing edits to a document. Edits are kept as the
+runs of codels they changed and what the codels were before, not as copies
+of the program, and the history drops its oldest edits to stay within a
+memory budget."""
+
+import re
+import bisect
+import collections
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+#Bytes an edit is counted as taking on top of the codes it keeps, for each
+#run and for itself
+run_overhead = 64
+edit_overhead = 128
+
+#Bytes of memory the history is kept within by default
+default_budget = 32*1024*1024
+
+
+class Patch:
+    """Class for an edit that sets runs of codels along rows to codes. Each
+    run keeps the codes it replaced, so undoing it is as quick as doing
+    it."""
+    def __init__(self):
+        """Initializes new Patch."""
+        #(x, y, old codes, new code)
+        self.runs = []
+        self.codels = 0
+
+    def add_run(self,document,x,y,length,code):
+        """Sets length codels along a row of the document to a code, from x,y
+        rightwards, and adds them to the patch."""
+        start = document.index(x,y)
+        old = document.data[start:start+length]
+        document.data[start:start+length] = type(old)(old.typecode,[code])*length
+        self.runs.append((x,y,old,code))
+        self.codels = self.codels + length
+
+    def add_region(self,document,x,y,code):
+        """Sets the codels joined to x,y through codels of the same code, as
+        in a color block, to a code, and adds them to the patch. Each row is
+        searched once for its runs of the code, the runs joined to x,y are
+        found a row at a time by going to the runs that touch them in the
+        rows above and below, and then they're filled."""
+        data = document.data
+        target = data[document.index(x,y)]
+        if target == code:
+            return
+        runs = re.compile(re.escape(chr(target))+"+")
+        #Starts and ends of the runs of the target code in each row searched,
+        #and the runs found so far. The starts end with the width, so looking
+        #along them stops there.
+        height = document.height
+        starts = [None]*height
+        ends = [None]*height
+        found = [None]*height
+        #Whether each row has the same runs as the one below it
+        same = [None]*height
+        def search(y):
+            start = document.index(0,y)
+            spans = [match.span() for match in runs.finditer(data[start:start+document.width].tostring())]
+            starts[y] = [left for left,right in spans]+[document.width]
+            ends[y] = [right for left,right in spans]
+            found[y] = set()
+        search(y)
+        i = bisect.bisect_right(starts[y],x)-1
+        found[y].add(i)
+        #Rows with runs found in them that haven't been looked from yet
+        seeds = [(y,[i])]
+        bisect_right = bisect.bisect_right
+        while seeds:
+            y,indices = seeds.pop()
+            for next_y in (y-1,y+1):
+                if not 0 <= next_y < height:
+                    continue
+                if starts[next_y] == None:
+                    search(next_y)
+                top = min(y,next_y)
+                if same[top] == None:
+                    same[top] = starts[y] == starts[next_y] and ends[y] == ends[next_y]
+                if same[top]:
+                    #Each run only touches the one in the same place
+                    touching = indices
+                else:
+                    touching = []
+                    next_starts = starts[next_y]
+                    next_ends = ends[next_y]
+                    for i in indices:
+                        #Runs that end after this one starts and start before it ends
+                        j = bisect_right(next_ends,starts[y][i])
+                        right = ends[y][i]
+                        while next_starts[j] < right:
+                            touching.append(j)
+                            j = j + 1
+                new = set(touching)-found[next_y]
+                if new:
+                    found[next_y].update(new)
+                    seeds.append((next_y,list(new)))
+        #Blocks of the new code, indexed by length
+        blocks = {}
+        for y in xrange(height):
+            if not found[y]:
+                continue
+            row = document.index(0,y)
+            for i in sorted(found[y]):
+                left = starts[y][i]
+                right = ends[y][i]
+                old = data[row+left:row+right]
+                try:
+                    data[row+left:row+right] = blocks[right-left]
+                except KeyError:
+                    blocks[right-left] = type(old)(old.typecode,[code])*(right-left)
+                    data[row+left:row+right] = blocks[right-left]
+                self.runs.append((left,y,old,code))
+                self.codels = self.codels + right-left
+
+    def redo(self,document):
+        """Sets the codels again."""
+        for x,y,old,code in self.runs:
+            start = document.index(x,y)
+            document.data[start:start+len(old)] = type(old)(old.typecode,[code])*len(old)
+
+    def undo(self,document):
+        """Puts the codels back as they were, latest run first."""
+        for x,y,old,code in reversed(self.runs):
+            start = document.index(x,y)
+            document.data[start:start+len(old)] = old
+
+    def codel_positions(self):
+        """Generator for the (x,y) of each codel in the patch."""
+        for x,y,old,code in self.runs:
+            for i in xrange(len(old)):
+                yield x+i,y
+
+    def bounds(self):
+        """Returns (left, top, right, bottom) of the codels in the patch,
+        right and bottom being just past them, or None if it's empty."""
+        if not self.runs:
+            return None
+        return (min(x for x,y,old,code in self.runs),
+                min(y for x,y,old,code in self.runs),
+                max(x+len(old) for x,y,old,code in self.runs),
+                max(y for x,y,old,code in self.runs)+1)
+
+    def size(self):
+        """Returns roughly how many bytes the patch takes."""
+        return edit_overhead + self.codels + run_overhead*len(self.runs)
+
+
+class Resize:
+    """Class for an edit that resizes a document. Only the codels cut off by
+    shrinking are kept."""
+    def __init__(self,document,width,height):
+        """Initializes new Resize and resizes the document."""
+        self.old_size = (document.width,document.height)
+        self.new_size = (width,height)
+        #Codels cut off, as runs of (x, y, old codes)
+        self.cut = []
+        for y in xrange(min(height,document.height)):
+            if width < document.width:
+                start = document.index(width,y)
+                self.cut.append((width,y,document.data[start:start+document.width-width]))
+        for y in xrange(height,document.height):
+            start = document.index(0,y)
+            self.cut.append((0,y,document.data[start:start+document.width]))
+        document.resize(width,height)
+
+    def redo(self,document):
+        """Resizes the document again."""
+        document.resize(*self.new_size)
+
+    def undo(self,document):
+        """Puts the document back to its old size with its cut off codels."""
+        document.resize(*self.old_size)
+        for x,y,old in self.cut:
+            start = document.index(x,y)
+            document.data[start:start+len(old)] = old
+
+    def size(self):
+        """Returns roughly how many bytes the resize takes."""
+        return edit_overhead + sum(len(old)+run_overhead for x,y,old in self.cut)
+
+
+class EditHistory:
+    """Class for the edits that can be undone and redone. Edits are added
+    once they have been done to the document. The oldest are forgotten when
+    the edits kept take more than budget bytes."""
+    def __init__(self,budget=default_budget):
+        """Initializes new EditHistory."""
+        self.budget = budget
+        self.undo_edits = collections.deque()
+        self.redo_edits = []
+        #Bytes taken by the edits in both stacks
+        self.size = 0
+
+    def add(self,edit):
+        """Adds an edit that has just been done. Edits that were undone can't
+        be redone after it."""
+        for undone in self.redo_edits:
+            self.size = self.size - undone.size()
+        self.redo_edits = []
+        self.undo_edits.append(edit)
+        self.size = self.size + edit.size()
+        while self.size > self.budget and self.undo_edits:
+            self.size = self.size - self.undo_edits.popleft().size()
+
+    def undo(self,document):
+        """Undoes the last edit and returns it, or None if there isn't one."""
+        if not self.undo_edits:
+            return None
+        edit = self.undo_edits.pop()
+        edit.undo(document)
+        self.redo_edits.append(edit)
+        return edit
+
+    def redo(self,document):
+        """Redoes the last edit undone and returns it, or None if there isn't
+        one."""
+        if not self.redo_edits:
+            return None
+        edit = self.redo_edits.pop()
+        edit.redo(document)
+        self.undo_edits.append(edit)
+        return edit
+
+    def can_undo(self):
+        """Tells us whether there is an edit to undo."""
+        return bool(self.undo_edits)
+
+    def can_redo(self):
+        """Tells us whether there is an edit to redo."""
+        return bool(self.redo_edits)
+
+    def clear(self):
+        """Forgets all the edits."""
+        self.undo_edits.clear()
+        self.redo_edits = []
+        self.size = 0
@@ -0,0 +1,144 @@
+"""Tests for running corpora of programs in parallel."""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.batch
+import piedit.document
+import piedit.export
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+#Red, magenta and light blue: reads a character and writes it out
+echo_colors = ("#FF0000","#FF00FF","#C0C0FF","#000000")
+
+
+def without_times(result):
+    """Returns a copy of a result without the timings, which change from
+    run to run."""
+    result = dict(result)
+    for key in ("load_time","run_time"):
+        result.pop(key,None)
+    return result
+
+
+class BatchTest(unittest.TestCase):
+    """Batch runs should give the results of running each job on its own."""
+    def setUp(self):
+        """Makes a directory of programs."""
+        self.directory = tempfile.mkdtemp()
+        for name in ("hello.png","alpha_filled.png","japh.png"):
+            shutil.copy(os.path.join(programs,name),os.path.join(self.directory,name))
+        open(os.path.join(self.directory,"notes.txt"),"w").write("not a program")
+        open(os.path.join(self.directory,"broken.png"),"wb").write("not an image")
+
+    def tearDown(self):
+        """Removes the programs."""
+        shutil.rmtree(self.directory)
+
+    def test_find_directory(self):
+        """Directories give a job for each image, in name order, with the
+        defaults."""
+        jobs = piedit.batch.find_jobs(self.directory,{"max_steps":5})
+        self.assertEqual([os.path.basename(job["path"]) for job in jobs],
+            ["alpha_filled.png","broken.png","hello.png","japh.png"])
+        self.assertEqual([job["index"] for job in jobs],range(4))
+        self.assertEqual([job["max_steps"] for job in jobs],[5]*4)
+
+    def test_find_manifest(self):
+        """Manifest entries are relative to the manifest and override the
+        defaults."""
+        manifest = os.path.join(self.directory,"manifest.jsonl")
+        file = open(manifest,"w")
+        file.write(json.dumps({"path":"hello.png", "input":"a"})+"\n\n")
+        file.write(json.dumps({"path":"japh.png", "max_steps":10})+"\n")
+        file.close()
+        jobs = piedit.batch.find_jobs(manifest,{"max_steps":5, "input":"b"})
+        self.assertEqual([(job["path"],job["input"],job["max_steps"],job["index"]) for job in jobs],
+            [(os.path.join(self.directory,"hello.png"),"a",5,0),
+            (os.path.join(self.directory,"japh.png"),"b",10,1)])
+
+    def test_results(self):
+        """Results come back in job order, as running the jobs here gives,
+        and each is passed to the callback."""
+        jobs = piedit.batch.find_jobs(self.directory,{"max_steps":20000})
+        called = []
+        results = piedit.batch.run_batch(jobs,2,called.append)
+        self.assertEqual([without_times(result) for result in results],
+            [without_times(piedit.batch.run_job(job)) for job in jobs])
+        self.assertEqual(sorted(result["index"] for result in called),range(4))
+        self.assertEqual(results[1]["exit_reason"],"ERROR")
+        self.assertEqual(results[2]["output"],u"Hello world!")
+        self.assertEqual(results[3]["exit_reason"],"MAX_STEPS")
+
+    def test_time_limit(self):
+        """Jobs over their time limit are stopped without holding up the
+        others."""
+        jobs = piedit.batch.find_jobs(self.directory,{"max_steps":-1, "time_limit":0.5})
+        results = piedit.batch.run_batch(jobs,2)
+        self.assertEqual([result["exit_reason"] for result in results],
+            ["FINISHED","ERROR","FINISHED","TIME_LIMIT"])
+
+
+class InputsTest(unittest.TestCase):
+    """Running a program against many inputs should give the results of
+    running it on each."""
+    def setUp(self):
+        """Saves a program that echoes its input."""
+        self.directory = tempfile.mkdtemp()
+        self.echo = os.path.join(self.directory,"echo.png")
+        document = piedit.document.Document(len(echo_colors),1)
+        for x,color in enumerate(echo_colors):
+            document.set(x,0,color)
+        piedit.export.export_document(document,self.echo)
+
+    def tearDown(self):
+        """Removes the program."""
+        shutil.rmtree(self.directory)
+
+    def run_inputs(self,path,inputs,processes,use_cache=True):
+        """Returns the results for the inputs, without timings."""
+        return [without_times(result) for result in
+            piedit.batch.run_inputs(path,inputs,2000,processes,use_cache)]
+
+    def test_reads_input(self):
+        """Programs that read input are run for every input, the same on
+        workers as here."""
+        inputs = ["a","b","","cd"]
+        results = self.run_inputs(self.echo,inputs,2)
+        self.assertEqual(results,self.run_inputs(self.echo,inputs,1))
+        self.assertEqual([result["index"] for result in results],range(4))
+        self.assertEqual([result["output"][:1] for result in results],[u"a",u"b",u"",u"c"])
+        self.assertFalse([result for result in results if result.get("cached")])
+
+    def test_no_input(self):
+        """Programs that read no input are run once, unless told not to."""
+        hello = os.path.join(programs,"hello.png")
+        results = self.run_inputs(hello,["a","b","c"],2)
+        self.assertEqual([result.get("cached") for result in results],[None,True,True])
+        self.assertEqual([result["output"] for result in results],[u"Hello world!"]*3)
+        self.assertEqual([result["index"] for result in results],range(3))
+        results = self.run_inputs(hello,["a","b","c"],2,False)
+        self.assertFalse([result for result in results if result.get("cached")])
+        self.assertEqual(results[1:],[dict(results[0],index=1),dict(results[0],index=2)])
+        self.assertEqual(self.run_inputs(hello,[],2),[])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""Tests for stopping programs at breakpoints."""
+
+import os
+import sys
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.breakpoints
+import piedit.deltalog
+import piedit.interpreter
+import piedit.inputsource
+import piedit.outputsink
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+
+class BreakpointsTest(unittest.TestCase):
+    """Breakpoints should stop a run, fused or not, just after they're
+    hit."""
+    def setUp(self):
+        """Loads hello.png with no breakpoints yet."""
+        self.setUp_interpreter()
+        self.breakpoints = piedit.breakpoints.Breakpoints()
+        self.breakpoints.attach(self.interpreter)
+
+    def setUp_interpreter(self):
+        """Loads hello.png into a new interpreter."""
+        self.interpreter = piedit.interpreter.Interpreter(
+            output=piedit.outputsink.MemoryOutput(),
+            input=piedit.inputsource.StringInput(""))
+        self.interpreter.run_program(os.path.join(programs,"hello.png"),start=False)
+
+    def run_on(self):
+        """Runs until the program finishes or hits a breakpoint."""
+        while not self.interpreter.finished:
+            self.interpreter.run_steps(1000)
+
+    def test_op(self):
+        """Operation breakpoints stop once the operation is done, and the
+        run carries on after resuming."""
+        self.breakpoints.add("op OUT(Char)")
+        output = []
+        while True:
+            self.run_on()
+            if self.interpreter.exit_reason != "BREAKPOINT":
+                break
+            self.assertEqual(self.breakpoints.hit_reason,"op OUT(Char)")
+            output.append(self.interpreter.output.getvalue())
+            self.breakpoints.resume()
+        self.assertEqual(output,["Hello world!"[:i] for i in xrange(1,13)])
+        self.assertEqual(self.interpreter.exit_reason,"FINISHED")
+
+    def test_stack(self):
+        """Stack breakpoints stop at the first step where they hold."""
+        self.breakpoints.add("stack depth >= 3")
+        self.run_on()
+        self.assertEqual(self.interpreter.exit_reason,"BREAKPOINT")
+        self.assertEqual(len(self.interpreter.stack),3)
+        self.assertEqual(self.breakpoints.hit_reason,"stack depth >= 3")
+
+    def test_codel(self):
+        """Codel breakpoints stop on entering the codel's block, which is
+        first done at step 24."""
+        self.breakpoints.add("codel 25 23")
+        label = self.interpreter.pixels[25][23].set_label
+        self.run_on()
+        self.assertEqual(self.interpreter.exit_reason,"BREAKPOINT")
+        self.assertEqual(self.interpreter.current_pixel.set_label,label)
+        self.assertEqual(self.interpreter.current_step,24)
+        self.assertEqual(self.breakpoints.hit_reason,"codel (%d,%d)" %
+            (self.interpreter.current_pixel.x,self.interpreter.current_pixel.y))
+
+    def test_step(self):
+        """Runs up to step breakpoints stop exactly on them."""
+        log = piedit.deltalog.DeltaLog(self.interpreter)
+        self.breakpoints.add("step 7")
+        self.breakpoints.add("step 30")
+        log.run_on(self.breakpoints.next_step(self.interpreter.current_step))
+        self.assertEqual(self.interpreter.current_step,7)
+        log.run_on(self.breakpoints.next_step(self.interpreter.current_step))
+        self.assertEqual(self.interpreter.current_step,30)
+        self.assertEqual(self.breakpoints.next_step(30),None)
+
+    def test_attach_again(self):
+        """Attaching to a new interpreter, as each debug run does, leaves
+        the old one as it was and stops in the new one."""
+        self.breakpoints.add("stack depth >= 3")
+        self.run_on()
+        old = self.interpreter
+        old_output = old.output.getvalue()
+        for ops in ([],["op OUT(Char)"]):
+            self.setUp_interpreter()
+            for text in ops:
+                self.breakpoints.add(text)
+            self.breakpoints.attach(self.interpreter)
+            self.breakpoints.clear()
+            self.run_on()
+            self.assertEqual(self.interpreter.output.getvalue(),"Hello world!")
+            self.assertEqual(old.output.getvalue(),old_output)
+            self.assertEqual(old.breakpoints,None)
+            self.assertFalse("do_next_step" in old.__dict__)
+        self.breakpoints.add("op OUT(Char)")
+        self.setUp_interpreter()
+        self.breakpoints.attach(self.interpreter)
+        self.run_on()
+        self.assertEqual(self.interpreter.output.getvalue(),"H")
+        self.assertEqual(self.breakpoints.hit_reason,"op OUT(Char)")
+
+    def test_no_op_breakpoints(self):
+        """Operations are left alone without op breakpoints."""
+        operations = dict(self.interpreter.operations)
+        self.breakpoints.add("stack depth >= 3")
+        self.assertEqual(self.interpreter.operations,operations)
+        self.assertEqual(self.breakpoints.saved_operations,None)
+
+    def test_bad(self):
+        """Badly written breakpoints aren't added."""
+        for text in ("","codel 1","step x","stack size > 1","stack top ~ 1","watch 1"):
+            self.assertRaises(ValueError,self.breakpoints.add,text)
+
+    def test_clear(self):
+        """Cleared breakpoints don't stop the run."""
+        self.breakpoints.add("op OUT(Char)")
+        self.breakpoints.add("stack depth >= 3")
+        self.breakpoints.clear()
+        self.run_on()
+        self.assertEqual(self.interpreter.exit_reason,"FINISHED")
+        self.assertEqual(self.interpreter.output.getvalue(),"Hello world!")
+
+
+if __name__ == "__main__":
+    unittest.main()
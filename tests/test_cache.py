@@ -0,0 +1,159 @@
+"""Tests for the least-recently-used caches and the results cached by batch
+runs."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.batch
+import piedit.cache
+import piedit.document
+import piedit.export
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+#Red, magenta and light blue: reads a character and writes it out
+echo_colors = ("#FF0000","#FF00FF","#C0C0FF","#000000")
+
+
+def result(**fields):
+    """Returns a result that can be cached, with the given fields changed."""
+    value = {"exit_reason":"FINISHED", "steps":10, "output":u"hi", "input_read":False}
+    value.update(fields)
+    return value
+
+
+class LRUCacheTest(unittest.TestCase):
+    """The least recently used entries should be dropped first."""
+    def test_drops_oldest(self):
+        """Getting an entry keeps it over ones put after it."""
+        cache = piedit.cache.LRUCache(3)
+        for key in "abc":
+            cache.put(key,key.upper())
+        self.assertEqual(cache.get("a"),"A")
+        cache.put("d","D")
+        self.assertFalse("b" in cache)
+        self.assertEqual([key for key in "acd" if key in cache],["a","c","d"])
+        self.assertEqual(len(cache),3)
+        self.assertEqual(cache.get("b","none"),"none")
+
+    def test_put_again(self):
+        """Putting a key again replaces its value without growing."""
+        cache = piedit.cache.LRUCache(2)
+        cache.put("a",1)
+        cache.put("a",2)
+        self.assertEqual(len(cache),1)
+        self.assertEqual(cache.get("a"),2)
+
+
+class ResultCacheTest(unittest.TestCase):
+    """Only results that would come out the same again should be kept, and
+    only for the same limits."""
+    def test_lookup(self):
+        """Results come back marked as cached, as copies."""
+        cache = piedit.cache.ResultCache()
+        cache.store("hash",1000,result())
+        found = cache.lookup("hash",1000)
+        self.assertEqual(found["output"],u"hi")
+        self.assertTrue(found["cached"])
+        found["output"] = u"changed"
+        self.assertEqual(cache.lookup("hash",1000)["output"],u"hi")
+
+    def test_limits_in_key(self):
+        """Results for other step or stack limits aren't used."""
+        cache = piedit.cache.ResultCache()
+        cache.store("hash",1000,result(),stack_limit=5)
+        self.assertEqual(cache.lookup("hash",1000),None)
+        self.assertEqual(cache.lookup("hash",2000,5),None)
+        self.assertNotEqual(cache.lookup("hash",1000,5),None)
+
+    def test_not_kept(self):
+        """Runs that read input, were stopped from outside or wrote too
+        much aren't kept."""
+        cache = piedit.cache.ResultCache(max_output=5)
+        cache.store("input",1000,result(input_read=True))
+        cache.store("time",1000,result(exit_reason="TIME_LIMIT"))
+        cache.store("error",1000,result(exit_reason="ERROR"))
+        cache.store("big",1000,result(output=u"too long"))
+        cache.store("stack",1000,result(exit_reason="STACK_LIMIT"))
+        self.assertEqual(len(cache),1)
+        self.assertNotEqual(cache.lookup("stack",1000),None)
+
+
+class BatchCacheTest(unittest.TestCase):
+    """Batch runs should answer repeated programs from the cache."""
+    def setUp(self):
+        """Makes a directory of programs with copies of hello.png."""
+        self.directory = tempfile.mkdtemp()
+        for name in ("a.png","b.png"):
+            shutil.copy(os.path.join(programs,"hello.png"),os.path.join(self.directory,name))
+        document = piedit.document.Document(len(echo_colors),1)
+        for x,color in enumerate(echo_colors):
+            document.set(x,0,color)
+        piedit.export.export_document(document,os.path.join(self.directory,"echo.png"))
+        shutil.copy(os.path.join(self.directory,"echo.png"),os.path.join(self.directory,"echo2.png"))
+
+    def tearDown(self):
+        """Removes the programs."""
+        shutil.rmtree(self.directory)
+
+    def run_jobs(self,defaults,result_cache):
+        """Runs every program in the directory one at a time, so later ones
+        can use earlier ones' results."""
+        jobs = piedit.batch.find_jobs(self.directory,defaults)
+        return piedit.batch.run_batch(jobs,1,None,result_cache)
+
+    def test_copies(self):
+        """Copies of a program that reads no input share its result, and
+        programs that read input are always run."""
+        results = self.run_jobs({"input":"x","max_steps":2000},piedit.cache.ResultCache())
+        a,b,echo,echo2 = results
+        self.assertFalse(a.get("cached"))
+        self.assertTrue(b.get("cached"))
+        self.assertEqual(b["output"],u"Hello world!")
+        self.assertEqual(b["path"],os.path.join(self.directory,"b.png"))
+        self.assertEqual(b["index"],1)
+        self.assertTrue(echo["input_read"])
+        self.assertTrue(echo["output"].startswith(u"x"))
+        self.assertFalse(echo2.get("cached"))
+
+    def test_time_limit(self):
+        """Jobs with time limits are always run."""
+        results = self.run_jobs({"time_limit":30},piedit.cache.ResultCache())
+        self.assertFalse([result for result in results if result.get("cached")])
+
+    def test_shared_cache(self):
+        """A cache kept between batches answers the whole second batch, but
+        not for other limits."""
+        cache = piedit.cache.ResultCache()
+        self.run_jobs({},cache)
+        self.assertTrue(self.run_jobs({},cache)[0].get("cached"))
+        self.assertFalse(self.run_jobs({"stack_limit":100},cache)[0].get("cached"))
+        self.assertFalse(self.run_jobs({"max_steps":500},cache)[0].get("cached"))
+
+    def test_file_hash(self):
+        """Files are hashed by their bytes without being decoded."""
+        path = os.path.join(self.directory,"junk.png")
+        open(path,"wb").write("not an image")
+        self.assertNotEqual(piedit.batch.file_hash(path),None)
+        self.assertEqual(piedit.batch.file_hash(os.path.join(self.directory,"a.png")),
+            piedit.batch.file_hash(os.path.join(self.directory,"b.png")))
+        self.assertEqual(piedit.batch.file_hash(os.path.join(self.directory,"missing.png")),None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Tests for saving a run part way through and carrying on from it."""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.checkpoint
+import piedit.interpreter
+import piedit.inputsource
+import piedit.outputsink
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+#Seconds a command line run is given before it is taken to have hung
+run_timeout = 60
+
+
+def new_interpreter(filename,max_steps=1000000):
+    """Returns an interpreter with a sample program loaded."""
+    interpreter = piedit.interpreter.Interpreter(max_steps=max_steps,
+        output=piedit.outputsink.MemoryOutput(),
+        input=piedit.inputsource.StringInput(""))
+    interpreter.run_program(os.path.join(programs,filename),start=False)
+    return interpreter
+
+def run_command(args):
+    """Runs the interpreter's command line, killing it if it hangs. Returns
+    the exit status, or None if it was killed."""
+    process = subprocess.Popen([sys.executable,os.path.join(root,"piedit","interpreter.py")]+args,
+        stdin=open(os.devnull),stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+    timer = threading.Timer(run_timeout,process.kill)
+    timer.start()
+    try:
+        process.communicate()
+    finally:
+        timer.cancel()
+    if process.returncode < 0:
+        return None
+    return process.returncode
+
+
+class CheckpointTest(unittest.TestCase):
+    """Resuming from a checkpoint should carry on as if the run hadn't
+    stopped."""
+    def setUp(self):
+        """Makes a directory for the checkpoint files."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory,"checkpoint")
+
+    def tearDown(self):
+        """Removes the checkpoint files."""
+        shutil.rmtree(self.directory)
+
+    def test_resume(self):
+        """A run resumed from a file finishes with the rest of the output."""
+        whole = new_interpreter("alpha_filled.png")
+        whole.start_execution()
+        first = new_interpreter("alpha_filled.png",max_steps=1001)
+        first.start_execution()
+        self.assertEqual(first.exit_reason,"MAX_STEPS")
+        piedit.checkpoint.write_state(piedit.checkpoint.save_state(first),self.path)
+        second = new_interpreter("alpha_filled.png")
+        piedit.checkpoint.restore_state(second,piedit.checkpoint.load_checkpoint(self.path))
+        self.assertEqual(second.current_step,1001)
+        second.start_execution()
+        self.assertEqual(second.exit_reason,"FINISHED")
+        self.assertEqual(second.current_step,whole.current_step)
+        self.assertEqual(first.output.getvalue()+second.output.getvalue(),whole.output.getvalue())
+
+    def test_past_max_steps(self):
+        """Resuming from past the maximum steps finishes straight away,
+        with or without checkpoints being taken."""
+        first = new_interpreter("99bottles.png",max_steps=3000)
+        first.start_execution()
+        state = piedit.checkpoint.save_state(first)
+        for checkpointer in (None,piedit.checkpoint.CheckpointWriter(self.path)):
+            second = new_interpreter("99bottles.png",max_steps=2000)
+            second.checkpointer = checkpointer
+            piedit.checkpoint.restore_state(second,state)
+            second.start_execution()
+            self.assertEqual(second.exit_reason,"MAX_STEPS")
+            self.assertEqual(second.current_step,3000)
+            self.assertEqual(second.output.getvalue(),"")
+
+    def test_past_max_steps_command(self):
+        """The command line doesn't hang resuming from past -m."""
+        program = os.path.join(programs,"99bottles.png")
+        self.assertEqual(run_command(["-m","3000","--checkpoint",self.path,program]),0)
+        self.assertEqual(piedit.checkpoint.load_checkpoint(self.path)["current_step"],3000)
+        self.assertEqual(run_command(["-m","2000","--resume",self.path,
+            "--checkpoint",self.path+"2",program]),0)
+        self.assertEqual(run_command(["-m","2000","--resume",self.path,program]),0)
+
+    def test_program_mismatch(self):
+        """Checkpoints of other programs aren't resumed."""
+        state = piedit.checkpoint.save_state(new_interpreter("hello.png"))
+        self.assertRaises(ValueError,piedit.checkpoint.restore_state,
+            new_interpreter("alpha_filled.png"),state)
+        state["version"] = piedit.checkpoint.version+1
+        self.assertRaises(ValueError,piedit.checkpoint.restore_state,
+            new_interpreter("hello.png"),state)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Tests for stepping programs backwards and jumping between steps."""
+
+import os
+import sys
+import random
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.deltalog
+import piedit.interpreter
+import piedit.inputsource
+import piedit.outputsink
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+
+def new_interpreter(filename,input=""):
+    """Returns an interpreter with a sample program loaded."""
+    interpreter = piedit.interpreter.Interpreter(
+        output=piedit.outputsink.MemoryOutput(),
+        input=piedit.inputsource.StringInput(input))
+    interpreter.run_program(os.path.join(programs,filename),start=False)
+    return interpreter
+
+def state(interpreter):
+    """Returns what the interpreter's state is."""
+    pixel = interpreter.current_pixel
+    return (interpreter.current_step,pixel.x,pixel.y,interpreter.dp,
+        interpreter.cc,interpreter.switch_cc,interpreter.step,
+        interpreter.times_stopped,list(interpreter.stack))
+
+
+class DeltaLogTest(unittest.TestCase):
+    """Going back to a step should give the state the program had there."""
+    def record(self,filename,input="",**options):
+        """Steps through a program, keeping the state at each step, and
+        returns its interpreter, log and states."""
+        interpreter = new_interpreter(filename,input)
+        log = piedit.deltalog.DeltaLog(interpreter,**options)
+        states = [state(interpreter)]
+        running = True
+        while running:
+            running = log.step_forward()
+            states.append(state(interpreter))
+        return interpreter,log,states
+
+    def test_step_back(self):
+        """Stepping back undoes each step in turn."""
+        interpreter,log,states = self.record("hello.png")
+        self.assertEqual(interpreter.output.getvalue(),"Hello world!")
+        for expected in reversed(states):
+            self.assertEqual(state(interpreter),expected)
+            log.step_back()
+        self.assertEqual(state(interpreter),states[0])
+        self.assertFalse(log.step_back())
+
+    def test_jump_to(self):
+        """Jumping anywhere gives the state at that step, from snapshots
+        once the deltas have run out, and output isn't written twice."""
+        interpreter,log,states = self.record("alpha_filled.png",
+            max_deltas=10,snapshot_every=7,max_snapshots=1000)
+        output = interpreter.output.getvalue()
+        rng = random.Random(1)
+        for i in xrange(200):
+            step = rng.randint(0,len(states)-1)
+            log.jump_to(step)
+            self.assertEqual(state(interpreter),states[step])
+        log.jump_to(len(states))
+        self.assertEqual(state(interpreter),states[-1])
+        self.assertEqual(interpreter.exit_reason,"FINISHED")
+        self.assertEqual(interpreter.output.getvalue(),output)
+
+    def test_step_back_over_snapshot(self):
+        """Stepping back before the deltas goes through the snapshots."""
+        interpreter,log,states = self.record("hello.png",max_deltas=5,snapshot_every=4)
+        for expected in reversed(states):
+            self.assertEqual(state(interpreter),expected)
+            log.step_back()
+
+    def test_run_on(self):
+        """Running at full speed can be gone back into."""
+        interpreter,log,states = self.record("alpha_filled.png")
+        interpreter = new_interpreter("alpha_filled.png")
+        log = piedit.deltalog.DeltaLog(interpreter,snapshot_every=100)
+        log.run_on(1000)
+        self.assertEqual(state(interpreter),states[1000])
+        log.run_on()
+        self.assertEqual(interpreter.output.getvalue(),"abcdefghijklmnopqrstuvwxyz")
+        for step in (2000,150,999,0,2500):
+            log.jump_to(step)
+            self.assertEqual(state(interpreter),states[step])
+        log.step_back()
+        self.assertEqual(state(interpreter),states[2499])
+
+    def test_run_on_optimize(self):
+        """Running at full speed only fuses operations if the interpreter
+        did before, and leaves stepping unfused."""
+        for optimize in (True,False):
+            interpreter = new_interpreter("hello.png")
+            interpreter.optimize = optimize
+            log = piedit.deltalog.DeltaLog(interpreter)
+            log.run_on()
+            self.assertEqual(interpreter.output.getvalue(),"Hello world!")
+            self.assertEqual(bool(interpreter.superinstructions),optimize)
+            self.assertFalse(interpreter.optimize)
+
+    def test_input(self):
+        """Input read by steps that are undone is read again."""
+        interpreter,log,states = self.record("primetest.png","7\n")
+        output = interpreter.output.getvalue()
+        log.jump_to(0)
+        while log.step_forward():
+            pass
+        self.assertEqual(state(interpreter),states[-1])
+        self.assertEqual(interpreter.output.getvalue(),output)
+
+
+if __name__ == "__main__":
+    unittest.main()
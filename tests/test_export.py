@@ -0,0 +1,108 @@
+"""Tests for writing programs out as images."""
+
+import os
+import sys
+import shutil
+import tempfile
+import StringIO
+import unittest
+import PIL.Image
+import PIL.ImageChops
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.document
+import piedit.export
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+
+def same_pixels(path,other_path,codel_size=1):
+    """Tells us whether two images have the same pixels, once the first is
+    scaled up by codel_size."""
+    image = PIL.Image.open(path).convert("RGB")
+    other = PIL.Image.open(other_path).convert("RGB")
+    if codel_size > 1:
+        image = image.resize((image.size[0]*codel_size,image.size[1]*codel_size),PIL.Image.NEAREST)
+    return image.size == other.size and PIL.ImageChops.difference(image,other).getbbox() == None
+
+
+class ExportTest(unittest.TestCase):
+    """Exported images should have the program's colors, or not be written."""
+    def setUp(self):
+        """Makes a directory for the images written."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Removes the images."""
+        shutil.rmtree(self.directory)
+
+    def test_same_pixels(self):
+        """Programs are written with their own colors, scaled up by the
+        codel size."""
+        for name in ("hello.png","99bottles.png","Piet_hello2.png"):
+            path = os.path.join(self.directory,name)
+            for codel_size in (1,3):
+                self.assertFalse(piedit.export.export_file(os.path.join(programs,name),path,codel_size))
+                self.assertTrue(same_pixels(os.path.join(programs,name),path,codel_size))
+
+    def test_lossy(self):
+        """Images with more colors than a document holds aren't written
+        unless asked, and are marked when they are."""
+        source = os.path.join(programs,"Piet_hello2.jpg")
+        self.assertTrue(piedit.document.from_image(PIL.Image.open(source)).lossy)
+        path = os.path.join(self.directory,"hello.png")
+        self.assertRaises(IOError,piedit.export.export_file,source,path)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(piedit.export.export_file(source,path,lossy=True))
+        self.assertFalse(same_pixels(source,path))
+
+    def test_few_colors(self):
+        """Documents keep every color until the palette is full."""
+        document = piedit.document.Document(16,16)
+        for i in xrange(piedit.document.max_colors-len(document.palette)):
+            document.set(i%16,i/16,"#%02X%02X01" % (i,i))
+        self.assertFalse(document.lossy)
+        document.set(15,15,"#123456")
+        self.assertTrue(document.lossy)
+
+    def test_directory(self):
+        """Directories stop at a lossy image unless asked, and say which
+        were changed."""
+        sources = os.path.join(self.directory,"sources")
+        os.mkdir(sources)
+        for name in ("Piet_hello2.jpg","hello.png"):
+            shutil.copy(os.path.join(programs,name),os.path.join(sources,name))
+        out = os.path.join(self.directory,"out")
+        self.assertRaises(IOError,piedit.export.export_directory,sources,out)
+        self.assertEqual(piedit.export.export_directory(sources,out,lossy=True),
+            [(os.path.join(out,"Piet_hello2.png"),True),(os.path.join(out,"hello.png"),False)])
+
+    def test_command(self):
+        """The command line refuses lossy images without --lossy."""
+        source = os.path.join(programs,"Piet_hello2.jpg")
+        path = os.path.join(self.directory,"hello.png")
+        stdout,stderr = sys.stdout,sys.stderr
+        sys.stdout,sys.stderr = StringIO.StringIO(),StringIO.StringIO()
+        try:
+            self.assertEqual(piedit.export.main([source,path]),1)
+            self.assertTrue("--lossy" in sys.stdout.getvalue())
+            self.assertEqual(piedit.export.main(["--lossy",source,path]),0)
+            self.assertTrue("Warning" in sys.stderr.getvalue())
+        finally:
+            sys.stdout,sys.stderr = stdout,stderr
+        self.assertTrue(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Tests for reading numbers and characters from input sources."""
+
+import os
+import sys
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.inputsource
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+class ReadNumberTest(unittest.TestCase):
+    """Numbers are read whole, skipping whitespace before them."""
+    def read_numbers(self,text,count):
+        """Returns the next count numbers read from the text."""
+        source = piedit.inputsource.StringInput(text)
+        return [source.read_number() for i in xrange(count)]
+
+    def test_numbers(self):
+        """Signed numbers are read across whitespace and lines."""
+        self.assertEqual(self.read_numbers("  42\n-7 +5",4),[42,-7,5,None])
+
+    def test_not_a_number(self):
+        """Characters that aren't numbers are thrown away one at a time."""
+        self.assertEqual(self.read_numbers("ab 3",3),[None,None,3])
+        self.assertEqual(self.read_numbers("12abc",2),[12,None])
+        self.assertEqual(self.read_numbers("- 3",2),[None,3])
+
+    def test_end(self):
+        """The end of the input gives None."""
+        self.assertEqual(self.read_numbers("",2),[None,None])
+        self.assertEqual(self.read_numbers("  \n",1),[None])
+
+    def test_mixed_with_chars(self):
+        """Characters are read from just after the number."""
+        source = piedit.inputsource.StringInput("a 10b")
+        self.assertEqual(source.read_char(),"a")
+        self.assertEqual(source.read_number(),10)
+        self.assertEqual(source.read_char(),"b")
+        self.assertEqual(source.read_char(),None)
+
+    def test_pending(self):
+        """A queue waits for the end of a number before reading it, and
+        nothing is read while it waits."""
+        source = piedit.inputsource.QueueInput()
+        source.feed(" 12")
+        self.assertRaises(piedit.inputsource.InputPending,source.read_number)
+        source.feed("3\n")
+        self.assertEqual(source.read_number(),123)
+        source.feed("4")
+        source.close()
+        self.assertEqual(source.read_number(),4)
+        self.assertEqual(source.read_number(),None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+"""Tests for the interpreter's fused operations, rolls and loop detection."""
+
+import os
+import sys
+import random
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.document
+import piedit.interpreter
+import piedit.inputsource
+import piedit.outputsink
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+#Light red, red and dark red, so each block pushes its size onto the stack
+push_cycle = ("#FFC0C0","#FF0000","#C00000")
+
+
+def new_interpreter(max_steps=1000000,input=""):
+    """Returns an interpreter writing to memory and reading from a string."""
+    return piedit.interpreter.Interpreter(max_steps=max_steps,
+        output=piedit.outputsink.MemoryOutput(),
+        input=piedit.inputsource.StringInput(input))
+
+def run(optimize,path=None,document=None,max_steps=1000000,input=""):
+    """Runs a program, fused or not, and returns what it did."""
+    interpreter = new_interpreter(max_steps,input)
+    interpreter.optimize = optimize
+    interpreter.run_program(path,document)
+    pixel = interpreter.current_pixel
+    return (interpreter.output.getvalue(),interpreter.exit_reason,
+        interpreter.current_step,interpreter.stack,
+        (pixel.x,pixel.y,interpreter.dp,interpreter.cc))
+
+def row(colors):
+    """Returns a one codel high document of the given colors."""
+    document = piedit.document.Document(len(colors),1)
+    for x,color in enumerate(colors):
+        document.set(x,0,color)
+    return document
+
+def push_chain(length):
+    """Returns a row of length one codel pushes ending in black."""
+    return row([push_cycle[x%3] for x in xrange(length)]+["#000000"])
+
+def single_rolls(stack,depth,num_rolls):
+    """Rolls a stack one roll at a time, as the interpreter used to."""
+    stack = list(stack)
+    for i in xrange(abs(num_rolls)):
+        if num_rolls < 0:
+            index = min(depth,len(stack)-1)
+            bottom_item = stack[0]
+            stack[:index] = stack[1:index+1]
+            stack[index] = bottom_item
+        else:
+            index = len(stack)-min(depth,len(stack))
+            stack[index:] = stack[-1:]+stack[index:-1]
+    return stack
+
+
+class FusedTest(unittest.TestCase):
+    """Fused operations should do exactly what running one step at a time
+    does."""
+    def test_programs(self):
+        """Every sample program gives the same output, exit, steps, stack
+        and position fused and unfused, to an odd number of steps."""
+        for filename in sorted(os.listdir(programs)):
+            path = os.path.join(programs,filename)
+            self.assertEqual(run(True,path,max_steps=20001,input="7\n"),
+                run(False,path,max_steps=20001,input="7\n"),filename)
+
+    def test_max_steps(self):
+        """A fused run of pushes stops at exactly the maximum steps."""
+        for max_steps in xrange(1,20):
+            fused = run(True,document=push_chain(40),max_steps=max_steps)
+            self.assertEqual(fused,run(False,document=push_chain(40),max_steps=max_steps))
+            self.assertEqual(fused[2],max_steps)
+            self.assertEqual(fused[1],"MAX_STEPS")
+
+    def test_run_steps(self):
+        """run_steps doesn't run fused operations past its last step."""
+        for steps in xrange(1,20):
+            interpreter = new_interpreter()
+            interpreter.run_program(document=push_chain(40),start=False)
+            interpreter.run_steps(steps)
+            self.assertEqual(interpreter.current_step,steps)
+
+    def test_chain(self):
+        """A whole chain of pushes, two steps each, leaves the same stack
+        either way."""
+        fused = run(True,document=push_chain(40),max_steps=78)
+        self.assertEqual(fused,run(False,document=push_chain(40),max_steps=78))
+        self.assertEqual(fused[3],[1]*39)
+
+
+class RollTest(unittest.TestCase):
+    """Rolls are done in one go."""
+    def roll(self,stack,depth,num_rolls):
+        """Returns the stack after the Roll operation."""
+        interpreter = new_interpreter()
+        interpreter.stack = list(stack)+[depth,num_rolls]
+        interpreter.op_roll()
+        return interpreter.stack
+
+    def test_matches_single_rolls(self):
+        """Rolls give the same stack as rolling once at a time."""
+        rng = random.Random(1)
+        for i in xrange(2000):
+            stack = [rng.randint(-5,5) for j in xrange(rng.randint(1,8))]
+            num_rolls = rng.randint(-20,20)
+            if num_rolls < 0:
+                #Rolling one at a time went past the end of the stack
+                depth = rng.randint(1,len(stack)-1) if len(stack) > 1 else 0
+            else:
+                depth = rng.randint(1,len(stack)+3)
+            if depth > 0:
+                self.assertEqual(self.roll(stack,depth,num_rolls),
+                    single_rolls(stack,depth,num_rolls),(stack,depth,num_rolls))
+
+    def test_negative(self):
+        """Negative rolls turn the bottom depth+1 items the other way."""
+        self.assertEqual(self.roll([1,2,3,4,5],2,-1),[2,3,1,4,5])
+        self.assertEqual(self.roll([1,2,3,4,5],2,-4),[2,3,1,4,5])
+
+    def test_deep(self):
+        """Rolls deeper than the stack roll all of it."""
+        self.assertEqual(self.roll([1,2,3],10,1),[3,1,2])
+        self.assertEqual(self.roll([1,2,3],10,-1),[2,3,1])
+        self.assertEqual(self.roll([1,2,3],3,3*10**9+1),[3,1,2])
+
+    def test_ignored(self):
+        """Rolls with no depth or count only pop their arguments."""
+        self.assertEqual(self.roll([1,2,3],0,5),[1,2,3])
+        self.assertEqual(self.roll([1,2,3],-2,5),[1,2,3])
+        self.assertEqual(self.roll([1,2,3],2,0),[1,2,3])
+        self.assertEqual(self.roll([],2,1),[])
+
+
+class LoopTest(unittest.TestCase):
+    """Programs going round a loop that doesn't change the stack are
+    stopped."""
+    def test_empty_stack_loop(self):
+        """Greater on an empty stack back and forth never terminates."""
+        for optimize in (True,False):
+            result = run(optimize,document=row(["#FF0000","#00FFFF"]),max_steps=10000)
+            self.assertEqual(result[1],"NON_TERMINATING")
+            self.assertTrue(result[2] < 100)
+
+    def test_changing_loop(self):
+        """Pushing and popping back and forth runs until the maximum
+        steps."""
+        fused = run(True,document=row(["#FFC0C0","#C00000"]),max_steps=1001)
+        self.assertEqual(fused,run(False,document=row(["#FFC0C0","#C00000"]),max_steps=1001))
+        self.assertEqual(fused[1],"MAX_STEPS")
+
+    def test_sample(self):
+        """Piet_hello2.png says hello and then goes round forever."""
+        for optimize in (True,False):
+            result = run(optimize,os.path.join(programs,"Piet_hello2.png"))
+            self.assertEqual(result[1],"NON_TERMINATING")
+            self.assertTrue(result[0].startswith("Hello world"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Tests for stopping runs at time, cpu and stack limits."""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.interpreter
+import piedit.inputsource
+import piedit.outputsink
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+#Seconds a command line run is given before it is taken to have hung
+run_timeout = 60
+
+
+def new_interpreter(filename,max_steps=1000000):
+    """Returns an interpreter with a sample program loaded."""
+    interpreter = piedit.interpreter.Interpreter(max_steps=max_steps,
+        output=piedit.outputsink.MemoryOutput(),
+        input=piedit.inputsource.StringInput(""))
+    interpreter.run_program(os.path.join(programs,filename),start=False)
+    return interpreter
+
+def run_command(args):
+    """Runs the interpreter's command line, killing it if it hangs. Returns
+    the exit status and what was written to stderr. The status is None if
+    it was killed."""
+    process = subprocess.Popen([sys.executable,os.path.join(root,"piedit","interpreter.py")]+args,
+        stdin=open(os.devnull),stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+    timer = threading.Timer(run_timeout,process.kill)
+    timer.start()
+    try:
+        output,errors = process.communicate()
+    finally:
+        timer.cancel()
+    if process.returncode < 0:
+        return None,errors
+    return process.returncode,errors
+
+
+class LimitsTest(unittest.TestCase):
+    """Limits should finish the run with their own exit reasons."""
+    def test_stack(self):
+        """Going over the stack limit stops the run, at the first check
+        after it."""
+        interpreter = new_interpreter("hello.png")
+        interpreter.stack_limit = 2
+        interpreter.check_every = 1
+        interpreter.start_execution()
+        self.assertEqual(interpreter.exit_reason,"STACK_LIMIT")
+        self.assertEqual(len(interpreter.stack),3)
+
+    def test_time(self):
+        """Going over the time limit stops the run soon after."""
+        for name in ("time_limit","cpu_limit"):
+            interpreter = new_interpreter("japh.png")
+            setattr(interpreter,name,0.2)
+            start = time.time()
+            interpreter.start_execution()
+            self.assertEqual(interpreter.exit_reason,name.upper())
+            self.assertTrue(time.time()-start < 2)
+            self.assertTrue(interpreter.current_step < interpreter.max_steps)
+
+    def test_max_steps(self):
+        """The maximum steps aren't a limit, as they never have been."""
+        interpreter = new_interpreter("japh.png",max_steps=5000)
+        interpreter.start_execution()
+        self.assertEqual(interpreter.exit_reason,"MAX_STEPS")
+        self.assertEqual(interpreter.current_step,5000)
+
+
+class ExitStatusTest(unittest.TestCase):
+    """The command line exits with 4 when a limit stops the run."""
+    def setUp(self):
+        """Makes a directory for the checkpoint files."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory,"checkpoint")
+
+    def tearDown(self):
+        """Removes the checkpoint files."""
+        shutil.rmtree(self.directory)
+
+    def test_limits(self):
+        """Each limit exits with 4 and says which it was."""
+        hello = os.path.join(programs,"hello.png")
+        bottles = os.path.join(programs,"99bottles.png")
+        japh = os.path.join(programs,"japh.png")
+        status,errors = run_command(["--stacklimit","5",bottles])
+        self.assertEqual(status,4)
+        self.assertTrue("size limit" in errors)
+        status,errors = run_command(["--timelimit","0.2",japh])
+        self.assertEqual(status,4)
+        self.assertTrue("time limit" in errors)
+        status,errors = run_command(["--cpulimit","0.2",japh])
+        self.assertEqual(status,4)
+        self.assertTrue("cpu time limit" in errors)
+        self.assertEqual(run_command([hello]),(0,""))
+
+    def test_resumed(self):
+        """Resumed runs exit with 4 for limits. Resuming from past the
+        maximum steps exits with 0 straight away, as reaching them does."""
+        program = os.path.join(programs,"99bottles.png")
+        self.assertEqual(run_command(["-m","3000","--checkpoint",self.path,program])[0],0)
+        self.assertEqual(run_command(["-m","-1","--resume",self.path,
+            "--stacklimit","0",program])[0],4)
+        self.assertEqual(run_command(["-m","-1","--resume",self.path,
+            "--timelimit","0.2",program])[0],4)
+        self.assertEqual(run_command(["-m","2000","--resume",self.path,
+            "--timelimit","0.2","--checkpoint",self.path+"2",program])[0],0)
+        self.assertFalse(os.path.exists(self.path+"2"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Tests for folding runs of stack operations into superinstructions."""
+
+import os
+import sys
+import random
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.interpreter
+import piedit.inputsource
+import piedit.outputsink
+import piedit.peephole
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+class FoldTest(unittest.TestCase):
+    """Folded operations should leave the stack as running them one at a
+    time does."""
+    def setUp(self):
+        """Makes an interpreter to run operations on."""
+        self.interpreter = piedit.interpreter.Interpreter(
+            output=piedit.outputsink.MemoryOutput(),
+            input=piedit.inputsource.StringInput(""))
+
+    def run_ops(self,stack,ops):
+        """Returns the stack after running the operations one at a time, or
+        the error raised."""
+        self.interpreter.stack = list(stack)
+        try:
+            for name,size in ops:
+                if name == "Push":
+                    self.interpreter.stack.append(size)
+                else:
+                    self.interpreter.op_methods[name]()
+        except ZeroDivisionError:
+            return "ZeroDivisionError"
+        return self.interpreter.stack
+
+    def run_actions(self,stack,actions):
+        """Returns the stack after running folded actions, as
+        do_superinstruction does, or the error raised."""
+        self.interpreter.stack = list(stack)
+        try:
+            for values,op_name in actions:
+                self.interpreter.stack.extend(values)
+                if op_name != None:
+                    self.interpreter.op_methods[op_name]()
+        except ZeroDivisionError:
+            return "ZeroDivisionError"
+        return self.interpreter.stack
+
+    def test_constants(self):
+        """Pushes and arithmetic on them are folded to literals."""
+        fold = piedit.peephole.fold
+        self.assertEqual(fold([("Push",2),("Push",3),("Add",1)]),[([5],None)])
+        self.assertEqual(fold([("Push",4),("Duplicate",1),("Multiply",1)]),[([16],None)])
+        self.assertEqual(fold([("Push",7),("Push",2),("Mod",1),("Not",1)]),[([0],None)])
+        self.assertEqual(fold([("Push",1),("Pop",1)]),[])
+
+    def test_unknown_values(self):
+        """Operations reaching below the known values are left to run."""
+        fold = piedit.peephole.fold
+        self.assertEqual(fold([("Push",3),("Add",1),("Push",2)]),[([3],"Add"),([2],None)])
+        self.assertEqual(fold([("Pop",1),("Push",2)]),[([],"Pop"),([2],None)])
+
+    def test_divide_by_zero(self):
+        """Dividing by a known zero is left to fail at run time."""
+        fold = piedit.peephole.fold
+        self.assertEqual(fold([("Push",3),("Push",1),("Push",1),("Subtract",1),("Divide",1)]),
+            [([3,0],"Divide")])
+
+    def test_fold_roll(self):
+        """Rolls within the known values are folded, and negative rolls and
+        rolls deeper than the known values aren't."""
+        fold_roll = piedit.peephole.fold_roll
+        known = [1,2,3,4,2,1]
+        self.assertTrue(fold_roll(known))
+        self.assertEqual(known,[1,2,4,3])
+        known = [1,2,3,3,-1]
+        self.assertFalse(fold_roll(known))
+        self.assertEqual(known,[1,2,3,3,-1])
+        known = [1,2,4,1]
+        self.assertFalse(fold_roll(known))
+        self.assertEqual(known,[1,2,4,1])
+        known = [1,2,0,5]
+        self.assertTrue(fold_roll(known))
+        self.assertEqual(known,[1,2])
+
+    def test_random_runs(self):
+        """Random runs of stack operations do the same folded as unfolded,
+        on stacks of any depth."""
+        rng = random.Random(1)
+        names = [name for name in piedit.peephole.stack_ops if name != "Push"]
+        for i in xrange(3000):
+            ops = []
+            for j in xrange(rng.randint(1,12)):
+                if rng.random() < 0.5:
+                    ops.append(("Push",rng.randint(1,5)))
+                else:
+                    ops.append((rng.choice(names),1))
+            stack = [rng.randint(-3,5) for j in xrange(rng.randint(0,4))]
+            self.assertEqual(self.run_actions(stack,piedit.peephole.fold(ops)),
+                self.run_ops(stack,ops),(stack,ops))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Tests for counting what a program goes through as it runs."""
+
+import os
+import sys
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.document
+import piedit.interpreter
+import piedit.inputsource
+import piedit.outputsink
+import piedit.profiler
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+
+def profiled_interpreter(colors):
+    """Returns an interpreter with a profiler attached, loaded with a row of
+    codels of the given colors."""
+    document = piedit.document.Document(len(colors),1)
+    for x,color in enumerate(colors):
+        document.set(x,0,color)
+    interpreter = piedit.interpreter.Interpreter(
+        output=piedit.outputsink.MemoryOutput(),
+        input=piedit.inputsource.StringInput(""))
+    profiler = piedit.profiler.Profiler()
+    profiler.attach(interpreter)
+    interpreter.run_program(document=document,start=False)
+    return interpreter,profiler
+
+
+class WhiteCountTest(unittest.TestCase):
+    """Every white codel a slide goes through should be counted once,
+    including the one it stops on."""
+    def test_obstructed(self):
+        """A slide stopped by the edge counts the codel it stops on."""
+        interpreter,profiler = profiled_interpreter(["#FF0000","#FFFFFF","#FFFFFF"])
+        interpreter.run_steps(3)
+        self.assertEqual(interpreter.step,0)
+        self.assertEqual(profiler.white_counts,{(1,0):1, (2,0):1})
+
+    def test_into_block(self):
+        """A slide stopped by a colored block counts the codel it stops on
+        once."""
+        interpreter,profiler = profiled_interpreter(["#FF0000","#FFFFFF","#FFFFFF","#0000FF"])
+        interpreter.run_steps(3)
+        self.assertEqual(interpreter.step,1)
+        self.assertEqual(profiler.white_counts,{(1,0):1, (2,0):1})
+
+    def test_heatmap(self):
+        """Every white codel slid through shows on the heatmap, and slides
+        are counted."""
+        interpreter,profiler = profiled_interpreter(["#FF0000","#FFFFFF","#FFFFFF"])
+        interpreter.start_execution()
+        counts = profiler.codel_counts()
+        self.assertTrue(counts[1] > 0 and counts[2] > 0)
+        self.assertEqual(profiler.to_dict()["white_slides"]["count"],profiler.white_slides)
+        self.assertTrue(profiler.white_slides > 0)
+
+
+class CountTest(unittest.TestCase):
+    """Blocks and operations should be counted as they are gone through."""
+    def test_hello(self):
+        """Each block left is counted with its edge, and each operation done
+        is counted."""
+        interpreter = piedit.interpreter.Interpreter(
+            output=piedit.outputsink.MemoryOutput(),
+            input=piedit.inputsource.StringInput(""))
+        profiler = piedit.profiler.Profiler()
+        profiler.attach(interpreter)
+        interpreter.run_program(os.path.join(programs,"hello.png"),start=False)
+        interpreter.start_execution()
+        self.assertEqual(interpreter.output.getvalue(),"Hello world!")
+        self.assertEqual(sum(profiler.block_counts.values()),sum(profiler.edge_counts.values()))
+        self.assertEqual(profiler.to_dict()["operations"],{"Push":9, "Duplicate":3, "OUT(Char)":12})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Tests for the execution service's program and result caches."""
+
+import os
+import sys
+import StringIO
+import unittest
+import PIL.Image
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.interpreter
+import piedit.server
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+
+class Service(piedit.server.ExecutionService):
+    """The execution service without a server around it."""
+    def __init__(self,cache_size=4):
+        """Initializes new Service."""
+        self.init_service(1,cache_size,1000000,None)
+
+
+class ServiceTest(unittest.TestCase):
+    """Programs should be decoded once and results reused."""
+    def setUp(self):
+        """Reads hello.png, counting the images the service decodes."""
+        self.data = open(os.path.join(programs,"hello.png"),"rb").read()
+        self.opened = []
+        self.open_image = piedit.interpreter.open_image
+        def open_image(path):
+            self.opened.append(path)
+            return self.open_image(path)
+        piedit.interpreter.open_image = open_image
+
+    def tearDown(self):
+        """Puts back open_image."""
+        piedit.interpreter.open_image = self.open_image
+
+    def test_same_body(self):
+        """A body sent again isn't decoded to find its program."""
+        service = Service()
+        key,interpreter = service.load(self.data)
+        opened = len(self.opened)
+        self.assertEqual(service.load(self.data),(key,interpreter))
+        self.assertEqual(len(self.opened),opened)
+
+    def test_other_format(self):
+        """The same program in another format is decoded, and shares the
+        program loaded before."""
+        service = Service()
+        key,interpreter = service.load(self.data)
+        file = StringIO.StringIO()
+        PIL.Image.open(StringIO.StringIO(self.data)).save(file,"BMP")
+        opened = len(self.opened)
+        self.assertEqual(service.load(file.getvalue()),(key,interpreter))
+        self.assertEqual(len(self.opened),opened+1)
+        self.assertEqual(len(service.bodies),2)
+
+    def test_dropped_program(self):
+        """A body whose program was dropped from the cache is loaded again."""
+        service = Service(cache_size=1)
+        key,interpreter = service.load(self.data)
+        service.load(open(os.path.join(programs,"alpha_filled.png"),"rb").read())
+        self.assertFalse(key in service.programs)
+        again,reloaded = service.load(self.data)
+        self.assertEqual(again,key)
+        self.assertFalse(reloaded is interpreter)
+
+    def test_run(self):
+        """Runs send their output and result, and a run that reads no input
+        is answered from the result cache next time."""
+        service = Service()
+        key,interpreter = service.load(self.data)
+        messages = list(service.run(key,interpreter,"",1000,None))
+        self.assertEqual("".join(message.get("output","") for message in messages),u"Hello world!")
+        self.assertEqual(messages[-1]["exit_reason"],"FINISHED")
+        self.assertFalse(messages[-1].get("cached"))
+        messages = list(service.run(key,interpreter,"",1000,None))
+        self.assertEqual(messages[0],{"output":u"Hello world!"})
+        self.assertTrue(messages[-1]["cached"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Tests for writing execution traces and reading them back."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.interpreter
+import piedit.inputsource
+import piedit.outputsink
+import piedit.tracefile
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+programs = os.path.join(root,"programs")
+
+#(step, block, dp, cc, opcode, stack)
+steps = [
+    (1,0,0,0,0,[]),
+    (2,3,1,1,1,[5]),
+    (3,3,2,0,2,[5,-9]),
+    (4,-1,3,1,0,[5,2**70]),
+    (5,7,0,1,7,[-2**70]),
+    (6,7,0,1,3,[]),
+]
+
+
+class TraceTest(unittest.TestCase):
+    """Traces should read back as they were written."""
+    def setUp(self):
+        """Makes a directory for the trace files."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory,"trace")
+
+    def tearDown(self):
+        """Removes the trace files."""
+        shutil.rmtree(self.directory)
+
+    def write(self,stack_deltas):
+        """Writes the steps to a trace."""
+        writer = piedit.tracefile.TraceWriter(self.path,stack_deltas)
+        for step,block,dp,cc,opcode,stack in steps:
+            writer.record(step,block,dp,cc,opcode,stack)
+        writer.close()
+
+    def test_round_trip(self):
+        """Records without stack deltas read back with 0 for them."""
+        self.write(False)
+        records = list(piedit.tracefile.read_trace(self.path,chunk_records=4))
+        self.assertEqual(records,[piedit.tracefile.TraceRecord(step,block,dp,cc,opcode,len(stack),0,0)
+            for step,block,dp,cc,opcode,stack in steps])
+
+    def test_stack_deltas(self):
+        """Records with stack deltas have the change in depth and the top of
+        the stack, kept within 64 bits."""
+        self.write(True)
+        records = list(piedit.tracefile.read_trace(self.path,chunk_records=4))
+        self.assertEqual([record.depth_change for record in records],[0,1,1,0,-1,-1])
+        self.assertEqual([record.top for record in records],
+            [0,5,-9,piedit.tracefile.max_top,piedit.tracefile.min_top,0])
+        self.assertEqual([record.step for record in records],range(1,7))
+
+    def test_not_a_trace(self):
+        """Files that aren't traces aren't read."""
+        open(self.path,"wb").write("PNG\x00\x01\x00")
+        self.assertRaises(IOError,list,piedit.tracefile.read_trace(self.path))
+        open(self.path,"wb").write("PI")
+        self.assertRaises(IOError,list,piedit.tracefile.read_trace(self.path))
+
+    def test_program(self):
+        """Tracing a program gives a record for each step, in order."""
+        interpreter = piedit.interpreter.Interpreter(
+            output=piedit.outputsink.MemoryOutput(),
+            input=piedit.inputsource.StringInput(""))
+        interpreter.tracer = piedit.tracefile.TraceWriter(self.path,stack_deltas=True)
+        interpreter.run_program(os.path.join(programs,"hello.png"))
+        interpreter.tracer.close()
+        records = list(piedit.tracefile.read_trace(self.path))
+        self.assertEqual([record.step for record in records],range(1,interpreter.current_step+1))
+        self.assertEqual(sum(record.depth_change for record in records),len(interpreter.stack))
+        #"Hello world!" is written a character at a time
+        self.assertEqual(len([record for record in records if record.opcode == 5*3+2]),12)
+
+
+if __name__ == "__main__":
+    unittest.main()
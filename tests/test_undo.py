@@ -0,0 +1,187 @@
+"""Tests for undoing and redoing edits to a document."""
+
+import os
+import sys
+import random
+import unittest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+sys.path.insert(0,root)
+
+import piedit.document
+import piedit.undo
+
+__author__ = "Steven Anderson"
+__copyright__ = "Steven Anderson 2008"
+__credits__ = ["Steven Anderson"]
+__license__ = "GPL"
+__version__ = "0.0.1"
+__maintainer__ = "Steven Anderson"
+__email__ = "steven.james.anderson@googlemail.com"
+__status__ = "Production"
+
+
+def codes(document):
+    """Returns the document's codes row by row."""
+    return [[document.data[document.index(x,y)] for x in xrange(document.width)]
+        for y in xrange(document.height)]
+
+def flood(document,x,y):
+    """Returns the codels joined to x,y through codels of the same code, a
+    codel at a time."""
+    target = document.data[document.index(x,y)]
+    region = set([(x,y)])
+    todo = [(x,y)]
+    while todo:
+        x,y = todo.pop()
+        for n_x,n_y in ((x+1,y),(x-1,y),(x,y+1),(x,y-1)):
+            if 0 <= n_x < document.width and 0 <= n_y < document.height\
+                and (n_x,n_y) not in region\
+                and document.data[document.index(n_x,n_y)] == target:
+                    region.add((n_x,n_y))
+                    todo.append((n_x,n_y))
+    return region
+
+def random_document(rng,width,height,codes):
+    """Returns a document of random codes, with some spare room."""
+    document = piedit.document.Document(width,height)
+    document.resize(width+rng.randint(0,5),height+rng.randint(0,5))
+    document.resize(width,height)
+    for y in xrange(height):
+        for x in xrange(width):
+            document.data[document.index(x,y)] = rng.choice(codes)
+    return document
+
+
+class PatchTest(unittest.TestCase):
+    """Patches should set their codels and put them back exactly."""
+    def test_runs(self):
+        """Runs are set, undone latest first and redone."""
+        document = piedit.document.Document(5,3)
+        before = codes(document)
+        patch = piedit.undo.Patch()
+        patch.add_run(document,1,1,3,4)
+        patch.add_run(document,2,1,3,5)
+        after = codes(document)
+        self.assertEqual(after[1],[before[1][0],4,5,5,5])
+        self.assertEqual(patch.bounds(),(1,1,5,2))
+        self.assertEqual(patch.codels,6)
+        patch.undo(document)
+        self.assertEqual(codes(document),before)
+        patch.redo(document)
+        self.assertEqual(codes(document),after)
+
+    def test_region(self):
+        """Regions are the codels a flood fill reaches, and undo puts back
+        everything else as it was."""
+        rng = random.Random(1)
+        for i in xrange(300):
+            width,height = rng.randint(1,30),rng.randint(1,30)
+            if i%2:
+                document = random_document(rng,width,height,[0,1,2])
+            else:
+                document = random_document(rng,width,height,[0,0,0,1])
+            before = codes(document)
+            x,y = rng.randrange(width),rng.randrange(height)
+            code = rng.randrange(4)
+            if code == before[y][x]:
+                region = set()
+            else:
+                region = flood(document,x,y)
+            patch = piedit.undo.Patch()
+            patch.add_region(document,x,y,code)
+            self.assertEqual(set(patch.codel_positions()),region)
+            self.assertEqual(patch.codels,len(region))
+            after = codes(document)
+            for y in xrange(height):
+                for x in xrange(width):
+                    if (x,y) in region:
+                        self.assertEqual(after[y][x],code)
+                    else:
+                        self.assertEqual(after[y][x],before[y][x])
+            patch.undo(document)
+            self.assertEqual(codes(document),before)
+            patch.redo(document)
+            self.assertEqual(codes(document),after)
+
+    def test_fragmented_region(self):
+        """A comb's teeth are filled through its spine."""
+        document = piedit.document.Document(40,30)
+        for y in xrange(1,30):
+            for x in xrange(1,40,2):
+                document.data[document.index(x,y)] = 4
+        patch = piedit.undo.Patch()
+        patch.add_region(document,0,29,3)
+        self.assertEqual(patch.codels,40+20*29)
+        self.assertEqual(patch.bounds(),(0,0,40,30))
+
+
+class ResizeTest(unittest.TestCase):
+    """Resizes should put back the codels they cut off."""
+    def test_undo(self):
+        """Shrinking and growing in turn can all be undone and redone."""
+        rng = random.Random(1)
+        document = random_document(rng,12,9,range(6))
+        history = piedit.undo.EditHistory()
+        sizes = [(12,9)]
+        documents = [codes(document)]
+        for width,height in ((5,4),(20,4),(3,30),(1,1),(15,15)):
+            history.add(piedit.undo.Resize(document,width,height))
+            sizes.append((width,height))
+            documents.append(codes(document))
+        for i in xrange(len(sizes)-1,0,-1):
+            self.assertEqual((document.width,document.height),sizes[i])
+            self.assertEqual(codes(document),documents[i])
+            history.undo(document)
+        self.assertEqual(codes(document),documents[0])
+        for i in xrange(1,len(sizes)):
+            history.redo(document)
+            self.assertEqual(codes(document),documents[i])
+
+
+class EditHistoryTest(unittest.TestCase):
+    """The history should undo and redo in order within its budget."""
+    def patch(self,document,x,code):
+        """Returns a patch setting a column to a code."""
+        patch = piedit.undo.Patch()
+        for y in xrange(document.height):
+            patch.add_run(document,x,y,1,code)
+        return patch
+
+    def test_order(self):
+        """Edits are undone latest first, and a new edit drops the ones that
+        were undone."""
+        document = piedit.document.Document(4,4)
+        history = piedit.undo.EditHistory()
+        states = [codes(document)]
+        for x in xrange(4):
+            history.add(self.patch(document,x,x+2))
+            states.append(codes(document))
+        history.undo(document)
+        history.undo(document)
+        self.assertEqual(codes(document),states[2])
+        self.assertTrue(history.can_redo())
+        history.add(self.patch(document,3,7))
+        self.assertFalse(history.can_redo())
+        self.assertEqual(history.redo(document),None)
+        while history.can_undo():
+            history.undo(document)
+        self.assertEqual(codes(document),states[0])
+        self.assertEqual(history.undo(document),None)
+
+    def test_budget(self):
+        """The oldest edits are forgotten to keep within the budget."""
+        document = piedit.document.Document(4,4)
+        size = self.patch(piedit.document.Document(4,4),0,2).size()
+        history = piedit.undo.EditHistory(budget=size*3)
+        for x in xrange(4):
+            history.add(self.patch(document,x,x+2))
+        self.assertEqual(len(history.undo_edits),3)
+        self.assertEqual(history.size,size*3)
+        history.clear()
+        self.assertFalse(history.can_undo())
+        self.assertEqual(history.size,0)
+
+
+if __name__ == "__main__":
+    unittest.main()